@@ -0,0 +1,351 @@
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from io import BytesIO
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+from urllib.parse import unquote
+from wsgiref.util import FileWrapper
+
+from audio_relay import AudioFrames, PipeFrame, RELAY_BUFFER_SIZE
+from audio_relay import get_frame_bytes, get_frame_length
+from http_connections import ConnectionRequests, ConnectionStats
+from http_connections import is_response_reusable, wants_keep_alive
+from http_connections import KEEP_ALIVE_IDLE_TIMEOUT_IN_SECS
+from utils import log_msg, log_exception, LOGDEBUG
+
+ASYNC_SERVER_MAX_REQUEST_HEAD_SIZE = 65536
+# The app, and the audio frame generators, run on these threads. A thread is busy while
+# a route or a generator has work - including a wav stream generator waiting on its
+# spotty decode or pcm cache entry - but not while a response waits on a client. So at
+# most this many streams can wait on their decodes at once, and any more are delayed
+# (not refused) until a thread is free.
+ASYNC_SERVER_MAX_THREADS = 32
+ASYNC_SERVER_SOFTWARE = "SpottyAsyncWSGI/1.0"
+ASYNC_SERVER_SHUTDOWN_TIMEOUT_IN_SECS = 5
+
+# A selector event loop can't wait on pipes on Windows.
+HAVE_NON_BLOCKING_PIPES = os.name != "nt"
+
+WSGIResponse = Tuple[str, List[Tuple[str, str]], Iterable[bytes]]
+
+
+class AsyncWSGIServer:
+    """A WSGI server on an asyncio event loop. Each connection is a coroutine, so an
+    idle connection or a stream waiting on its client costs a few buffers instead of
+    a thread stack. The (blocking) app and audio frame generators run on a shared
+    thread pool, which a wav stream still needs while it waits on its decode: wav
+    frames come from a shared decode's window or the pcm cache, and reading them
+    blocks on the decode. Only pipe frames (flac encoder output) are read
+    non-blockingly on the loop. The socket is written with flow control, so a slow
+    client only stalls itself. Connections are kept alive between requests, and
+    pipelined requests are answered in order."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        app: Callable,
+        timeout: float,
+        connection_stats: ConnectionStats = None,
+    ):
+        self.__host = host
+        self.__port = port
+        self.__app = app
+        self.__timeout = timeout
+        self.__connection_stats = connection_stats or ConnectionStats()
+
+        self.__loop = asyncio.SelectorEventLoop()
+        self.__stopped = self.__loop.create_future()
+        self.__executor = ThreadPoolExecutor(
+            ASYNC_SERVER_MAX_THREADS, thread_name_prefix="async-wsgi"
+        )
+        self.__connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    def get_timeout(self) -> float:
+        return self.__timeout
+
+    def serve_forever(self) -> None:
+        try:
+            self.__loop.run_until_complete(self.__serve())
+        finally:
+            self.__loop.close()
+            self.__executor.shutdown(wait=False)
+
+    def shutdown(self) -> None:
+        self.__loop.call_soon_threadsafe(self.__stop)
+
+    def __stop(self) -> None:
+        if not self.__stopped.done():
+            self.__stopped.set_result(None)
+
+    async def __serve(self) -> None:
+        server = await asyncio.start_server(
+            self.__on_connection,
+            self.__host,
+            self.__port,
+            limit=ASYNC_SERVER_MAX_REQUEST_HEAD_SIZE,
+        )
+        await self.__stopped
+
+        server.close()
+        # Dropping the clients ends each response the normal way, which closes it.
+        # A response stuck generating a frame is cancelled after a while.
+        for writer in self.__connections.values():
+            writer.transport.abort()
+        if self.__connections:
+            _, stuck = await asyncio.wait(
+                list(self.__connections), timeout=ASYNC_SERVER_SHUTDOWN_TIMEOUT_IN_SECS
+            )
+            for connection in stuck:
+                connection.cancel()
+            await asyncio.gather(*stuck, return_exceptions=True)
+        await server.wait_closed()
+
+    async def __on_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        connection = asyncio.current_task()
+        self.__connections[connection] = writer
+        requests = self.__connection_stats.connection_opened()
+        # Flow control: 'drain' waits while more than this is queued for the client.
+        writer.transport.set_write_buffer_limits(high=RELAY_BUFFER_SIZE)
+        try:
+            while await self.__handle_request(reader, writer, requests):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError) as exc:
+            log_msg(f"Connection from {self.__get_peer(writer)} ended: {exc!r}.", LOGDEBUG)
+        except Exception as exc:
+            log_exception(exc, f"Error handling a request from {self.__get_peer(writer)}")
+        except asyncio.CancelledError:
+            # Only at shutdown. Not raised, as the stream protocol would log it.
+            log_msg(f"Connection from {self.__get_peer(writer)} cancelled.", LOGDEBUG)
+        finally:
+            self.__connections.pop(connection, None)
+            self.__connection_stats.connection_closed(requests)
+            writer.close()
+
+    async def __handle_request(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        requests: ConnectionRequests,
+    ) -> bool:
+        """handle the next request on a connection - returns whether there was one,
+        and the connection can take another"""
+        # Wait a bounded time for the next request on a kept alive connection.
+        timeout = KEEP_ALIVE_IDLE_TIMEOUT_IN_SECS if requests.count else self.__timeout
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        except asyncio.LimitOverrunError:
+            requests.add()
+            await self.__send_error(writer, "431 Request Header Fields Too Large")
+            return False
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            # The client closed, or left, its connection.
+            return False
+        requests.add()
+
+        environ = self.__get_environ(head, writer)
+        if not environ:
+            await self.__send_error(writer, "400 Bad Request")
+            return False
+        try:
+            content_length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            await self.__send_error(writer, "400 Bad Request")
+            return False
+        body = b""
+        if content_length > 0:
+            body = await asyncio.wait_for(reader.readexactly(content_length), self.__timeout)
+        environ["wsgi.input"] = BytesIO(body)
+
+        status, headers, result = await self.__run(self.__call_app, environ)
+        log_msg(
+            f"{self.__get_peer(writer)} \"{environ['REQUEST_METHOD']}"
+            f" {environ['PATH_INFO']}\" {status}.",
+            LOGDEBUG,
+        )
+        method = environ["REQUEST_METHOD"]
+        content_length = self.__get_header(headers, "Content-Length")
+        keep_alive = (
+            requests.can_add()
+            # A chunked request body isn't read, so the next request can't be found.
+            and "HTTP_TRANSFER_ENCODING" not in environ
+            and wants_keep_alive(environ["SERVER_PROTOCOL"], environ.get("HTTP_CONNECTION", ""))
+            and is_response_reusable(method, status, content_length)
+        )
+        try:
+            await self.__send(
+                writer,
+                self.__get_response_head(status, headers, keep_alive, environ["SERVER_PROTOCOL"]),
+            )
+            bytes_sent = 0
+            if isinstance(result, FileWrapper) and isinstance(result.filelike, AudioFrames):
+                bytes_sent = await self.__relay_audio_frames(result.filelike, writer)
+            elif isinstance(result, (list, tuple)):
+                for data in result:
+                    await self.__send(writer, data)
+                    bytes_sent += len(data)
+            else:
+                iterator = iter(result)
+                while True:
+                    data = await self.__run(next, iterator, None)
+                    if data is None:
+                        break
+                    await self.__send(writer, data)
+                    bytes_sent += len(data)
+        finally:
+            if hasattr(result, "close"):
+                await self.__run(result.close)
+
+        # A body cut short can only be told apart by closing the connection.
+        return keep_alive and (
+            method.upper() == "HEAD" or not content_length or bytes_sent == int(content_length)
+        )
+
+    def __get_environ(
+        self, head: bytes, writer: asyncio.StreamWriter
+    ) -> Union[Dict[str, Any], None]:
+        lines = head.decode("iso-8859-1").split("\r\n")
+        request_line = lines[0].split()
+        if len(request_line) != 3 or not request_line[2].startswith("HTTP/"):
+            return None
+        method, target, version = request_line
+        path, _, query = target.partition("?")
+
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote(path, "iso-8859-1"),
+            "QUERY_STRING": query,
+            "SERVER_NAME": self.__host,
+            "SERVER_PORT": str(self.__port),
+            "SERVER_PROTOCOL": version,
+            "SERVER_SOFTWARE": ASYNC_SERVER_SOFTWARE,
+            "REMOTE_ADDR": self.__get_peer(writer),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+            # Bottle hands file-like responses, like audio frames, to this.
+            "wsgi.file_wrapper": FileWrapper,
+        }
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(":")
+            if not sep:
+                return None
+            key = name.strip().upper().replace("-", "_")
+            if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                key = "HTTP_" + key
+            value = value.strip()
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+        return environ
+
+    def __call_app(self, environ: Dict[str, Any]) -> WSGIResponse:
+        response = []
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            # Nothing is sent until the app returns, so an error response can
+            # always replace the first one.
+            response[:] = [status, headers]
+            return self.__write_not_supported
+
+        result = self.__app(environ, start_response)
+        return response[0], response[1], result
+
+    @staticmethod
+    def __write_not_supported(data: bytes) -> None:
+        raise NotImplementedError("The app must return its response, not 'write' it.")
+
+    @staticmethod
+    def __get_header(headers: List[Tuple[str, str]], name: str) -> str:
+        for header_name, value in headers:
+            if header_name.lower() == name.lower():
+                return value.strip()
+        return ""
+
+    @staticmethod
+    def __get_response_head(
+        status: str, headers: List[Tuple[str, str]], keep_alive: bool, protocol: str
+    ) -> bytes:
+        lines = [f"HTTP/1.1 {status}"] + [f"{name}: {value}" for name, value in headers]
+        names = {name.lower() for name, _ in headers}
+        if "date" not in names:
+            lines.append(f"Date: {formatdate(usegmt=True)}")
+        if "server" not in names:
+            lines.append(f"Server: {ASYNC_SERVER_SOFTWARE}")
+        if not keep_alive:
+            lines.append("Connection: close")
+        elif protocol == "HTTP/1.0":
+            lines.append("Connection: keep-alive")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1")
+
+    async def __send_error(self, writer: asyncio.StreamWriter, status: str) -> None:
+        await self.__send(
+            writer,
+            self.__get_response_head(status, [("Content-Length", "0")], False, "HTTP/1.1"),
+        )
+
+    async def __relay_audio_frames(
+        self, audio_frames: AudioFrames, writer: asyncio.StreamWriter
+    ) -> int:
+        bytes_sent = 0
+        while True:
+            # Generating a frame can block, waiting on a decode.
+            frame = await self.__run(audio_frames.next_frame)
+            if frame is None:
+                break
+            if isinstance(frame, PipeFrame) and HAVE_NON_BLOCKING_PIPES:
+                await self.__relay_pipe_frame(frame, writer)
+            else:
+                # File frames are mapped pcm cache data.
+                await self.__send(writer, get_frame_bytes(frame))
+            bytes_sent += get_frame_length(frame)
+
+        return bytes_sent
+
+    async def __relay_pipe_frame(self, frame: PipeFrame, writer: asyncio.StreamWriter) -> None:
+        pipe_fd = frame.pipe.fileno()
+        # Only non-blocking for this frame - the generator reads the pipe blocking.
+        os.set_blocking(pipe_fd, False)
+        try:
+            while frame.transferred < frame.length:
+                num_bytes = min(frame.length - frame.transferred, RELAY_BUFFER_SIZE)
+                try:
+                    data = os.read(pipe_fd, num_bytes)
+                except BlockingIOError:
+                    await self.__wait_readable(pipe_fd)
+                    continue
+                if not data:
+                    break
+                frame.transferred += len(data)
+                await self.__send(writer, data)
+        finally:
+            os.set_blocking(pipe_fd, True)
+
+    async def __wait_readable(self, fd: int) -> None:
+        readable = self.__loop.create_future()
+        self.__loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await asyncio.wait_for(readable, self.__timeout)
+        finally:
+            self.__loop.remove_reader(fd)
+
+    async def __send(self, writer: asyncio.StreamWriter, data: bytes) -> None:
+        writer.write(data)
+        await asyncio.wait_for(writer.drain(), self.__timeout)
+
+    async def __run(self, func: Callable, *args) -> Any:
+        return await self.__loop.run_in_executor(self.__executor, func, *args)
+
+    @staticmethod
+    def __get_peer(writer: asyncio.StreamWriter) -> str:
+        peer = writer.get_extra_info("peername")
+        return peer[0] if peer else ""
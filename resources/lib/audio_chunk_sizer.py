@@ -0,0 +1,50 @@
+MIN_AUDIO_CHUNK_SIZE = 16384
+MAX_AUDIO_CHUNK_SIZE = 524288
+# Keep chunks aligned to whole pages (which are also whole sample frames).
+AUDIO_CHUNK_ALIGN = 4096
+
+# Aim for each chunk to take about this long to go from spotty (or the pcm cache)
+# to the socket. Long enough that per-chunk overhead doesn't matter, short enough
+# that a stalled stream is noticed (and a terminate is acted on) quickly.
+TARGET_CHUNK_SECS = 0.25
+RATE_SMOOTHING_FACTOR = 0.5
+
+
+class AudioChunkSizer:
+    """Chunk size policy for one stream. Starts small so Kodi gets audio as soon as
+    spotty has any, then grows (at most doubling per chunk) toward the size that
+    takes 'TARGET_CHUNK_SECS' at the measured transfer rate. The rate is whichever
+    is slower of the pipe filling and the socket draining, so the size shrinks again
+    if either falls behind."""
+
+    def __init__(
+        self,
+        min_size: int = MIN_AUDIO_CHUNK_SIZE,
+        max_size: int = MAX_AUDIO_CHUNK_SIZE,
+        target_secs: float = TARGET_CHUNK_SECS,
+    ):
+        self.__min_size = min_size
+        self.__max_size = max_size
+        self.__target_secs = target_secs
+
+        self.__size = min_size
+        self.__rate = 0.0
+
+    def get_size(self) -> int:
+        return self.__size
+
+    def get_rate(self) -> float:
+        return self.__rate
+
+    def update(self, num_bytes: int, elapsed_secs: float) -> None:
+        if num_bytes <= 0:
+            return
+
+        rate = num_bytes / max(elapsed_secs, 0.001)
+        if self.__rate:
+            rate = RATE_SMOOTHING_FACTOR * rate + (1 - RATE_SMOOTHING_FACTOR) * self.__rate
+        self.__rate = rate
+
+        target_size = min(int(rate * self.__target_secs), 2 * self.__size)
+        target_size -= target_size % AUDIO_CHUNK_ALIGN
+        self.__size = max(self.__min_size, min(self.__max_size, target_size))
@@ -0,0 +1,161 @@
+import os
+import select
+from typing import BinaryIO, Callable, Iterator, Union
+
+from pcm_cache import PcmCacheReader
+
+RELAY_BUFFER_SIZE = 262144
+
+HAVE_SPLICE = hasattr(os, "splice")
+HAVE_SENDFILE = hasattr(os, "sendfile")
+
+
+class PipeFrame:
+    """up to 'length' bytes to be relayed straight from a (flac encoder stdout) pipe -
+    live spotty decodes are read through their shared decode's window instead, so
+    other streams can read them too"""
+
+    def __init__(self, pipe: BinaryIO, length: int):
+        self.pipe = pipe
+        self.length = length
+        self.transferred = 0
+
+
+class FileFrame:
+    """'length' bytes at 'offset' in a pcm cache file"""
+
+    def __init__(self, reader: PcmCacheReader, offset: int, length: int, available: int):
+        self.reader = reader
+        self.offset = offset
+        self.length = length
+        self.available = available
+        self.transferred = 0
+
+
+AudioFrame = Union[bytes, PipeFrame, FileFrame]
+
+
+def get_frame_length(frame: AudioFrame) -> int:
+    if isinstance(frame, (PipeFrame, FileFrame)):
+        return frame.transferred
+    return len(frame)
+
+
+def get_frame_bytes(frame: AudioFrame) -> bytes:
+    """read a pipe or file frame (which is then transferred) - bytes are as is"""
+    if isinstance(frame, PipeFrame):
+        data = frame.pipe.read(frame.length)
+    elif isinstance(frame, FileFrame):
+        data = frame.reader.read(frame.offset, frame.length, frame.available)
+    else:
+        return frame
+    frame.transferred = len(data)
+    return data
+
+
+class AudioFrames:
+    """File-like wrapper of an audio frame generator. Bottle passes file-like
+    responses to the server's 'wsgi.file_wrapper', so a server that knows about
+    'AudioFrames' can relay the pipe and file frames with kernel transfers
+    (see 'relay_to'). Any other server just reads the frames as bytes."""
+
+    def __init__(self, frames: Iterator[AudioFrame], on_close: Callable[[], None] = None):
+        self.__frames = frames
+        self.__on_close = on_close
+        self.__buffer = bytearray()
+        # What's left of the last frame read, past the size asked for.
+        self.__unread = b""
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = [self.__unread]
+        length = len(self.__unread)
+        while size < 0 or length < size:
+            frame = next(self.__frames, None)
+            if frame is None:
+                break
+            data = get_frame_bytes(frame)
+            chunks.append(data)
+            length += len(data)
+
+        data = b"".join(chunks)
+        if 0 <= size < length:
+            data, self.__unread = data[:size], data[size:]
+        else:
+            self.__unread = b""
+        return data
+
+    def next_frame(self) -> Union[AudioFrame, None]:
+        """the next frame to relay, or None after the last one - for servers that do
+        their own transfers"""
+        return next(self.__frames, None)
+
+    def close(self) -> None:
+        # The server always closes the response, even if it never read from it.
+        try:
+            self.__frames.close()
+        finally:
+            if self.__on_close:
+                self.__on_close()
+
+    def relay_to(self, out: BinaryIO) -> int:
+        """send all frames to a socket file, with 'os.splice' (pipe to socket) and
+        'os.sendfile' (file to socket) where the platform has them, otherwise through
+        a reusable buffer"""
+        out_fd = out.fileno()
+        if not self.__buffer:
+            self.__buffer = bytearray(RELAY_BUFFER_SIZE)
+
+        bytes_sent = 0
+        for frame in self.__frames:
+            if isinstance(frame, PipeFrame):
+                self.__relay_pipe_frame(frame, out, out_fd)
+            elif isinstance(frame, FileFrame):
+                self.__relay_file_frame(frame, out, out_fd)
+            else:
+                out.write(frame)
+            bytes_sent += get_frame_length(frame)
+
+        return bytes_sent
+
+    def __relay_pipe_frame(self, frame: PipeFrame, out: BinaryIO, out_fd: int) -> None:
+        pipe_fd = frame.pipe.fileno()
+        view = memoryview(self.__buffer)
+        while frame.transferred < frame.length:
+            num_bytes = min(frame.length - frame.transferred, len(self.__buffer))
+            if HAVE_SPLICE:
+                num_sent = self.__retry_when_blocked(out_fd, os.splice, pipe_fd, out_fd, num_bytes)
+            else:
+                num_sent = frame.pipe.readinto(view[:num_bytes])
+                if num_sent:
+                    out.write(view[:num_sent])
+            if not num_sent:
+                break
+            frame.transferred += num_sent
+
+    def __relay_file_frame(self, frame: FileFrame, out: BinaryIO, out_fd: int) -> None:
+        if not HAVE_SENDFILE:
+            out.write(get_frame_bytes(frame))
+            return
+
+        file_fd = frame.reader.fileno()
+        while frame.transferred < frame.length:
+            num_sent = self.__retry_when_blocked(
+                out_fd,
+                os.sendfile,
+                out_fd,
+                file_fd,
+                frame.offset + frame.transferred,
+                frame.length - frame.transferred,
+            )
+            if not num_sent:
+                break
+            frame.transferred += num_sent
+
+    @staticmethod
+    def __retry_when_blocked(out_fd: int, transfer, *args) -> int:
+        while True:
+            try:
+                return transfer(*args)
+            except BlockingIOError:
+                # A socket with a timeout is non-blocking underneath.
+                select.select([], [out_fd], [])
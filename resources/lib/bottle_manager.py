@@ -1,15 +1,26 @@
 import socket
 import socketserver
 import threading
-from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+from typing import Dict, Union
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler, WSGIServer
 from wsgiref.simple_server import make_server
 
 import bottle
+from async_wsgi_server import AsyncWSGIServer
+from audio_relay import AudioFrames
 from bottle import Bottle
+from http_connections import ConnectionRequests, ConnectionStats
+from http_connections import is_response_reusable, wants_keep_alive
+from http_connections import KEEP_ALIVE_IDLE_TIMEOUT_IN_SECS
 from utils import log_msg, log_exception, LOGDEBUG
 
 STREAMING_TIMEOUT_IN_SECS = 600
 
+SERVER_BACKEND_WSGIREF = "wsgiref"
+SERVER_BACKEND_ASYNCIO = "asyncio"
+
+CONNECTION_STATS_ROUTE = "/stats/connections"
+
 
 def __bottle_stderr(*args):
     log_msg(f"{args}")
@@ -22,14 +33,64 @@ class ThreadedWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
     pass
 
 
+class RelayServerHandler(ServerHandler):
+    # Persistent connections need HTTP/1.1 responses.
+    http_version = "1.1"
+
+    def __init__(self, *args, keep_alive: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__keep_alive = keep_alive
+        self.__is_reusable = False
+
+    def is_reusable(self) -> bool:
+        """whether the connection can take another request after this response"""
+        return self.__is_reusable
+
+    def cleanup_headers(self) -> None:
+        super().cleanup_headers()
+        self.__keep_alive = self.__keep_alive and is_response_reusable(
+            self.environ["REQUEST_METHOD"], self.status, self.headers.get("Content-Length", "")
+        )
+        if not self.__keep_alive:
+            self.headers["Connection"] = "close"
+        elif self.environ["SERVER_PROTOCOL"] == "HTTP/1.0":
+            self.headers["Connection"] = "keep-alive"
+
+    # Only called for a response that was sent without errors.
+    def close(self) -> None:
+        content_length = self.headers.get("Content-Length", "") if self.headers else ""
+        self.__is_reusable = self.__keep_alive and (
+            self.environ["REQUEST_METHOD"].upper() == "HEAD"
+            or not content_length
+            or self.bytes_sent == int(content_length)
+        )
+        super().close()
+
+    # Bottle hands file-like responses to 'wsgi.file_wrapper', and wsgiref then asks
+    # us to 'sendfile' them. For audio frames, relay them straight to the socket.
+    def sendfile(self) -> bool:
+        audio_frames = getattr(self.result, "filelike", None)
+        if not isinstance(audio_frames, AudioFrames):
+            return False
+
+        if not self.headers_sent:
+            self.send_headers()
+        self.bytes_sent = audio_frames.relay_to(self.stdout)
+
+        return True
+
+
 # Need this copy of 'bottle.WSGIRefServer' to add a 'shutdown' method, so we can do a
 # clean shutdown of the bottle app.
 class MyWSGIRefServer(bottle.WSGIRefServer):
-    def __init__(self, host: str = "", port: int = 0):
+    def __init__(self, host: str = "", port: int = 0, connection_stats: ConnectionStats = None):
         super().__init__(host, port)
         self.__server = None
+        self.__connection_stats = connection_stats or ConnectionStats()
 
     def run(self, app) -> None:
+        connection_stats = self.__connection_stats
+
         class FixedHandler(WSGIRequestHandler):
             # Prevent reverse DNS lookups.
             def address_string(self) -> str:
@@ -39,6 +100,62 @@ class MyWSGIRefServer(bottle.WSGIRefServer):
                 if not self.quiet:
                     return WSGIRequestHandler.log_request(*args, **kw)
 
+            def handle(self) -> None:
+                requests = connection_stats.connection_opened()
+                try:
+                    while self.handle_request(requests):
+                        pass
+                finally:
+                    connection_stats.connection_closed(requests)
+
+            # Copy of 'WSGIRequestHandler.handle' using the relay server handler, for
+            # each request on a kept alive connection. Returns whether the connection
+            # can take another request.
+            def handle_request(self, requests: ConnectionRequests) -> bool:
+                if requests.count:
+                    # Wait a bounded time for the next request on a kept alive connection.
+                    self.connection.settimeout(KEEP_ALIVE_IDLE_TIMEOUT_IN_SECS)
+                try:
+                    self.raw_requestline = self.rfile.readline(65537)
+                except (socket.timeout, ConnectionError):
+                    return False
+                finally:
+                    self.connection.settimeout(None)
+                if not self.raw_requestline:
+                    return False
+                requests.add()
+                if len(self.raw_requestline) > 65536:
+                    self.requestline = ""
+                    self.request_version = ""
+                    self.command = ""
+                    self.send_error(414)
+                    return False
+
+                if not self.parse_request():
+                    return False
+
+                # A request body the app doesn't read would be taken for the next request.
+                has_body = self.headers.get("Content-Length", "0") not in ("", "0") or (
+                    "Transfer-Encoding" in self.headers
+                )
+                keep_alive = (
+                    requests.can_add()
+                    and not has_body
+                    and wants_keep_alive(self.request_version, self.headers.get("Connection", ""))
+                )
+                handler = RelayServerHandler(
+                    self.rfile,
+                    self.wfile,
+                    self.get_stderr(),
+                    self.get_environ(),
+                    multithread=True,
+                    keep_alive=keep_alive,
+                )
+                handler.request_handler = self
+                handler.run(self.server.get_app())
+
+                return handler.is_reusable()
+
         handler_cls = self.options.get("handler_class", FixedHandler)
         server_cls = self.options.get("server_class", ThreadedWSGIServer)
 
@@ -68,11 +185,39 @@ class MyWSGIRefServer(bottle.WSGIRefServer):
         self.__server.shutdown()
 
 
-__server: MyWSGIRefServer = MyWSGIRefServer()
+class AsyncioServer(bottle.ServerAdapter):
+    def __init__(self, host: str = "", port: int = 0, connection_stats: ConnectionStats = None):
+        super().__init__(host, port)
+        self.__server: Union[AsyncWSGIServer, None] = None
+        self.__connection_stats = connection_stats or ConnectionStats()
+
+    def run(self, app) -> None:
+        self.__server = AsyncWSGIServer(
+            self.host, self.port, app, STREAMING_TIMEOUT_IN_SECS, self.__connection_stats
+        )
+
+        log_msg(f"Starting asyncio web server, timeout = {self.__server.get_timeout()}.")
+
+        self.__server.serve_forever()
+
+    def shutdown(self) -> None:
+        log_msg("Shutdown asyncio server requested...")
+        self.__server.shutdown()
+
+
+__connection_stats: ConnectionStats = ConnectionStats()
+__server: Union[MyWSGIRefServer, AsyncioServer] = MyWSGIRefServer()
 __bottle_manager: Bottle = Bottle()
 __manager_thread: threading.Thread = threading.Thread()
 
 
+def get_connection_stats() -> Dict[str, float]:
+    return __connection_stats.get_stats()
+
+
+__bottle_manager.route(CONNECTION_STATS_ROUTE)(get_connection_stats)
+
+
 def route_all(app: object) -> None:
     for kw in dir(app):
         attr = getattr(app, kw)
@@ -84,10 +229,13 @@ def __begin_app() -> None:
     bottle.run(app=__bottle_manager, server=__server)
 
 
-def start_thread(web_port: int) -> None:
+def start_thread(web_port: int, server_backend: str = SERVER_BACKEND_WSGIREF) -> None:
     global __manager_thread
     global __server
-    __server = MyWSGIRefServer(host="localhost", port=web_port)
+    if server_backend == SERVER_BACKEND_ASYNCIO:
+        __server = AsyncioServer("localhost", web_port, __connection_stats)
+    else:
+        __server = MyWSGIRefServer("localhost", web_port, __connection_stats)
     __manager_thread = threading.Thread(target=__begin_app)
     __manager_thread.start()
 
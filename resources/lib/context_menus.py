@@ -0,0 +1,216 @@
+from typing import Any, Dict, List, Tuple
+
+import xbmc
+import xbmcaddon
+
+from string_ids import *
+from utils import ADDON_ID
+
+PLUGIN_URL = f"plugin://{ADDON_ID}/"
+
+# (label string id, whether it is a Kodi string, builtin with the '{fields}' of the item)
+MenuItemTemplate = Tuple[int, bool, str]
+MenuItem = Tuple[str, str]
+
+REFRESH_LISTING: MenuItemTemplate = (
+    REFRESH_LISTING_STR_ID,
+    False,
+    f"RunPlugin({PLUGIN_URL}?action=refresh_listing)",
+)
+
+SAVE_TRACK: MenuItemTemplate = (
+    SAVE_TRACKS_TO_MY_MUSIC_STR_ID,
+    False,
+    f"RunPlugin({PLUGIN_URL}?action=save_track&trackid={{trackid}})",
+)
+REMOVE_TRACK: MenuItemTemplate = (
+    REMOVE_TRACKS_FROM_MY_MUSIC_STR_ID,
+    False,
+    f"RunPlugin({PLUGIN_URL}?action=remove_track&trackid={{trackid}})",
+)
+REMOVE_TRACK_FROM_PLAYLIST: MenuItemTemplate = (
+    REMOVE_FROM_PLAYLIST_STR_ID,
+    False,
+    f"RunPlugin({PLUGIN_URL}?action=remove_track_from_playlist&trackid={{trackuri}}"
+    f"&playlistid={{playlistid}})",
+)
+ADD_TRACK_TO_PLAYLIST: MenuItemTemplate = (
+    KODI_ADD_TO_PLAYLIST_STR_ID,
+    True,
+    f"RunPlugin({PLUGIN_URL}?action=add_track_to_playlist&trackid={{trackuri}})",
+)
+
+SAVE_ALBUM: MenuItemTemplate = (
+    SAVE_TRACKS_TO_MY_MUSIC_STR_ID,
+    False,
+    f"RunPlugin({PLUGIN_URL}?action=save_album&albumid={{albumid}})",
+)
+REMOVE_ALBUM: MenuItemTemplate = (
+    REMOVE_TRACKS_FROM_MY_MUSIC_STR_ID,
+    False,
+    f"RunPlugin({PLUGIN_URL}?action=remove_album&albumid={{albumid}})",
+)
+BROWSE_ALBUM: MenuItemTemplate = (
+    KODI_BROWSE_STR_ID,
+    True,
+    f"Container.Update({PLUGIN_URL}?action=browse_album&albumid={{albumid}})",
+)
+
+ARTIST_TOP_TRACKS: MenuItemTemplate = (
+    ARTIST_TOP_TRACKS_STR_ID,
+    False,
+    f"Container.Update({PLUGIN_URL}?action=artist_top_tracks&artistid={{artistid}})",
+)
+ARTIST_ALBUMS: MenuItemTemplate = (
+    ALL_ALBUMS_FOR_ARTIST_STR_ID,
+    False,
+    f"Container.Update({PLUGIN_URL}?action=browse_artist_just_albums&artistid={{artistid}})",
+)
+ARTIST_SINGLES: MenuItemTemplate = (
+    ALL_SINGLES_FOR_ARTIST_STR_ID,
+    False,
+    f"Container.Update({PLUGIN_URL}?action=browse_artist_just_singles&artistid={{artistid}})",
+)
+ARTIST_APPEARS_ON: MenuItemTemplate = (
+    ALL_APPEARS_ON_FOR_ARTIST_STR_ID,
+    False,
+    f"Container.Update({PLUGIN_URL}"
+    f"?action=browse_artist_just_appears_on&artistid={{artistid}})",
+)
+ARTIST_EVERYTHING: MenuItemTemplate = (
+    EVERYTHING_FOR_ARTIST_STR_ID,
+    False,
+    f"Container.Update({PLUGIN_URL}?action=browse_artist_everything&artistid={{artistid}})",
+)
+RELATED_ARTISTS: MenuItemTemplate = (
+    RELATED_ARTISTS_STR_ID,
+    False,
+    f"Container.Update({PLUGIN_URL}?action=related_artists&artistid={{artistid}})",
+)
+FOLLOW_ARTIST: MenuItemTemplate = (
+    FOLLOW_ARTIST_STR_ID,
+    False,
+    f"RunPlugin({PLUGIN_URL}?action=follow_artist&artistid={{artistid}})",
+)
+UNFOLLOW_ARTIST: MenuItemTemplate = (
+    UNFOLLOW_ARTIST_STR_ID,
+    False,
+    f"RunPlugin({PLUGIN_URL}?action=unfollow_artist&artistid={{artistid}})",
+)
+
+PLAY_PLAYLIST: MenuItemTemplate = (
+    KODI_PLAY_STR_ID,
+    True,
+    f"RunPlugin({PLUGIN_URL}?action=play_playlist&playlistid={{playlistid}}"
+    f"&ownerid={{ownerid}})",
+)
+FOLLOW_PLAYLIST: MenuItemTemplate = (
+    FOLLOW_PLAYLIST_STR_ID,
+    False,
+    f"RunPlugin({PLUGIN_URL}?action=follow_playlist&playlistid={{playlistid}}"
+    f"&ownerid={{ownerid}})",
+)
+UNFOLLOW_PLAYLIST: MenuItemTemplate = (
+    UNFOLLOW_PLAYLIST_STR_ID,
+    False,
+    f"RunPlugin({PLUGIN_URL}?action=unfollow_playlist&playlistid={{playlistid}}"
+    f"&ownerid={{ownerid}})",
+)
+
+
+class ContextMenuBuilder:
+    """Builds the context menus of the listing items as they are rendered, from the
+    templates above and the flags the listings give each item (such as 'saved' or
+    'followed'). Each label is only looked up once per plugin invocation."""
+
+    def __init__(self, addon: xbmcaddon.Addon):
+        self.__addon = addon
+        self.__labels: Dict[Tuple[int, bool], str] = {}
+
+    def get_track_menu(
+        self, track: Dict[str, Any], playlist: Dict[str, Any] = None
+    ) -> List[MenuItem]:
+        # Use original track id for actions when the track was relinked.
+        real_track = track.get("linked_from") or track
+        fields = {"trackid": real_track["id"], "trackuri": real_track["uri"]}
+
+        menu = self.__build(
+            [REFRESH_LISTING, REMOVE_TRACK if track["saved"] else SAVE_TRACK], fields
+        )
+
+        if playlist and playlist["owned"]:
+            label, builtin = self.__build_item(
+                REMOVE_TRACK_FROM_PLAYLIST, dict(fields, playlistid=playlist["id"])
+            )
+            menu.append((f"{label} {playlist['name']}", builtin))
+
+        menu += self.__build([ADD_TRACK_TO_PLAYLIST], fields)
+
+        if "artistid" in track:
+            menu += self.__build(
+                [
+                    ARTIST_TOP_TRACKS,
+                    ARTIST_ALBUMS,
+                    ARTIST_SINGLES,
+                    ARTIST_APPEARS_ON,
+                    ARTIST_EVERYTHING,
+                    UNFOLLOW_ARTIST if track["artistfollowed"] else FOLLOW_ARTIST,
+                    RELATED_ARTISTS,
+                ],
+                {"artistid": track["artistid"]},
+            )
+
+        return menu
+
+    def get_album_menu(self, album: Dict[str, Any]) -> List[MenuItem]:
+        return self.__build(
+            [
+                REFRESH_LISTING,
+                BROWSE_ALBUM,
+                ARTIST_TOP_TRACKS,
+                ARTIST_EVERYTHING,
+                RELATED_ARTISTS,
+                REMOVE_ALBUM if album["saved"] else SAVE_ALBUM,
+            ],
+            {"albumid": album["id"], "artistid": album["artistid"]},
+        )
+
+    def get_artist_menu(self, artist: Dict[str, Any]) -> List[MenuItem]:
+        return self.__build(
+            [
+                ARTIST_EVERYTHING,
+                ARTIST_ALBUMS,
+                ARTIST_SINGLES,
+                ARTIST_APPEARS_ON,
+                ARTIST_TOP_TRACKS,
+                UNFOLLOW_ARTIST if artist["followed"] else FOLLOW_ARTIST,
+                RELATED_ARTISTS,
+            ],
+            {"artistid": artist["id"]},
+        )
+
+    def get_playlist_menu(self, playlist: Dict[str, Any]) -> List[MenuItem]:
+        templates = [PLAY_PLAYLIST, REFRESH_LISTING]
+        if not playlist["owned"]:
+            templates.append(UNFOLLOW_PLAYLIST if playlist["followed"] else FOLLOW_PLAYLIST)
+
+        return self.__build(
+            templates, {"playlistid": playlist["id"], "ownerid": playlist["owner"]["id"]}
+        )
+
+    def __build(self, templates: List[MenuItemTemplate], fields: Dict[str, str]) -> List[MenuItem]:
+        return [self.__build_item(template, fields) for template in templates]
+
+    def __build_item(self, template: MenuItemTemplate, fields: Dict[str, str]) -> MenuItem:
+        str_id, is_kodi_str, builtin = template
+        return self.__get_label(str_id, is_kodi_str), builtin.format(**fields)
+
+    def __get_label(self, str_id: int, is_kodi_str: bool) -> str:
+        label = self.__labels.get((str_id, is_kodi_str))
+        if label is None:
+            if is_kodi_str:
+                label = xbmc.getLocalizedString(str_id)
+            else:
+                label = self.__addon.getLocalizedString(str_id)
+            self.__labels[(str_id, is_kodi_str)] = label
+        return label
@@ -0,0 +1,52 @@
+import math
+from typing import Union
+
+try:
+    import numpy
+except ImportError:
+    # Kodi doesn't ship NumPy on every platform, so crossfading is optional.
+    numpy = None
+
+MAX_CROSSFADE_SECS = 10
+
+
+def is_crossfade_available() -> bool:
+    return numpy is not None
+
+
+class Crossfader:
+    """Mixes the tail of a track with the head of the next track over 'fade_length'
+    bytes of 16 bit pcm. The gains follow equal power curves, so the loudness stays
+    steady through the fade, and are computed for whole chunks of sample frames at
+    once, so a fade costs about the same as copying the audio."""
+
+    def __init__(self, fade_length: int, num_channels: int):
+        self.__num_channels = num_channels
+        self.__block_align = 2 * num_channels
+        self.__num_fade_frames = fade_length // self.__block_align
+
+    def mix(self, tail: bytes, head: bytes, position: int) -> bytes:
+        """'tail' and 'head' are the audio at byte 'position' into the fade - a head
+        shorter than the tail is padded with silence"""
+        num_frames = len(tail) // self.__block_align
+        if num_frames == 0:
+            return tail
+
+        tail_samples = self.__get_samples(tail, num_frames)
+        head_samples = numpy.zeros_like(tail_samples)
+        head_frames = min(num_frames, len(head) // self.__block_align)
+        head_samples[:head_frames] = self.__get_samples(head, head_frames)
+
+        first_frame = position // self.__block_align
+        fade_in = numpy.arange(first_frame, first_frame + num_frames, dtype=numpy.float32)
+        fade_in = numpy.clip(fade_in / self.__num_fade_frames, 0.0, 1.0) * (math.pi / 2)
+        mixed = (
+            tail_samples * numpy.cos(fade_in)[:, numpy.newaxis]
+            + head_samples * numpy.sin(fade_in)[:, numpy.newaxis]
+        )
+
+        return numpy.clip(numpy.rint(mixed), -32768, 32767).astype("<i2").tobytes()
+
+    def __get_samples(self, data: Union[bytes, bytearray], num_frames: int):
+        samples = numpy.frombuffer(data, dtype="<i2", count=num_frames * self.__num_channels)
+        return samples.reshape(num_frames, self.__num_channels).astype(numpy.float32)
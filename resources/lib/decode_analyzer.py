@@ -0,0 +1,13 @@
+from typing import Union
+
+
+class DecodeAnalyzer:
+    """Analyzes a track's pcm as it's decoded from the start of the track. 'feed' is
+    called on the decode thread with each chunk, in order, and 'finish' only once the
+    whole track was decoded."""
+
+    def feed(self, data: Union[bytes, memoryview]) -> None:
+        raise NotImplementedError
+
+    def finish(self) -> None:
+        raise NotImplementedError
@@ -0,0 +1,116 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Union
+
+from utils import ADDON_DATA_PATH, get_chunks, log_exception
+
+ENTITY_STORE_DB_FILE = os.path.join(ADDON_DATA_PATH, "spotify-entities.db")
+
+# Stored entities older than this are fetched again, which refreshes them in every listing.
+ENTITY_MAX_AGE_IN_SECS = 3 * 24 * 60 * 60
+
+# Keeps each 'IN (...)' lookup well under sqlite's host parameter limit.
+MAX_IDS_PER_QUERY = 500
+
+Entity = Dict[str, Any]
+
+
+class EntityStore:
+    """The Spotify tracks, albums and artists the listings were built from, each held
+    once and keyed by (kind, Spotify id), in a small sqlite database. Listings only
+    cache the ids of their entities (see 'SpotifyResolver')."""
+
+    def __init__(self, path: str = ENTITY_STORE_DB_FILE):
+        self.__path = path
+        self.__connection: Union[sqlite3.Connection, None] = None
+        self.__lock = threading.Lock()
+
+        self.__open()
+
+    def get_entities(self, kind: str, entity_ids: List[str]) -> Dict[str, Entity]:
+        """the stored, not too old entities of the given ids, by id"""
+        min_updated_at = time.time() - ENTITY_MAX_AGE_IN_SECS
+        entities = {}
+        with self.__lock:
+            if not self.__connection:
+                return entities
+            try:
+                for chunk in get_chunks(entity_ids, MAX_IDS_PER_QUERY):
+                    rows = self.__connection.execute(
+                        "SELECT id, entity FROM entities WHERE kind = ? AND updated_at > ?"
+                        f" AND id IN ({','.join('?' * len(chunk))})",
+                        (kind, min_updated_at, *chunk),
+                    )
+                    for entity_id, entity in rows:
+                        entities[entity_id] = json.loads(entity)
+            except (sqlite3.Error, ValueError) as exc:
+                log_exception(exc, f"Could not read the stored {kind}s")
+
+        return entities
+
+    def set_entities(self, kind: str, entities: Dict[str, Entity]) -> None:
+        """store the given entities, by id, replacing any stored before"""
+        if not entities:
+            return
+        updated_at = time.time()
+        rows = [
+            (kind, entity_id, updated_at, json.dumps(entity, separators=(",", ":")))
+            for entity_id, entity in entities.items()
+        ]
+        with self.__lock:
+            if not self.__connection:
+                return
+            try:
+                with self.__connection:
+                    self.__connection.executemany(
+                        "INSERT OR REPLACE INTO entities (kind, id, updated_at, entity)"
+                        " VALUES (?, ?, ?, ?)",
+                        rows,
+                    )
+            except sqlite3.Error as exc:
+                log_exception(exc, f"Could not store {len(rows)} {kind}s")
+
+    def clear(self) -> None:
+        with self.__lock:
+            if not self.__connection:
+                return
+            try:
+                with self.__connection:
+                    self.__connection.execute("DELETE FROM entities")
+                self.__connection.execute("VACUUM")
+            except sqlite3.Error as exc:
+                log_exception(exc, "Could not clear the stored entities")
+
+    def get_count(self) -> int:
+        with self.__lock:
+            if not self.__connection:
+                return 0
+            return self.__connection.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+
+    def close(self) -> None:
+        with self.__lock:
+            if self.__connection:
+                self.__connection.close()
+                self.__connection = None
+
+    def __open(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.__path), exist_ok=True)
+            # Entities are read and stored on the listing threads.
+            self.__connection = sqlite3.connect(self.__path, check_same_thread=False)
+            with self.__connection:
+                self.__connection.execute(
+                    "CREATE TABLE IF NOT EXISTS entities (kind TEXT NOT NULL, id TEXT NOT NULL,"
+                    " updated_at REAL NOT NULL, entity TEXT NOT NULL, PRIMARY KEY (kind, id))"
+                )
+                # Expired entities are only ever replaced, so drop the ones nothing uses now.
+                self.__connection.execute(
+                    "DELETE FROM entities WHERE updated_at <= ?",
+                    (time.time() - ENTITY_MAX_AGE_IN_SECS,),
+                )
+        except sqlite3.Error as exc:
+            log_exception(exc, f"Could not open the entity store database '{self.__path}'")
+            self.__connection = None
@@ -0,0 +1,104 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Iterator, List
+
+from xbmc import LOGDEBUG, LOGWARNING
+
+from audio_chunk_sizer import AudioChunkSizer
+from audio_relay import AudioFrames, PipeFrame
+from utils import log_msg, log_exception
+
+FLAC_CONTENT_TYPE = "audio/flac"
+
+# Encoders that read a wav stream on stdin and write flac to stdout, in order of
+# preference. Neither can rewrite the STREAMINFO header on a pipe, so the total
+# number of samples is left as 'unknown', which is valid flac.
+FLAC_ENCODER_ARGS = {
+    "flac": ["--silent", "--stdout", "--ignore-chunk-sizes", "-"],
+    "ffmpeg": [
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "wav",
+        "-i",
+        "pipe:0",
+        "-f",
+        "flac",
+        "pipe:1",
+    ],
+}
+
+
+def find_flac_encoder() -> List[str]:
+    for encoder_name, encoder_args in FLAC_ENCODER_ARGS.items():
+        encoder_path = shutil.which(encoder_name)
+        if encoder_path:
+            return [encoder_path] + encoder_args
+    return []
+
+
+class FlacEncoder:
+    """Streaming wav to flac pipeline stage. The wav frames are relayed into the
+    encoder's stdin on a feeder thread, while the flac comes back as pipe frames
+    from the encoder's stdout."""
+
+    def __init__(self, encoder_args: List[str]):
+        self.__encoder_args = encoder_args
+
+    def encode(self, wav_frames: AudioFrames) -> Iterator[PipeFrame]:
+        log_msg(f"Flac encoder args: {' '.join(self.__encoder_args)}", LOGDEBUG)
+
+        startupinfo = None
+        if os.name == "nt":
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        encoder_process = subprocess.Popen(
+            self.__encoder_args,
+            startupinfo=startupinfo,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+
+        feeder = threading.Thread(
+            target=self.__feed_encoder, args=(wav_frames, encoder_process), daemon=True
+        )
+        feeder.start()
+
+        try:
+            chunk_sizer = AudioChunkSizer()
+            while True:
+                frame = PipeFrame(encoder_process.stdout, chunk_sizer.get_size())
+                frame_start = time.monotonic()
+                yield frame
+                if not frame.transferred:
+                    break
+                chunk_sizer.update(frame.transferred, time.monotonic() - frame_start)
+
+            return_code = encoder_process.wait()
+            if return_code:
+                log_msg(f"Flac encoder return code: {return_code}", LOGWARNING)
+        finally:
+            # If the client went away, stop the encoder, which also stops the feeder.
+            if encoder_process.poll() is None:
+                encoder_process.kill()
+            encoder_process.wait()
+            encoder_process.stdout.close()
+            feeder.join()
+
+    @staticmethod
+    def __feed_encoder(wav_frames: AudioFrames, encoder_process: subprocess.Popen) -> None:
+        try:
+            wav_frames.relay_to(encoder_process.stdin)
+        except BrokenPipeError:
+            log_msg("Flac encoder stopped reading.", LOGDEBUG)
+        except Exception as exc:
+            log_exception(exc, "Error feeding the flac encoder")
+        finally:
+            wav_frames.close()
+            encoder_process.stdin.close()
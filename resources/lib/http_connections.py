@@ -0,0 +1,78 @@
+import threading
+from typing import Dict
+
+# How long a kept alive connection may wait for its next request.
+KEEP_ALIVE_IDLE_TIMEOUT_IN_SECS = 15
+MAX_KEEP_ALIVE_REQUESTS = 100
+
+
+def wants_keep_alive(protocol: str, connection_header: str) -> bool:
+    """whether a client asked to keep its connection after the response - the
+    default for HTTP/1.1, an explicit 'keep-alive' for HTTP/1.0"""
+    tokens = {token.strip().lower() for token in connection_header.split(",")}
+    if protocol == "HTTP/1.1":
+        return "close" not in tokens
+    return protocol == "HTTP/1.0" and "keep-alive" in tokens
+
+
+def is_response_reusable(method: str, status: str, content_length: str) -> bool:
+    """whether a response can be followed by another on its connection - the client
+    must be able to tell where its body ends without the connection closing"""
+    if method.upper() == "HEAD" or status[:3] in ("204", "304"):
+        return True
+    return content_length.isdigit()
+
+
+class ConnectionRequests:
+    """The requests of one connection. Each is counted as soon as it's read, before
+    it's known whether the connection can take another, so the last request, and a
+    request cut short by an error, count too."""
+
+    def __init__(self):
+        self.count = 0
+
+    def add(self) -> None:
+        self.count += 1
+
+    def can_add(self) -> bool:
+        return self.count < MAX_KEEP_ALIVE_REQUESTS
+
+
+class ConnectionStats:
+    """request counts of the streaming server's connections"""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__num_open = 0
+        self.__num_closed = 0
+        self.__num_reused = 0
+        self.__num_requests = 0
+        self.__max_requests = 0
+
+    def connection_opened(self) -> ConnectionRequests:
+        with self.__lock:
+            self.__num_open += 1
+        return ConnectionRequests()
+
+    def connection_closed(self, requests: ConnectionRequests) -> None:
+        num_requests = requests.count
+        with self.__lock:
+            self.__num_open -= 1
+            self.__num_closed += 1
+            if num_requests > 1:
+                self.__num_reused += 1
+            self.__num_requests += num_requests
+            self.__max_requests = max(self.__max_requests, num_requests)
+
+    def get_stats(self) -> Dict[str, float]:
+        with self.__lock:
+            return {
+                "open": self.__num_open,
+                "closed": self.__num_closed,
+                "reused": self.__num_reused,
+                "requests": self.__num_requests,
+                "max_requests": self.__max_requests,
+                "avg_requests": (
+                    round(self.__num_requests / self.__num_closed, 2) if self.__num_closed else 0
+                ),
+            }
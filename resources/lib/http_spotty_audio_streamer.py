@@ -1,11 +1,29 @@
-import threading
-import time
-from typing import Callable
+from typing import Any, Callable, Dict, Tuple, Union
 
 import bottle
+from audio_relay import AudioFrames
+from crossfade import MAX_CROSSFADE_SECS, is_crossfade_available
+from flac_encoder import FLAC_CONTENT_TYPE, FlacEncoder, find_flac_encoder
+from loudness import TrackLoudnessStore, is_loudness_analysis_available
+from pcm_cache import PcmCache
+from pcm_converter import (
+    SUPPORTED_BITS_PER_SAMPLE,
+    SUPPORTED_SAMPLE_RATES,
+    PcmFormat,
+    is_pcm_conversion_available,
+)
+from silence_trimmer import TrackSilenceStore, is_silence_trimming_available
 from spotty import Spotty
-from spotty_audio_streamer import SpottyAudioStreamer
+from spotty_audio_streamer import SPOTTY_PCM_FORMAT, SpottyAudioStreamer
+from spotty_decode_manager import SpottyDecodeManager
+from stream_session_manager import StreamSessionManager
+from track_prefetcher import TrackPrefetcher
 from utils import log_msg, LOGDEBUG
+from xbmc import LOGWARNING
+
+OUTPUT_FORMAT_WAV = "wav"
+OUTPUT_FORMAT_FLAC = "flac"
+OUTPUT_FORMATS = [OUTPUT_FORMAT_WAV, OUTPUT_FORMAT_FLAC]
 
 
 class HTTPSpottyAudioStreamer:
@@ -15,82 +33,170 @@ class HTTPSpottyAudioStreamer:
         gap_between_tracks: int = 0,
         use_normalization: bool = True,
         problem_with_terminate_streaming=False,
+        pcm_cache_size_mb: int = 0,
+        max_decodes: int = 2,
+        crossfade_secs: int = 0,
+        trim_silence: bool = False,
+        normalize_in_service: bool = False,
+        stream_sample_rate: int = SPOTTY_PCM_FORMAT.sample_rate,
+        stream_bits_per_sample: int = SPOTTY_PCM_FORMAT.bits_per_sample,
     ):
         self.__spotty: Spotty = spotty
         self.__gap_between_tracks: int = gap_between_tracks
-        self.__problem_with_terminate_streaming = problem_with_terminate_streaming
+        self.__crossfade_secs = self.__get_crossfade_secs(crossfade_secs)
+        self.__stream_sample_rate = stream_sample_rate
+        self.__stream_bits_per_sample = stream_bits_per_sample
+
+        self.__pcm_cache: PcmCache = PcmCache(pcm_cache_size_mb)
+        self.__decode_manager: SpottyDecodeManager = SpottyDecodeManager(
+            self.__spotty,
+            self.__pcm_cache,
+            self.__get_track_silence_store(trim_silence),
+            self.__get_track_loudness_store(normalize_in_service),
+        )
+        self.__decode_manager.use_normalization = use_normalization
+        self.__session_manager = StreamSessionManager(
+            self.__decode_manager, max_decodes, not problem_with_terminate_streaming
+        )
+        self.__notify_track_finished: Callable[[str], None] = lambda x: None
+
+        self.__flac_encoder_args = find_flac_encoder()
+        log_msg(f"Flac encoder: {self.__flac_encoder_args[:1] or 'not found'}.", LOGDEBUG)
+
+    def is_flac_available(self) -> bool:
+        return bool(self.__flac_encoder_args)
 
-        self.__spotty_streamer: SpottyAudioStreamer = SpottyAudioStreamer(self.__spotty)
-        self.__spotty_streamer.use_normalization = use_normalization
+    @staticmethod
+    def __get_crossfade_secs(crossfade_secs: int) -> int:
+        if crossfade_secs <= 0:
+            return 0
+        if not is_crossfade_available():
+            log_msg("Crossfading needs NumPy, which is not installed. No crossfade.", LOGWARNING)
+            return 0
+        log_msg(f"Crossfade between tracks: {crossfade_secs} secs.", LOGDEBUG)
+        return min(crossfade_secs, MAX_CROSSFADE_SECS)
 
-        self.__is_streaming = False
-        self.__stream_lock = threading.Lock()
+    @staticmethod
+    def __get_track_silence_store(trim_silence: bool) -> Union[TrackSilenceStore, None]:
+        if not trim_silence:
+            return None
+        if not is_silence_trimming_available():
+            log_msg("Silence trimming needs NumPy, which is not installed. No trim.", LOGWARNING)
+            return None
+        return TrackSilenceStore()
+
+    @staticmethod
+    def __get_track_loudness_store(normalize_in_service: bool) -> Union[TrackLoudnessStore, None]:
+        if not normalize_in_service:
+            return None
+        if not is_loudness_analysis_available():
+            log_msg("Service normalization needs NumPy, which is not installed.", LOGWARNING)
+            return None
+        log_msg("Normalizing loudness in the service, not in spotty.", LOGDEBUG)
+        return TrackLoudnessStore()
 
     def use_normalization(self, value):
-        self.__spotty_streamer.use_normalization = value
+        self.__decode_manager.use_normalization = value
 
     def set_notify_track_finished(self, func: Callable[[str], None]) -> None:
-        self.__spotty_streamer.set_notify_track_finished(func)
+        self.__notify_track_finished = func
+
+    def prefetch_track(self, track_id: str, track_duration: float) -> bool:
+        return self.__decode_manager.prefetch_track(
+            track_id, SpottyAudioStreamer.get_audio_data_length(track_duration)
+        )
+
+    def get_spotty_process_stats(self) -> Dict[str, int]:
+        return self.__decode_manager.get_spotty_process_stats()
+
+    def get_stream_session_stats(self) -> Dict[str, int]:
+        return self.__session_manager.get_stats()
 
     def stop(self) -> None:
         log_msg("Stopping spotty audio streaming.", LOGDEBUG)
-        if self.__is_streaming:
-            self.__terminate_streaming()
+        if self.__session_manager.terminate_all():
+            log_msg(f"Terminated running streamers.", LOGDEBUG)
         else:
             log_msg("No running audio streamer. Nothing to stop.", LOGDEBUG)
+        self.__decode_manager.close()
 
-    def __terminate_streaming(self) -> None:
-        if self.__spotty_streamer.terminate_stream():
-            log_msg(f"Terminated running streamer.", LOGDEBUG)
-        else:
-            log_msg(f"No running streamer. Nothing to terminate.", LOGDEBUG)
+    SPOTTY_PROCESS_STATS_ROUTE = "/stats/spotty_processes"
+
+    def spotty_process_stats(self) -> Dict[str, int]:
+        return self.get_spotty_process_stats()
+
+    spotty_process_stats.route = SPOTTY_PROCESS_STATS_ROUTE
+
+    SPOTTY_LOG_STATS_ROUTE = "/stats/spotty_log"
+    SPOTTY_LOG_RECENT_LINES = 50
+
+    def spotty_log_stats(self) -> Dict[str, Any]:
+        spotty_log = self.__spotty.get_spotty_log()
+        return {
+            "events": spotty_log.get_event_stats(),
+            "recent_lines": spotty_log.get_recent_lines(self.SPOTTY_LOG_RECENT_LINES),
+        }
+
+    spotty_log_stats.route = SPOTTY_LOG_STATS_ROUTE
+
+    STREAM_SESSION_STATS_ROUTE = "/stats/stream_sessions"
+
+    def stream_session_stats(self) -> Dict[str, int]:
+        return self.get_stream_session_stats()
+
+    stream_session_stats.route = STREAM_SESSION_STATS_ROUTE
 
     SPOTTY_AUDIO_TRACK_ROUTE = "/track/<track_id>/<duration>"
     # e.g., track_id = "2eHtBGvfD7PD7SiTl52Vxr", duration = 178.795
+    # An optional 'fmt' query parameter selects the output format, 'wav' (the
+    # default) or 'flac', e.g., "/track/2eHtBGvfD7PD7SiTl52Vxr/178.795?fmt=flac".
 
     # IMPORTANT: If Kodi is running in non-buffered file mode (e.g., cache/buffermode=3 in
     #   'advancedsettings.xml'), then 'CurlFile::Open' will do multiple HTTP GETs for a stream
     #   and eventually request a partial range. That's why there's the added complication
-    #   of the '__is_streaming' flag and 'request ranges' code below. (Not to mention
-    #   requiring a multithreaded web server to handle the streaming.)
-    def spotty_stream_audio_track(self, track_id: str, duration: str) -> bottle.Response:
+    #   of the 'request ranges' code below. (Not to mention requiring a multithreaded web
+    #   server to handle the streaming.) Connections for the same track share one spotty
+    #   decode, so a second connection doesn't restart spotty. Each GET is a stream
+    #   session of its own - the proxy only listens on localhost, so the client address
+    #   can't tell Kodi instances apart.
+    def spotty_stream_audio_track(
+        self, track_id: str, duration: str
+    ) -> Union[AudioFrames, bottle.Response]:
         log_msg(f"GET request: {bottle.request}", LOGDEBUG)
 
-        if self.__is_streaming:
-            if self.__problem_with_terminate_streaming:
-                log_msg("Already streaming. But flag 'problem_with_terminate_streaming' = True,"
-                        " so NOT terminating current streamer.")
-            else:
-                with self.__stream_lock:
-                    log_msg("Already streaming. Terminating current streamer.")
-                    self.__terminate_streaming()
-
-        self.__is_streaming = True
-
-        if self.__gap_between_tracks:
-            # TODO - Can we improve on this? Sometimes, when playing a playlist
-            #        with no gap between tracks, Kodi does not shutdown the visualizer
-            #        before starting the next track and visualizer. So one visualizer
-            #        instance is stopping at the same time as another is starting.
-            # Give some time for visualizations to finish.
-            log_msg(f"Delay {self.__gap_between_tracks}s before starting track.")
-            time.sleep(self.__gap_between_tracks)
+        output_format = bottle.request.query.get("fmt", OUTPUT_FORMAT_WAV)
+        if output_format not in OUTPUT_FORMATS:
+            return bottle.HTTPError(400, f"Unknown output format '{output_format}'.")
+        if output_format == OUTPUT_FORMAT_FLAC and not self.__flac_encoder_args:
+            log_msg("No flac encoder found. Streaming wav instead.", LOGWARNING)
+            output_format = OUTPUT_FORMAT_WAV
+        pcm_format = self.__get_pcm_format()
+        if not pcm_format:
+            return bottle.HTTPError(400, "Unsupported sample rate or bits per sample.")
 
-        self.__spotty_streamer.set_track(track_id, float(duration))
+        # Sometimes, when playing a playlist with no gap between tracks, Kodi does not
+        # shutdown the visualizer before starting the next track and visualizer. So one
+        # visualizer instance is stopping at the same time as another is starting. The
+        # gap (silence at the start of the stream) gives visualizations time to finish.
+        spotty_streamer = SpottyAudioStreamer(
+            self.__decode_manager, self.__gap_between_tracks, self.__crossfade_secs, pcm_format
+        )
+        spotty_streamer.set_notify_track_finished(self.__notify_track_finished)
+        spotty_streamer.set_get_next_track(TrackPrefetcher.get_next_track)
+        spotty_streamer.set_track(track_id, float(duration))
 
         log_msg(
-            f"Start streaming spotify track '{track_id}',"
-            f" track length {self.__spotty_streamer.get_track_length()}."
+            f"Start streaming spotify track '{track_id}' to {bottle.request.remote_addr},"
+            f" track length {spotty_streamer.get_track_length()}."
         )
 
-        file_size = self.__spotty_streamer.get_track_length()
+        if output_format == OUTPUT_FORMAT_FLAC:
+            return self.__stream_flac_audio_track(spotty_streamer)
+
+        file_size = spotty_streamer.get_track_length()
         range_begin = 0
         range_end = file_size
 
-        def generate() -> str:
-            range_len = range_end - range_begin
-            return self.__spotty_streamer.send_part_audio_stream(range_len, range_begin)
-
         request_range = bottle.request.headers.get("Range", "")
         log_msg(f"Request header range: '{request_range}'.", LOGDEBUG)
 
@@ -100,10 +206,14 @@ class HTTPSpottyAudioStreamer:
             log_msg(f"Full request, content length = {range_end- range_begin}.", LOGDEBUG)
         else:
             status = "206 Partial Content"
-            stream_range = bottle.request.headers["Range"].split("bytes=")[1].split("-")
-            range_begin = int(stream_range[0])
-            range_end = int(stream_range[1]) if stream_range[1].isdigit() else file_size
-            content_range = f"bytes {range_begin}-{range_end}/{file_size}"
+            stream_range = self.get_stream_range(request_range, file_size)
+            if not stream_range:
+                return bottle.HTTPError(
+                    416, "Range not satisfiable.", Content_Range=f"bytes */{file_size}"
+                )
+            range_begin, range_end = stream_range
+            # Content-Range positions are inclusive.
+            content_range = f"bytes {range_begin}-{range_end - 1}/{file_size}"
             log_msg(
                 f"Partial request, range = {content_range}," f" length = {range_end - range_begin}",
                 LOGDEBUG,
@@ -117,8 +227,95 @@ class HTTPSpottyAudioStreamer:
             bottle.response.headers["Content-Range"] = content_range
 
         if bottle.request.method.upper() == "GET":
-            return bottle.Response(generate())
+            session = self.__session_manager.start_session(spotty_streamer, range_begin)
+            if not session:
+                return bottle.HTTPError(503, "Too many streams.", Retry_After="5")
+            # Return the file-like body itself (not wrapped in a 'bottle.Response') so
+            # bottle hands it to the server's file wrapper for relaying.
+            return AudioFrames(
+                spotty_streamer.send_part_audio_stream(range_end - range_begin, range_begin),
+                lambda: self.__session_manager.end_session(session),
+            )
 
         return bottle.Response()
 
     spotty_stream_audio_track.route = SPOTTY_AUDIO_TRACK_ROUTE
+
+    # Optional 'rate' and 'bits' query parameters (defaulting to the stream settings)
+    # convert the spotty pcm, e.g., for a 48kHz only output device, so Kodi doesn't have
+    # to resample. E.g., "/track/2eHtBGvfD7PD7SiTl52Vxr/178.795?rate=48000&bits=24".
+    def __get_pcm_format(self) -> Union[PcmFormat, None]:
+        sample_rate = bottle.request.query.get("rate", str(self.__stream_sample_rate))
+        bits_per_sample = bottle.request.query.get("bits", str(self.__stream_bits_per_sample))
+        if not sample_rate.isdigit() or int(sample_rate) not in SUPPORTED_SAMPLE_RATES:
+            return None
+        if not bits_per_sample.isdigit() or int(bits_per_sample) not in SUPPORTED_BITS_PER_SAMPLE:
+            return None
+
+        pcm_format = PcmFormat(
+            int(sample_rate), int(bits_per_sample), SPOTTY_PCM_FORMAT.num_channels
+        )
+        if pcm_format != SPOTTY_PCM_FORMAT and not is_pcm_conversion_available():
+            log_msg(f"Converting to {pcm_format} needs NumPy. Streaming spotty pcm.", LOGWARNING)
+            return SPOTTY_PCM_FORMAT
+        return pcm_format
+
+    @staticmethod
+    def get_stream_range(request_range: str, file_size: int) -> Union[Tuple[int, int], None]:
+        """the (begin, exclusive end) of a 'bytes=first-last' or 'bytes=-suffix_length'
+        range header - 'last' is inclusive - or None if it's not satisfiable"""
+        first, _, last = request_range.split("bytes=")[-1].split(",")[0].partition("-")
+        first, last = first.strip(), last.strip()
+        if first.isdigit():
+            range_begin = int(first)
+            range_end = min(int(last) + 1, file_size) if last.isdigit() else file_size
+        elif not first and last.isdigit():
+            range_begin = max(0, file_size - int(last))
+            range_end = file_size
+        else:
+            return None
+
+        if range_begin >= range_end:
+            return None
+        return range_begin, range_end
+
+    # The flac byte offset of a position isn't known until the audio up to it has been
+    # encoded, so flac streams don't take byte ranges ('Accept-Ranges: none'), and a
+    # range header is ignored: the response is the whole stream. A flac stream is seeked
+    # with a 'start' query parameter instead, in seconds from the start of the stream,
+    # e.g., "/track/2eHtBGvfD7PD7SiTl52Vxr/178.795?fmt=flac&start=60.5", which starts a
+    # new flac stream from that position.
+    def __stream_flac_audio_track(
+        self, spotty_streamer: SpottyAudioStreamer
+    ) -> Union[AudioFrames, bottle.Response]:
+        request_range = bottle.request.headers.get("Range", "")
+        start = bottle.request.query.get("start", "")
+        log_msg(
+            f"Start streaming spotify track as flac, start: '{start}',"
+            f" request header range: '{request_range}'.",
+            LOGDEBUG,
+        )
+
+        range_begin = 0
+        if start:
+            try:
+                range_begin = spotty_streamer.get_stream_offset(float(start))
+            except ValueError:
+                return bottle.HTTPError(400, f"Bad start position '{start}'.")
+        log_msg(f"Flac stream from wav stream offset {range_begin}.", LOGDEBUG)
+
+        bottle.response.status = 200
+        bottle.response.headers["Accept-Ranges"] = "none"
+        bottle.response.content_type = FLAC_CONTENT_TYPE
+
+        if bottle.request.method.upper() == "GET":
+            session = self.__session_manager.start_session(spotty_streamer, range_begin)
+            if not session:
+                return bottle.HTTPError(503, "Too many streams.", Retry_After="5")
+            wav_frames = AudioFrames(spotty_streamer.send_seek_audio_stream(range_begin))
+            return AudioFrames(
+                FlacEncoder(self.__flac_encoder_args).encode(wav_frames),
+                lambda: self.__session_manager.end_session(session),
+            )
+
+        return bottle.Response()
@@ -0,0 +1,42 @@
+import json
+import socket
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Any, Dict
+
+from utils import PROXY_PORT, log_msg, LOGDEBUG
+
+LISTING_PATH = "/listing"
+# A first, uncached listing of a big library can take a while to build.
+LISTING_TIMEOUT_IN_SECS = 120
+# Long enough for the service to get the request - it carries on building the listing
+# after the plugin stops waiting.
+LISTING_REQUEST_TIMEOUT_IN_SECS = 0.5
+
+
+def get_listing(name: str, **params: Any) -> Dict[str, Any]:
+    """fetch a ready to render listing from the service's listing engine"""
+    with urllib.request.urlopen(
+        get_listing_url(name, **params), timeout=LISTING_TIMEOUT_IN_SECS
+    ) as response:
+        return json.load(response)
+
+
+def request_listing(name: str, **params: Any) -> None:
+    """have the service's listing engine build a listing (e.g., to warm its caches),
+    without waiting for it"""
+    try:
+        with urllib.request.urlopen(
+            get_listing_url(name, **params), timeout=LISTING_REQUEST_TIMEOUT_IN_SECS
+        ):
+            pass
+    except (socket.timeout, urllib.error.URLError) as exc:
+        log_msg(f"Not waiting for listing '{name}': {exc}.", LOGDEBUG)
+
+
+def get_listing_url(name: str, **params: Any) -> str:
+    url = f"http://localhost:{PROXY_PORT}{LISTING_PATH}/{name}"
+    if params:
+        url += f"?{urllib.parse.urlencode(params)}"
+    return url
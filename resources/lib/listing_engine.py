@@ -0,0 +1,824 @@
+import math
+import threading
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+import bottle
+import xbmc
+import xbmcaddon
+
+import simplecache
+import spotipy
+import utils
+from entity_store import EntityStore
+from listing_client import LISTING_PATH
+from spotify_pager import SpotifyPager
+from spotify_resolver import SpotifyResolver
+from utils import ADDON_ID, log_exception, log_msg
+
+PLUGIN_URL = f"plugin://{ADDON_ID}/"
+
+# The largest pages the Spotify endpoints allow.
+PAGE_SIZE = 50
+PLAYLIST_ITEMS_PAGE_SIZE = 100
+
+# How long the library counts in the cache checksum are trusted. A changed generic
+# checksum (see the plugin's 'refresh_listing') always invalidates them.
+CACHE_CHECKSUM_TTL_IN_SECS = 60
+
+Playlist = Dict[str, Union[str, Dict[str, List[Any]]]]
+
+
+class ListingEngine:
+    """Builds the plugin's listings in the service, so they are served from one
+    long-lived spotipy client (with its warm connections) and simplecache. Each
+    plugin invocation just fetches its ready to render items from the listing
+    route (see 'listing_client.get_listing'). Simplecache only keeps the ids of the
+    tracks, albums and artists in a listing. Their Spotify objects are held once,
+    in the entity store, and the listing items are prepared from them per request."""
+
+    def __init__(self):
+        self.__addon: xbmcaddon.Addon = xbmcaddon.Addon(id=ADDON_ID)
+        self.__cache: simplecache.SimpleCache = simplecache.SimpleCache(ADDON_ID)
+        self.__spotipy: spotipy.Spotify = spotipy.Spotify()
+        self.__pager: SpotifyPager = SpotifyPager()
+        self.__entity_store: EntityStore = EntityStore()
+        self.__resolver: SpotifyResolver = SpotifyResolver(self.__pager, self.__entity_store)
+
+        self.__lock = threading.Lock()
+        self.__auth_token = ""
+        self.__userid = ""
+        self.__user_country = ""
+
+        self.__cached_checksum = ""
+        self.__cached_generic_checksum = ""
+        self.__cached_checksum_expires_at = 0.0
+
+        self.__precache_thread: Union[threading.Thread, None] = None
+
+        # listing name -> (listing function, query parameters passed to it)
+        self.__listings: Dict[str, Tuple[Callable[..., Any], Tuple[str, ...]]] = {
+            "top_artists": (self.get_top_artists, ()),
+            "top_tracks": (self.get_top_tracks, ()),
+            "explore_categories": (self.get_explore_categories, ()),
+            "album": (self.get_album, ("albumid",)),
+            "artist_top_tracks": (self.get_artist_top_tracks, ("artistid",)),
+            "related_artists": (self.get_related_artists, ("artistid",)),
+            "artist_albums": (self.get_artist_albums, ("artistid", "albumtype")),
+            "playlist": (self.get_playlist_details, ("playlistid",)),
+            "category": (self.get_category, ("categoryid",)),
+            "featured_playlists": (self.get_featured_playlists, ()),
+            "user_playlists": (self.get_user_playlists, ("ownerid",)),
+            "new_releases": (self.get_new_releases, ()),
+            "saved_albums": (self.get_saved_albums, ()),
+            "saved_tracks": (self.get_saved_tracks, ()),
+            "saved_artists": (self.get_saved_artists, ()),
+            "followed_artists": (self.get_followed_artists, ()),
+            "search": (self.search, ("query",)),
+            "search_artists": (self.search_artists, ("query", "limit", "offset")),
+            "search_tracks": (self.search_tracks, ("query", "limit", "offset")),
+            "search_albums": (self.search_albums, ("query", "limit", "offset")),
+            "search_playlists": (self.search_playlists, ("query", "limit", "offset")),
+            "precache": (self.start_precache, ()),
+            "clear_entities": (self.clear_entities, ()),
+        }
+
+    def close(self) -> None:
+        self.__pager.close()
+        self.__cache.close()
+        self.__entity_store.close()
+
+    def get_pager_stats(self) -> Dict[str, int]:
+        return self.__pager.get_stats()
+
+    def get_resolver_stats(self) -> Dict[str, int]:
+        return self.__resolver.get_stats()
+
+    LISTING_ROUTE = f"{LISTING_PATH}/<name>"
+
+    def listing(self, name: str) -> Dict[str, Any]:
+        if name not in self.__listings:
+            return bottle.HTTPError(404, f"Unknown listing '{name}'.")
+        get_listing, param_names = self.__listings[name]
+        args = [bottle.request.query.getunicode(param, default="") for param in param_names]
+
+        try:
+            self.__refresh_auth()
+            result = get_listing(*args)
+        except Exception as exc:
+            log_exception(exc, f"Could not get listing '{name}'")
+            return bottle.HTTPError(500, f"Could not get listing '{name}'.")
+
+        # Bottle returns a dict as json.
+        return result if isinstance(result, dict) else {"items": result}
+
+    listing.route = LISTING_ROUTE
+
+    def __refresh_auth(self) -> None:
+        auth_token = utils.get_cached_auth_token()
+        if not auth_token:
+            raise Exception("Spotify is not authorized.")
+
+        with self.__lock:
+            if auth_token == self.__auth_token:
+                return
+            self.__spotipy.set_auth(auth_token)
+            me = self.__spotipy.me()
+            # Entities are fetched for the user's market.
+            if self.__userid and me["id"] != self.__userid:
+                self.__resolver.clear()
+            self.__userid = me["id"]
+            self.__user_country = me["country"]
+            self.__auth_token = auth_token
+
+    def start_precache(self) -> Dict[str, bool]:
+        """cache the library listings in the background, once per service run"""
+        with self.__lock:
+            if self.__precache_thread:
+                return {"started": False}
+            self.__precache_thread = threading.Thread(target=self.__precache_library, daemon=True)
+            self.__precache_thread.start()
+
+        return {"started": True}
+
+    def clear_entities(self) -> Dict[str, bool]:
+        self.__resolver.clear()
+        return {"cleared": True}
+
+    def __precache_library(self) -> None:
+        try:
+            monitor = xbmc.Monitor()
+            user_playlists = self.get_user_playlists(self.__userid)
+            for playlist in user_playlists:
+                self.get_playlist_details(playlist["id"])
+                if monitor.abortRequested():
+                    return
+            self.get_saved_albums()
+            if monitor.abortRequested():
+                return
+            self.get_saved_artists()
+            if monitor.abortRequested():
+                return
+            self.get_saved_tracks()
+            log_msg("Finished precaching the library.")
+        except Exception as exc:
+            log_exception(exc, "Could not precache the library")
+            # Let the next main menu try again.
+            with self.__lock:
+                self.__precache_thread = None
+
+    def __cache_checksum(self, opt_value: Any = None) -> str:
+        """simple cache checksum based on a few most important values"""
+        generic_checksum = self.__addon.getSetting("cache_checksum")
+        with self.__lock:
+            result = self.__cached_checksum
+            if (
+                generic_checksum != self.__cached_generic_checksum
+                or time.monotonic() >= self.__cached_checksum_expires_at
+            ):
+                result = ""
+
+        if not result:
+            saved_tracks = self.__get_saved_track_ids()
+            saved_albums = self.__get_saved_album_ids()
+            followed_artists = self.__get_followed_artist_ids()
+            result = (
+                f"{len(saved_tracks)}-{len(saved_albums)}-{len(followed_artists)}"
+                f"-{generic_checksum}"
+            )
+            with self.__lock:
+                self.__cached_checksum = result
+                self.__cached_generic_checksum = generic_checksum
+                self.__cached_checksum_expires_at = time.monotonic() + CACHE_CHECKSUM_TTL_IN_SECS
+
+        if opt_value:
+            result += f"-{opt_value}"
+
+        return result
+
+    @staticmethod
+    def __build_url(query: Dict[str, str]) -> str:
+        query_encoded = {}
+        for key, value in list(query.items()):
+            if isinstance(key, str):
+                key = key.encode("utf-8")
+            if isinstance(value, str):
+                value = value.encode("utf-8")
+            query_encoded[key] = value
+
+        return PLUGIN_URL + "?" + urllib.parse.urlencode(query_encoded)
+
+    @staticmethod
+    def __get_track_rating(popularity: int) -> int:
+        if not popularity:
+            return 0
+
+        return int(math.ceil(popularity * 6 / 100.0)) - 1
+
+    def get_top_artists(self) -> List[Dict[str, Any]]:
+        result = self.__spotipy.current_user_top_artists(limit=PAGE_SIZE, offset=0)
+
+        cache_str = f"spotify.topartistids.{self.__userid}"
+        checksum = self.__cache_checksum(result["total"])
+        artist_ids = self.__cache.get(cache_str, checksum=checksum)
+        if not artist_ids:
+            result["items"] = self.__pager.get_items(
+                lambda offset: self.__spotipy.current_user_top_artists(
+                    limit=PAGE_SIZE, offset=offset
+                )["items"],
+                result["total"],
+                PAGE_SIZE,
+                result["items"],
+            )
+            self.__resolver.add_artists(result["items"])
+            artist_ids = [artist["id"] for artist in result["items"]]
+            self.__cache.set(cache_str, artist_ids, checksum=checksum)
+
+        return self.__prepare_artist_listitems(
+            self.__resolver.get_artists(self.__spotipy, artist_ids)
+        )
+
+    def get_top_tracks(self) -> List[Dict[str, Any]]:
+        results = self.__spotipy.current_user_top_tracks(limit=20, offset=0)
+
+        cache_str = f"spotify.toptrackids.{self.__userid}"
+        checksum = self.__cache_checksum(results["total"])
+        track_ids = self.__cache.get(cache_str, checksum=checksum)
+        if not track_ids:
+            tracks = results["items"]
+            while results["next"]:
+                results = self.__spotipy.next(results)
+                tracks.extend(results["items"])
+            self.__resolver.add_tracks(tracks)
+            track_ids = [track["id"] for track in tracks]
+            self.__cache.set(cache_str, track_ids, checksum=checksum)
+
+        return self.__prepare_track_listitems(track_ids)
+
+    def get_explore_categories(self) -> List[Tuple[Any, str, Union[str, Any]]]:
+        items = []
+
+        categories = self.__spotipy.categories(
+            country=self.__user_country, limit=50, locale=self.__user_country
+        )
+        count = len(categories["categories"]["items"])
+        while categories["categories"]["total"] > count:
+            categories["categories"]["items"] += self.__spotipy.categories(
+                country=self.__user_country, limit=50, offset=count, locale=self.__user_country
+            )["categories"]["items"]
+            count += 50
+
+        for item in categories["categories"]["items"]:
+            thumb = "DefaultMusicGenre.png"
+            for icon in item["icons"]:
+                thumb = icon["url"]
+                break
+            items.append(
+                (
+                    item["name"],
+                    f"{PLUGIN_URL}?action=browse_category&applyfilter={item['id']}",
+                    thumb,
+                )
+            )
+
+        return items
+
+    def __get_album_tracks(self, album: Dict[str, Any]) -> List[Dict[str, Any]]:
+        cache_str = f"spotify.albumtrackids.{album['id']}"
+        checksum = self.__cache_checksum()
+
+        track_ids = self.__cache.get(cache_str, checksum=checksum)
+        if not track_ids:
+            track_ids = []
+            count = 0
+            while album["tracks"]["total"] > count:
+                tracks = self.__spotipy.album_tracks(
+                    album["id"], market=self.__user_country, limit=50, offset=count
+                )["items"]
+                for track in tracks:
+                    track_ids.append(track["id"])
+                count += 50
+            self.__cache.set(cache_str, track_ids, checksum=checksum)
+
+        return self.__prepare_track_listitems(track_ids, album_details=album)
+
+    def get_album(self, album_id: str) -> Dict[str, Any]:
+        album = self.__spotipy.album(album_id, market=self.__user_country)
+        return {
+            "name": album["name"],
+            "album_type": album.get("album_type"),
+            "tracks": self.__get_album_tracks(album),
+        }
+
+    def get_artist_top_tracks(self, artist_id: str) -> List[Dict[str, Any]]:
+        tracks = self.__spotipy.artist_top_tracks(artist_id, country=self.__user_country)
+        self.__resolver.add_tracks(tracks["tracks"])
+        return self.__prepare_track_listitems(tracks=tracks["tracks"])
+
+    def get_related_artists(self, artist_id: str) -> List[Dict[str, Any]]:
+        cache_str = f"spotify.relatedartistids.{artist_id}"
+        checksum = self.__cache_checksum()
+        artist_ids = self.__cache.get(cache_str, checksum=checksum)
+        if not artist_ids:
+            artists = self.__spotipy.artist_related_artists(artist_id)["artists"]
+            self.__resolver.add_artists(artists)
+            artist_ids = [artist["id"] for artist in artists]
+            self.__cache.set(cache_str, artist_ids, checksum=checksum)
+
+        return self.__prepare_artist_listitems(
+            self.__resolver.get_artists(self.__spotipy, artist_ids)
+        )
+
+    def get_playlist_details(self, playlist_id: str) -> Playlist:
+        playlist = self.__spotipy.playlist(
+            playlist_id, fields="tracks(total),name,owner(id),id", market=self.__user_country
+        )
+        # Get from cache first.
+        cache_str = f"spotify.playlisttrackids.{playlist['id']}"
+        checksum = self.__cache_checksum(playlist["tracks"]["total"])
+        track_ids = self.__cache.get(cache_str, checksum=checksum)
+        if not track_ids:
+            # Get listing from api.
+            items = self.__pager.get_items(
+                lambda offset: self.__spotipy.playlist_items(
+                    playlist["id"],
+                    market=self.__user_country,
+                    fields="",
+                    limit=PLAYLIST_ITEMS_PAGE_SIZE,
+                    offset=offset,
+                )["items"],
+                playlist["tracks"]["total"],
+                PLAYLIST_ITEMS_PAGE_SIZE,
+            )
+            # Local tracks have no id.
+            tracks = [item["track"] for item in items if item["track"] and item["track"]["id"]]
+            self.__resolver.add_tracks(tracks)
+            track_ids = [track["id"] for track in tracks]
+            self.__cache.set(cache_str, track_ids, checksum=checksum)
+
+        playlist["owned"] = playlist["owner"]["id"] == self.__userid
+        playlist["tracks"]["items"] = self.__prepare_track_listitems(
+            track_ids, playlist_details=playlist
+        )
+
+        return playlist
+
+    def get_category(self, categoryid: str) -> Playlist:
+        category = self.__spotipy.category(
+            categoryid, country=self.__user_country, locale=self.__user_country
+        )
+        playlists = self.__spotipy.category_playlists(
+            categoryid, country=self.__user_country, limit=50, offset=0
+        )
+        playlists["category"] = category["name"]
+        playlists["playlists"]["items"] = self.__pager.get_items(
+            lambda offset: self.__spotipy.category_playlists(
+                categoryid, country=self.__user_country, limit=PAGE_SIZE, offset=offset
+            )["playlists"]["items"],
+            playlists["playlists"]["total"],
+            PAGE_SIZE,
+            playlists["playlists"]["items"],
+        )
+        playlists["playlists"]["items"] = self.__prepare_playlist_listitems(
+            playlists["playlists"]["items"]
+        )
+
+        return playlists
+
+    def get_featured_playlists(self) -> Playlist:
+        playlists = self.__spotipy.featured_playlists(
+            country=self.__user_country, limit=50, offset=0
+        )
+        playlists["playlists"]["items"] = self.__pager.get_items(
+            lambda offset: self.__spotipy.featured_playlists(
+                country=self.__user_country, limit=PAGE_SIZE, offset=offset
+            )["playlists"]["items"],
+            playlists["playlists"]["total"],
+            PAGE_SIZE,
+            playlists["playlists"]["items"],
+        )
+        playlists["playlists"]["items"] = self.__prepare_playlist_listitems(
+            playlists["playlists"]["items"]
+        )
+
+        return playlists
+
+    def get_user_playlists(self, userid: str) -> List[Dict[str, Any]]:
+        # No owner means the current user.
+        userid = userid or self.__userid
+        playlists = self.__spotipy.user_playlists(userid, limit=1, offset=0)
+        count = len(playlists["items"])
+        total = playlists["total"]
+        cache_str = f"spotify.userplaylists.{userid}"
+        checksum = self.__cache_checksum(total)
+
+        cache = self.__cache.get(cache_str, checksum=checksum)
+        if cache:
+            playlists = cache
+        else:
+            while total > count:
+                playlists["items"] += self.__spotipy.user_playlists(userid, limit=50, offset=count)[
+                    "items"
+                ]
+                count += 50
+            playlists = self.__prepare_playlist_listitems(playlists["items"])
+            self.__cache.set(cache_str, playlists, checksum=checksum)
+
+        return playlists
+
+    def __get_curuser_playlistids(self) -> List[str]:
+        playlists = self.__spotipy.current_user_playlists(limit=1, offset=0)
+        count = len(playlists["items"])
+        total = playlists["total"]
+        cache_str = f"spotify.userplaylistids.{self.__userid}"
+        playlist_ids = self.__cache.get(cache_str, checksum=total)
+        if not playlist_ids:
+            playlist_ids = []
+            while total > count:
+                playlists["items"] += self.__spotipy.current_user_playlists(limit=50, offset=count)[
+                    "items"
+                ]
+                count += 50
+            for playlist in playlists["items"]:
+                playlist_ids.append(playlist["id"])
+            self.__cache.set(cache_str, playlist_ids, checksum=total)
+        return playlist_ids
+
+    def get_new_releases(self) -> List[Dict[str, Any]]:
+        albums = self.__spotipy.new_releases(country=self.__user_country, limit=PAGE_SIZE, offset=0)
+        albums["albums"]["items"] = self.__pager.get_items(
+            lambda offset: self.__spotipy.new_releases(
+                country=self.__user_country, limit=PAGE_SIZE, offset=offset
+            )["albums"]["items"],
+            albums["albums"]["total"],
+            PAGE_SIZE,
+            albums["albums"]["items"],
+        )
+
+        album_ids = []
+        for album in albums["albums"]["items"]:
+            album_ids.append(album["id"])
+        albums = self.__prepare_album_listitems(album_ids)
+
+        return albums
+
+    def __prepare_track_listitems(
+        self, track_ids=None, tracks=None, playlist_details=None, album_details=None
+    ) -> List[Dict[str, Any]]:
+        if tracks is None:
+            tracks = []
+        if track_ids is None:
+            track_ids = []
+
+        new_tracks: List[Dict[str, Any]] = []
+
+        # For tracks, we always get the full details unless full tracks already supplied.
+        if track_ids and not tracks:
+            tracks = self.__resolver.get_tracks(self.__spotipy, track_ids, self.__user_country)
+
+        saved_track_ids = set(self.__get_saved_track_ids())
+        followed_artists = set(self.__get_followed_artist_ids())
+
+        for track in tracks:
+            if track.get("track"):
+                track = track["track"]
+            if album_details:
+                track["album"] = album_details
+            if track.get("images"):
+                thumb = track["images"][0]["url"]
+            elif track.get("album", {}).get("images"):
+                thumb = track["album"]["images"][0]["url"]
+            else:
+                thumb = "DefaultMusicSongs.png"
+            track["thumb"] = thumb
+
+            # Skip local tracks in playlists.
+            if not track.get("id"):
+                continue
+
+            if "artists" in track:
+                artists = []
+                for artist in track["artists"]:
+                    if artist["name"]:
+                        artists.append(artist["name"])
+                if artists:
+                    track["artist"] = " / ".join(artists)
+                    track["artistid"] = track["artists"][0]["id"]
+                    track["artistfollowed"] = track["artistid"] in followed_artists
+
+            if "album" not in track:
+                track["genre"] = []
+                track["year"] = 1900
+            else:
+                track["genre"] = " / ".join(track["album"].get("genres", []))
+
+                # Allow for 'release_date' being empty.
+                release_date = track["album"].get("release_date", "0")
+                track["year"] = 1900 if not release_date else int(release_date.split("-")[0])
+
+            track["rating"] = str(self.__get_track_rating(track["popularity"]))
+
+            if playlist_details:
+                track["playlistid"] = playlist_details["id"]
+
+            # The plugin builds the context menu from these flags (see 'context_menus').
+            track["saved"] = track["id"] in saved_track_ids
+
+            new_tracks.append(track)
+
+        return new_tracks
+
+    def __prepare_album_listitems(
+        self, album_ids: List[str] = None, albums: List[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        if albums is None:
+            albums: List[Dict[str, Any]] = []
+        if album_ids is None:
+            album_ids = []
+        if not albums and album_ids:
+            albums = self.__resolver.get_albums(self.__spotipy, album_ids, self.__user_country)
+
+        saved_albums = set(self.__get_saved_album_ids())
+
+        # process listing
+        for track in albums:
+            if track.get("images"):
+                track["thumb"] = track["images"][0]["url"]
+            else:
+                track["thumb"] = "DefaultMusicAlbums.png"
+
+            track["url"] = self.__build_url({"action": "browse_album", "albumid": track["id"]})
+
+            artists = []
+            for artist in track["artists"]:
+                artists.append(artist["name"])
+            track["artist"] = " / ".join(artists)
+            track["genre"] = " / ".join(track["genres"])
+            track["year"] = int(track["release_date"].split("-")[0])
+            track["rating"] = str(self.__get_track_rating(track["popularity"]))
+            track["artistid"] = track["artists"][0]["id"]
+            track["saved"] = track["id"] in saved_albums
+
+        return albums
+
+    def __prepare_artist_listitems(
+        self, artists: List[Dict[str, Any]], is_followed: bool = False
+    ) -> List[Dict[str, Any]]:
+        followed_artists = set()
+        if not is_followed:
+            followed_artists = set(self.__get_followed_artist_ids())
+
+        for artist in artists:
+            if not artist:
+                return []
+            if artist.get("artist"):
+                artist = artist["artist"]
+            if artist.get("images"):
+                artist["thumb"] = artist["images"][0]["url"]
+            else:
+                artist["thumb"] = "DefaultMusicArtists.png"
+
+            artist["url"] = self.__build_url(
+                {"action": "browse_artist_everything", "artistid": artist["id"]}
+            )
+
+            artist["genre"] = " / ".join(artist["genres"])
+            artist["rating"] = str(self.__get_track_rating(artist["popularity"]))
+            artist["followerslabel"] = f"{artist['followers']['total']} followers"
+            artist["followed"] = is_followed or artist["id"] in followed_artists
+
+        return artists
+
+    def __prepare_playlist_listitems(self, playlists: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        playlists2 = []
+        followed_playlists = set(self.__get_curuser_playlistids())
+
+        for playlist in playlists:
+            if not playlist:
+                continue
+
+            if playlist.get("images"):
+                playlist["thumb"] = playlist["images"][0]["url"]
+            else:
+                playlist["thumb"] = "DefaultMusicAlbums.png"
+
+            playlist["url"] = self.__build_url(
+                {
+                    "action": "browse_playlist",
+                    "playlistid": playlist["id"],
+                    "ownerid": playlist["owner"]["id"],
+                }
+            )
+
+            playlist["followed"] = playlist["id"] in followed_playlists
+            playlist["owned"] = playlist["owner"]["id"] == self.__userid
+
+            playlists2.append(playlist)
+
+        return playlists2
+
+    def get_artist_albums(self, artist_id: str, album_type: str) -> List[Dict[str, Any]]:
+        def get_page(offset: int) -> Dict[str, Any]:
+            return self.__spotipy.artist_albums(
+                artist_id,
+                album_type=album_type,
+                country=self.__user_country,
+                limit=PAGE_SIZE,
+                offset=offset,
+            )
+
+        artist_albums = get_page(0)
+        artist_albums["items"] = self.__pager.get_items(
+            lambda offset: get_page(offset)["items"],
+            artist_albums["total"],
+            PAGE_SIZE,
+            artist_albums["items"],
+        )
+        albumids = []
+        for album in artist_albums["items"]:
+            albumids.append(album["id"])
+
+        return self.__prepare_album_listitems(albumids)
+
+    def __get_saved_album_ids(self) -> List[str]:
+        albums = self.__spotipy.current_user_saved_albums(limit=1, offset=0)
+        cache_str = f"spotify-savedalbumids.{self.__userid}"
+        checksum = albums["total"]
+        cache = self.__cache.get(cache_str, checksum=checksum)
+        if cache:
+            return cache
+
+        album_ids = []
+        if albums and albums.get("items"):
+            albums["items"] = self.__pager.get_items(
+                lambda offset: self.__spotipy.current_user_saved_albums(
+                    limit=PAGE_SIZE, offset=offset
+                )["items"],
+                albums["total"],
+                PAGE_SIZE,
+                albums["items"],
+            )
+            self.__resolver.add_albums([album["album"] for album in albums["items"]])
+            for album in albums["items"]:
+                album_ids.append(album["album"]["id"])
+            self.__cache.set(cache_str, album_ids, checksum=checksum)
+
+        return album_ids
+
+    def get_saved_albums(self) -> List[Dict[str, Any]]:
+        return self.__prepare_album_listitems(self.__get_saved_album_ids())
+
+    def __get_saved_track_ids(self) -> List[str]:
+        saved_tracks = self.__spotipy.current_user_saved_tracks(
+            limit=1, offset=0, market=self.__user_country
+        )
+        total = saved_tracks["total"]
+        cache_str = f"spotify.savedtracksids.{self.__userid}"
+        cache = self.__cache.get(cache_str, checksum=total)
+        if cache:
+            return cache
+
+        # Get from api.
+        track_ids = []
+        saved_tracks["items"] = self.__pager.get_items(
+            lambda offset: self.__spotipy.current_user_saved_tracks(
+                limit=PAGE_SIZE, offset=offset, market=self.__user_country
+            )["items"],
+            total,
+            PAGE_SIZE,
+            saved_tracks["items"],
+        )
+        self.__resolver.add_tracks([track["track"] for track in saved_tracks["items"]])
+        for track in saved_tracks["items"]:
+            track_ids.append(track["track"]["id"])
+        self.__cache.set(cache_str, track_ids, checksum=total)
+
+        return track_ids
+
+    def get_saved_tracks(self) -> List[Dict[str, Any]]:
+        return self.__prepare_track_listitems(self.__get_saved_track_ids())
+
+    def get_saved_artists(self) -> List[Dict[str, Any]]:
+        saved_album_ids = self.__get_saved_album_ids()
+        followed_artist_ids = self.__get_followed_artist_ids()
+        cache_str = f"spotify.savedartistids.{self.__userid}"
+        checksum = len(saved_album_ids) + len(followed_artist_ids)
+        artist_ids = self.__cache.get(cache_str, checksum=checksum)
+        if not artist_ids:
+            artist_ids = []
+            # extract the artists from all saved albums
+            saved_albums = self.__resolver.get_albums(
+                self.__spotipy, saved_album_ids, self.__user_country
+            )
+            for item in saved_albums:
+                for artist in item["artists"]:
+                    if artist["id"] not in artist_ids:
+                        artist_ids.append(artist["id"])
+            # append artists that are followed
+            for artist_id in followed_artist_ids:
+                if artist_id not in artist_ids:
+                    artist_ids.append(artist_id)
+            self.__cache.set(cache_str, artist_ids, checksum=checksum)
+
+        return self.__prepare_artist_listitems(
+            self.__resolver.get_artists(self.__spotipy, artist_ids)
+        )
+
+    def __get_followed_artist_ids(self) -> List[str]:
+        artists = self.__spotipy.current_user_followed_artists(limit=50)
+        cache_str = f"spotify.followedartistids.{self.__userid}"
+        checksum = artists["artists"]["total"]
+
+        cache = self.__cache.get(cache_str, checksum=checksum)
+        if cache:
+            return cache
+
+        count = len(artists["artists"]["items"])
+        after = artists["artists"]["cursors"]["after"]
+        while artists["artists"]["total"] > count:
+            result = self.__spotipy.current_user_followed_artists(limit=50, after=after)
+            artists["artists"]["items"] += result["artists"]["items"]
+            after = result["artists"]["cursors"]["after"]
+            count += 50
+        self.__resolver.add_artists(artists["artists"]["items"])
+        artist_ids = [artist["id"] for artist in artists["artists"]["items"]]
+        self.__cache.set(cache_str, artist_ids, checksum=checksum)
+
+        return artist_ids
+
+    def get_followed_artists(self) -> List[Dict[str, Any]]:
+        return self.__prepare_artist_listitems(
+            self.__resolver.get_artists(self.__spotipy, self.__get_followed_artist_ids()),
+            is_followed=True,
+        )
+
+    def search(self, query: str) -> Dict[str, int]:
+        result = self.__spotipy.search(
+            q=f"{query}",
+            type="artist,album,track,playlist",
+            limit=1,
+            market=self.__user_country,
+        )
+        return {
+            "artists": result["artists"]["total"],
+            "playlists": result["playlists"]["total"],
+            "albums": result["albums"]["total"],
+            "tracks": result["tracks"]["total"],
+        }
+
+    def search_artists(self, query: str, limit: str, offset: str) -> Dict[str, Any]:
+        result = self.__spotipy.search(
+            q=f"artist:{query}",
+            type="artist",
+            limit=int(limit),
+            offset=int(offset),
+            market=self.__user_country,
+        )
+        return {
+            "items": self.__prepare_artist_listitems(result["artists"]["items"]),
+            "total": result["artists"]["total"],
+        }
+
+    def search_tracks(self, query: str, limit: str, offset: str) -> Dict[str, Any]:
+        result = self.__spotipy.search(
+            q=f"track:{query}",
+            type="track",
+            limit=int(limit),
+            offset=int(offset),
+            market=self.__user_country,
+        )
+        self.__resolver.add_tracks(result["tracks"]["items"])
+        return {
+            "items": self.__prepare_track_listitems(tracks=result["tracks"]["items"]),
+            "total": result["tracks"]["total"],
+        }
+
+    def search_albums(self, query: str, limit: str, offset: str) -> Dict[str, Any]:
+        result = self.__spotipy.search(
+            q=f"album:{query}",
+            type="album",
+            limit=int(limit),
+            offset=int(offset),
+            market=self.__user_country,
+        )
+        album_ids = []
+        for album in result["albums"]["items"]:
+            album_ids.append(album["id"])
+        return {
+            "items": self.__prepare_album_listitems(album_ids),
+            "total": result["albums"]["total"],
+        }
+
+    def search_playlists(self, query: str, limit: str, offset: str) -> Dict[str, Any]:
+        result = self.__spotipy.search(
+            q=query,
+            type="playlist",
+            limit=int(limit),
+            offset=int(offset),
+            market=self.__user_country,
+        )
+        return {
+            "items": self.__prepare_playlist_listitems(result["playlists"]["items"]),
+            "total": result["playlists"]["total"],
+        }
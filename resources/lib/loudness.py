@@ -0,0 +1,197 @@
+import math
+import os
+import sqlite3
+import threading
+from typing import Callable, List, Tuple, Union
+
+from xbmc import LOGDEBUG
+
+from decode_analyzer import DecodeAnalyzer
+from utils import ADDON_DATA_PATH, log_msg, log_exception
+
+try:
+    import numpy
+except ImportError:
+    # Kodi doesn't ship NumPy on every platform, so service normalization is optional.
+    numpy = None
+
+TRACK_LOUDNESS_DB_FILE = os.path.join(ADDON_DATA_PATH, "track-loudness.db")
+
+# Spotify's 'normal' loudness target.
+TARGET_LOUDNESS = -14.0
+
+# Spotty always outputs 16 bit, stereo, 44.1kHz PCM.
+LOUDNESS_NUM_CHANNELS = 2
+# BS.1770 style gating: 400ms blocks overlapping by 75%, built from 100ms sub-blocks.
+# There's no K-weighting filter, so the loudness is of the plain signal energy.
+LOUDNESS_SUB_BLOCK_FRAMES = 4410
+LOUDNESS_SUB_BLOCKS_PER_BLOCK = 4
+LOUDNESS_ABSOLUTE_GATE = -70.0
+LOUDNESS_RELATIVE_GATE = -10.0
+
+
+def is_loudness_analysis_available() -> bool:
+    return numpy is not None
+
+
+def get_normalization_gain(loudness: float, peak: float) -> float:
+    """the linear gain that takes a track to the target loudness - limited so its
+    peak doesn't clip"""
+    gain = math.pow(10.0, (TARGET_LOUDNESS - loudness) / 20.0)
+    if peak > 0.0:
+        gain = min(gain, 1.0 / peak)
+    return gain
+
+
+class LoudnessMeter(DecodeAnalyzer):
+    """Measures the integrated loudness and the sample peak of a track from a decode
+    fed in order from the start. The energy of each 100ms sub-block is computed for
+    whole chunks of 16 bit samples at once. When the decode is complete, 'finish'
+    gates the 400ms blocks and reports the (loudness, peak)."""
+
+    def __init__(self, track_id: str, on_measured: Callable[[str, Tuple[float, float]], None]):
+        self.__track_id = track_id
+        self.__on_measured = on_measured
+
+        self.__sub_block_size = LOUDNESS_SUB_BLOCK_FRAMES * 2 * LOUDNESS_NUM_CHANNELS
+        self.__pending = b""
+        self.__sub_block_energies: List = []
+        self.__peak = 0
+
+    def feed(self, data: Union[bytes, memoryview]) -> None:
+        data = self.__pending + data
+        num_sub_blocks = len(data) // self.__sub_block_size
+        if num_sub_blocks:
+            samples = numpy.frombuffer(
+                data, dtype="<i2", count=num_sub_blocks * self.__sub_block_size // 2
+            )
+            self.__peak = max(self.__peak, int(samples.max()), -int(samples.min()))
+            sub_blocks = samples.reshape(
+                num_sub_blocks, LOUDNESS_SUB_BLOCK_FRAMES, LOUDNESS_NUM_CHANNELS
+            ).astype(numpy.float64)
+            sub_blocks /= 32768.0
+            # The mean square of each channel, summed over the channels.
+            self.__sub_block_energies.append(numpy.square(sub_blocks).mean(axis=1).sum(axis=1))
+        self.__pending = data[num_sub_blocks * self.__sub_block_size :]
+
+    def finish(self) -> None:
+        loudness = self.__get_integrated_loudness()
+        if loudness is None:
+            log_msg(f"Track '{self.__track_id}' is too short or silent to measure.", LOGDEBUG)
+            return
+
+        peak = self.__peak / 32768.0
+        log_msg(f"Track '{self.__track_id}' loudness: {loudness:.1f}, peak: {peak:.3f}.", LOGDEBUG)
+        self.__on_measured(self.__track_id, (loudness, peak))
+
+    def __get_integrated_loudness(self) -> Union[float, None]:
+        if not self.__sub_block_energies:
+            return None
+        sub_block_energies = numpy.concatenate(self.__sub_block_energies)
+        if len(sub_block_energies) < LOUDNESS_SUB_BLOCKS_PER_BLOCK:
+            return None
+
+        block_energies = numpy.convolve(
+            sub_block_energies,
+            numpy.full(LOUDNESS_SUB_BLOCKS_PER_BLOCK, 1.0 / LOUDNESS_SUB_BLOCKS_PER_BLOCK),
+            "valid",
+        )
+        absolute_gate = self.__get_energy(LOUDNESS_ABSOLUTE_GATE)
+        block_energies = block_energies[block_energies > absolute_gate]
+        if not block_energies.size:
+            return None
+        relative_gate = self.__get_loudness(block_energies.mean()) + LOUDNESS_RELATIVE_GATE
+        block_energies = block_energies[block_energies > self.__get_energy(relative_gate)]
+
+        return self.__get_loudness(block_energies.mean())
+
+    @staticmethod
+    def __get_loudness(energy: float) -> float:
+        return -0.691 + 10.0 * math.log10(energy)
+
+    @staticmethod
+    def __get_energy(loudness: float) -> float:
+        return math.pow(10.0, (loudness + 0.691) / 10.0)
+
+
+class GainStage:
+    """Applies a gain to a stream of 16 bit pcm from audio offset 'begin', a chunk at
+    a time. A chunk ending mid sample keeps its last byte for the next chunk, and a
+    stream starting mid sample passes that sample's byte through."""
+
+    def __init__(self, begin: int = 0):
+        self.__lead = begin % 2
+        self.__pending = b""
+
+    def apply(self, data: bytes, gain: float) -> bytes:
+        lead = b""
+        if self.__lead and data:
+            lead, data, self.__lead = data[:1], data[1:], 0
+
+        data = self.__pending + data
+        num_bytes = len(data) - len(data) % 2
+        self.__pending = data[num_bytes:]
+        if gain == 1.0 or not num_bytes:
+            return lead + data[:num_bytes]
+
+        samples = numpy.frombuffer(data, dtype="<i2", count=num_bytes // 2)
+        scaled = numpy.rint(samples * numpy.float32(gain))
+        return lead + numpy.clip(scaled, -32768, 32767).astype("<i2").tobytes()
+
+    def flush(self) -> bytes:
+        data, self.__pending = self.__pending, b""
+        return data
+
+
+class TrackLoudnessStore:
+    """the measured (loudness, peak) of tracks, in a small sqlite database"""
+
+    def __init__(self, path: str = TRACK_LOUDNESS_DB_FILE):
+        self.__path = path
+        self.__connection: Union[sqlite3.Connection, None] = None
+        self.__lock = threading.Lock()
+
+        self.__open()
+
+    def get_loudness(self, track_id: str) -> Union[Tuple[float, float], None]:
+        with self.__lock:
+            if not self.__connection:
+                return None
+            row = self.__connection.execute(
+                "SELECT loudness, peak FROM track_loudness WHERE track_id = ?", (track_id,)
+            ).fetchone()
+            return (row[0], row[1]) if row else None
+
+    def set_loudness(self, track_id: str, loudness: Tuple[float, float]) -> None:
+        with self.__lock:
+            if not self.__connection:
+                return
+            try:
+                with self.__connection:
+                    self.__connection.execute(
+                        "INSERT OR REPLACE INTO track_loudness (track_id, loudness, peak)"
+                        " VALUES (?, ?, ?)",
+                        (track_id, loudness[0], loudness[1]),
+                    )
+            except sqlite3.Error as exc:
+                log_exception(exc, f"Could not save the loudness of track '{track_id}'")
+
+    def close(self) -> None:
+        with self.__lock:
+            if self.__connection:
+                self.__connection.close()
+                self.__connection = None
+
+    def __open(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.__path), exist_ok=True)
+            # Tracks are measured on the decode threads.
+            self.__connection = sqlite3.connect(self.__path, check_same_thread=False)
+            with self.__connection:
+                self.__connection.execute(
+                    "CREATE TABLE IF NOT EXISTS track_loudness"
+                    " (track_id TEXT PRIMARY KEY, loudness REAL NOT NULL, peak REAL NOT NULL)"
+                )
+        except sqlite3.Error as exc:
+            log_exception(exc, f"Could not open the track loudness database '{self.__path}'")
+            self.__connection = None
@@ -6,6 +6,7 @@
 """
 
 import time
+from typing import Union
 
 import xbmc
 import xbmcaddon
@@ -16,10 +17,12 @@ import spotty
 import utils
 from http_spotty_audio_streamer import HTTPSpottyAudioStreamer
 from http_video_player_setter import HttpVideoPlayerSetter
+from listing_engine import ListingEngine
 from save_recently_played import SaveRecentlyPlayed
 from spotty_auth import SpottyAuth
 from spotty_helper import SpottyHelper
 from string_ids import HTTP_VIDEO_RULE_ADDED_STR_ID
+from track_prefetcher import TrackPrefetcher
 from utils import ADDON_ID, PROXY_PORT, log_msg, log_exception
 
 SAVE_TO_RECENTLY_PLAYED_FILE = True
@@ -57,22 +60,52 @@ class MainService:
         add_http_video_rule()
 
         gap_between_tracks = int(SPOTIFY_ADDON.getSetting("gap_between_playlist_tracks"))
+        crossfade_secs = int(SPOTIFY_ADDON.getSetting("crossfade_secs"))
+        trim_silence = SPOTIFY_ADDON.getSetting("trim_silence").lower() == "true"
+        normalize_in_service = SPOTIFY_ADDON.getSetting("normalize_in_service").lower() == "true"
+        stream_sample_rate = int(SPOTIFY_ADDON.getSetting("stream_sample_rate"))
+        stream_bits_per_sample = int(SPOTIFY_ADDON.getSetting("stream_bits_per_sample"))
         use_spotify_normalization = (
             SPOTIFY_ADDON.getSetting("use_spotify_normalization").lower() == "true"
         )
         problem_with_terminate_streaming = (
             SPOTIFY_ADDON.getSetting("problem_with_terminate_streaming").lower() == "true"
         )
+        pcm_cache_size_mb = int(SPOTIFY_ADDON.getSetting("pcm_cache_size_mb"))
+        max_concurrent_decodes = int(SPOTIFY_ADDON.getSetting("max_concurrent_streams"))
         self.__http_spotty_streamer: HTTPSpottyAudioStreamer = HTTPSpottyAudioStreamer(
             self.__spotty,
             gap_between_tracks,
             use_spotify_normalization,
             problem_with_terminate_streaming,
+            pcm_cache_size_mb,
+            max_concurrent_decodes,
+            crossfade_secs,
+            trim_silence,
+            normalize_in_service,
+            stream_sample_rate,
+            stream_bits_per_sample,
         )
+        # Flac output needs a 'flac' or 'ffmpeg' binary, so its setting is only shown
+        # if there is one.
+        utils.cache_flac_encoder_available(self.__http_spotty_streamer.is_flac_available())
         self.__save_recently_played: SaveRecentlyPlayed = SaveRecentlyPlayed()
         self.__http_spotty_streamer.set_notify_track_finished(self.__save_track_to_recently_played)
 
+        self.__track_prefetcher: Union[TrackPrefetcher, None] = None
+        if SPOTIFY_ADDON.getSetting("prefetch_next_track").lower() == "true":
+            if pcm_cache_size_mb > 0:
+                self.__track_prefetcher = TrackPrefetcher(
+                    self.__http_spotty_streamer.prefetch_track,
+                    int(SPOTIFY_ADDON.getSetting("prefetch_secs_before_end")),
+                )
+            else:
+                log_msg("Next track prefetch needs the pcm cache. Prefetch is disabled.")
+
+        self.__listing_engine: ListingEngine = ListingEngine()
+
         bottle_manager.route_all(self.__http_spotty_streamer)
+        bottle_manager.route_all(self.__listing_engine)
 
     def __save_track_to_recently_played(self, track_id: str) -> None:
         if SAVE_TO_RECENTLY_PLAYED_FILE:
@@ -81,8 +114,12 @@ class MainService:
     def run(self) -> None:
         log_msg("Starting main service loop.")
 
-        bottle_manager.start_thread(PROXY_PORT)
-        log_msg(f"Started bottle with port {PROXY_PORT}.")
+        server_backend = SPOTIFY_ADDON.getSetting("server_backend")
+        bottle_manager.start_thread(PROXY_PORT, server_backend)
+        log_msg(f"Started bottle with port {PROXY_PORT}, {server_backend} server.")
+
+        if self.__track_prefetcher:
+            self.__track_prefetcher.start()
 
         self.__renew_token()
 
@@ -92,6 +129,13 @@ class MainService:
             loop_counter += 1
             if (loop_counter % 10) == 0:
                 log_msg(f"Main loop continuing. Loop counter: {loop_counter}.")
+                process_stats = self.__http_spotty_streamer.get_spotty_process_stats()
+                log_msg(f"Spotty process stats: {process_stats}.")
+                session_stats = self.__http_spotty_streamer.get_stream_session_stats()
+                log_msg(f"Stream session stats: {session_stats}.")
+                log_msg(f"Connection stats: {bottle_manager.get_connection_stats()}.")
+                log_msg(f"Spotify pager stats: {self.__listing_engine.get_pager_stats()}.")
+                log_msg(f"Spotify resolver stats: {self.__listing_engine.get_resolver_stats()}.")
 
             self.__http_spotty_streamer.use_normalization(
                 SPOTIFY_ADDON.getSetting("use_spotify_normalization").lower() == "true"
@@ -121,9 +165,12 @@ class MainService:
 
     def __close(self) -> None:
         log_msg("Shutdown requested.")
+        if self.__track_prefetcher:
+            self.__track_prefetcher.stop()
         self.__http_spotty_streamer.stop()
-        self.__spotty_helper.kill_all_spotties()
+        self.__spotty.get_spotty_supervisor().close()
         bottle_manager.stop_thread()
+        self.__listing_engine.close()
         log_msg("Main service stopped.")
 
     def __renew_token(self) -> None:
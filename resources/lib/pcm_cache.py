@@ -0,0 +1,365 @@
+import mmap
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Union
+
+from xbmc import LOGDEBUG, LOGWARNING
+
+from decode_analyzer import DecodeAnalyzer
+from spotty_supervisor import SpottySupervisor
+from utils import ADDON_DATA_PATH, bytes_to_megabytes, log_msg, log_exception
+
+PCM_CACHE_DIR_NAME = "pcm-cache"
+PCM_CACHE_DIR = os.path.join(ADDON_DATA_PATH, PCM_CACHE_DIR_NAME)
+PCM_FILE_EXT = ".pcm"
+# An empty marker next to a cache file that is still being written. The file itself
+# is never renamed, since readers have it open (which Windows won't rename).
+PCM_PART_MARKER_EXT = ".pcm.part"
+# Spotty's normalization changes the decoded pcm, so it's part of the cache key.
+PCM_NORMALIZED_KEY_EXT = ".normalized"
+PCM_RAW_KEY_EXT = ".raw"
+
+WAIT_FOR_DATA_TIMEOUT_IN_SECS = 1.0
+WRITE_CHUNK_SIZE = 65536
+
+
+def get_pcm_cache_key(track_id: str, is_normalized: bool) -> str:
+    return track_id + (PCM_NORMALIZED_KEY_EXT if is_normalized else PCM_RAW_KEY_EXT)
+
+
+def get_pcm_cache_track_id(key: str) -> Union[str, None]:
+    """the track id of a cache key - or None if it's not a key (e.g., a file name
+    from before the normalization was part of the key)"""
+    for ext in [PCM_NORMALIZED_KEY_EXT, PCM_RAW_KEY_EXT]:
+        if key.endswith(ext):
+            return key[: -len(ext)]
+    return None
+
+
+class PcmCacheEntry:
+    """decoded pcm for one track - readable while it's still being written"""
+
+    def __init__(self, key: str, track_id: str, path: str, length: int, complete: bool):
+        self.key = key
+        self.track_id = track_id
+        self.path = path
+        self.length = length
+
+        self.__written = length if complete else 0
+        self.__complete = complete
+        self.__failed = False
+        self.__num_readers = 0
+        self.__condition = threading.Condition()
+
+    def is_complete(self) -> bool:
+        return self.__complete
+
+    def is_failed(self) -> bool:
+        return self.__failed
+
+    def get_written(self) -> int:
+        return self.__written
+
+    def get_num_readers(self) -> int:
+        return self.__num_readers
+
+    def is_in_use(self) -> bool:
+        return self.__num_readers > 0 or not (self.__complete or self.__failed)
+
+    def add_written(self, num_bytes: int) -> None:
+        with self.__condition:
+            self.__written += num_bytes
+            self.__condition.notify_all()
+
+    def finish(self, ok: bool) -> None:
+        with self.__condition:
+            if ok:
+                self.__complete = True
+                self.length = self.__written
+            else:
+                self.__failed = True
+            self.__condition.notify_all()
+
+    def wait_for_data(self, offset: int, is_cancelled: Callable[[], bool]) -> int:
+        """wait until there is data past 'offset' or no more data is coming,
+        then return the number of bytes available"""
+        with self.__condition:
+            while self.__written <= offset and not (self.__complete or self.__failed):
+                if is_cancelled():
+                    break
+                self.__condition.wait(WAIT_FOR_DATA_TIMEOUT_IN_SECS)
+            return self.__written
+
+    def open_reader(self) -> "PcmCacheReader":
+        with self.__condition:
+            self.__num_readers += 1
+        return PcmCacheReader(self)
+
+    def close_reader(self) -> None:
+        with self.__condition:
+            self.__num_readers -= 1
+
+
+class PcmCacheReader:
+    """memory-mapped reads of a cache entry - remaps as an in-progress entry grows"""
+
+    def __init__(self, entry: PcmCacheEntry):
+        self.__entry = entry
+        self.__file = None
+        self.__mmap: Union[mmap.mmap, None] = None
+        self.__mapped_len = 0
+
+    def read(self, offset: int, size: int, available: int) -> bytes:
+        if available > self.__mapped_len:
+            self.__remap(available)
+        end = min(offset + size, self.__mapped_len)
+        return self.__mmap[offset:end]
+
+    def fileno(self) -> int:
+        self.__open()
+        return self.__file.fileno()
+
+    def __open(self) -> None:
+        if not self.__file:
+            self.__file = open(self.__entry.path, "rb")
+
+    def __remap(self, length: int) -> None:
+        if self.__mmap:
+            self.__mmap.close()
+        self.__open()
+        self.__mmap = mmap.mmap(self.__file.fileno(), length, access=mmap.ACCESS_READ)
+        self.__mapped_len = length
+
+    def close(self) -> None:
+        if self.__mmap:
+            self.__mmap.close()
+            self.__mmap = None
+        if self.__file:
+            self.__file.close()
+            self.__file = None
+        self.__entry.close_reader()
+
+
+class PcmCache:
+    """size-capped, LRU evicted, disk cache of decoded track pcm"""
+
+    def __init__(self, max_size_in_mb: int, cache_dir: str = PCM_CACHE_DIR):
+        self.__cache_dir = cache_dir
+        self.__max_size = max_size_in_mb * 1024 * 1024
+        self.__entries: OrderedDict[str, PcmCacheEntry] = OrderedDict()
+        self.__lock = threading.Lock()
+
+        self.__load_entries()
+
+    def is_enabled(self) -> bool:
+        return self.__max_size > 0
+
+    def get_entry(self, track_id: str, is_normalized: bool) -> Union[PcmCacheEntry, None]:
+        key = get_pcm_cache_key(track_id, is_normalized)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if not entry:
+                return None
+            if entry.is_failed():
+                self.__remove_entry(entry)
+                return None
+            self.__entries.move_to_end(key)
+
+        if entry.is_complete():
+            self.__touch(entry.path)
+        return entry
+
+    def create_entry(
+        self, track_id: str, is_normalized: bool, expected_length: int
+    ) -> Union[PcmCacheEntry, None]:
+        key = get_pcm_cache_key(track_id, is_normalized)
+        with self.__lock:
+            if expected_length > self.__max_size:
+                log_msg(f"Track '{track_id}' is too big to cache.", LOGDEBUG)
+                return None
+            self.__evict(self.__max_size - expected_length)
+
+            try:
+                open(self.__get_path(key, PCM_PART_MARKER_EXT), "wb").close()
+            except OSError as ex:
+                log_msg(f"Could not create cache file marker for '{track_id}': {ex}", LOGWARNING)
+                return None
+
+            entry = PcmCacheEntry(
+                key, track_id, self.__get_path(key, PCM_FILE_EXT), expected_length, False
+            )
+            self.__entries[key] = entry
+            return entry
+
+    def finish_entry(self, entry: PcmCacheEntry, ok: bool) -> None:
+        with self.__lock:
+            if ok:
+                # Any readers keep reading the same file, now complete.
+                self.__remove_part_marker(entry)
+            entry.finish(ok)
+            if not ok:
+                self.__remove_entry(entry)
+            self.__evict(self.__max_size)
+
+        log_msg(
+            f"Finished caching track '{entry.track_id}': ok = {ok},"
+            f" cache size = {bytes_to_megabytes(self.__get_total_size()):.1f}MB.",
+            LOGDEBUG,
+        )
+
+    def __load_entries(self) -> None:
+        if not self.is_enabled():
+            return
+
+        try:
+            os.makedirs(self.__cache_dir, exist_ok=True)
+
+            filenames = os.listdir(self.__cache_dir)
+            part_keys = set()
+            for filename in filenames:
+                if filename.endswith(PCM_PART_MARKER_EXT):
+                    part_keys.add(filename[: -len(PCM_PART_MARKER_EXT)])
+                    os.remove(os.path.join(self.__cache_dir, filename))
+
+            cached_files: Dict[str, os.stat_result] = {}
+            for filename in filenames:
+                path = os.path.join(self.__cache_dir, filename)
+                if filename.endswith(PCM_FILE_EXT):
+                    key = filename[: -len(PCM_FILE_EXT)]
+                    if key in part_keys:
+                        # Left over from an interrupted decode.
+                        os.remove(path)
+                    elif get_pcm_cache_track_id(key):
+                        cached_files[key] = os.stat(path)
+                    else:
+                        # Not known if spotty normalized it.
+                        os.remove(path)
+
+            # Least recently used first.
+            for key in sorted(cached_files, key=lambda k: cached_files[k].st_mtime):
+                self.__entries[key] = PcmCacheEntry(
+                    key,
+                    get_pcm_cache_track_id(key),
+                    self.__get_path(key, PCM_FILE_EXT),
+                    cached_files[key].st_size,
+                    True,
+                )
+
+            with self.__lock:
+                self.__evict(self.__max_size)
+
+            log_msg(
+                f"Loaded {len(self.__entries)} cached tracks from '{self.__cache_dir}'"
+                f" ({bytes_to_megabytes(self.__get_total_size()):.1f}MB).",
+                LOGDEBUG,
+            )
+        except Exception as exc:
+            log_exception(exc, "Could not load the pcm cache")
+
+    def __evict(self, max_size: int) -> None:
+        total_size = self.__get_total_size()
+        for entry in list(self.__entries.values()):
+            if total_size <= max_size:
+                break
+            if entry.is_in_use():
+                continue
+            total_size -= entry.length
+            self.__remove_entry(entry)
+            log_msg(f"Evicted track '{entry.track_id}' from the pcm cache.", LOGDEBUG)
+
+    def __remove_entry(self, entry: PcmCacheEntry) -> None:
+        if self.__entries.get(entry.key) is entry:
+            del self.__entries[entry.key]
+        try:
+            if os.path.exists(entry.path):
+                os.remove(entry.path)
+        except OSError as ex:
+            log_msg(f"Could not remove cache file '{entry.path}': {ex}", LOGWARNING)
+        self.__remove_part_marker(entry)
+
+    def __remove_part_marker(self, entry: PcmCacheEntry) -> None:
+        path = self.__get_path(entry.key, PCM_PART_MARKER_EXT)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as ex:
+            log_msg(f"Could not remove cache file marker '{path}': {ex}", LOGWARNING)
+
+    def __get_total_size(self) -> int:
+        return sum(entry.length for entry in self.__entries.values())
+
+    def __get_path(self, key: str, ext: str) -> str:
+        return os.path.join(self.__cache_dir, key + ext)
+
+    @staticmethod
+    def __touch(path: str) -> None:
+        # Keep the LRU order across service restarts.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+class PcmCacheWriter:
+    """copies a spotty decode into a cache entry on a background thread"""
+
+    def __init__(
+        self,
+        pcm_cache: PcmCache,
+        entry: PcmCacheEntry,
+        spotty_process: subprocess.Popen,
+        spotty_supervisor: SpottySupervisor,
+        analyzers: Union[List[DecodeAnalyzer], None] = None,
+    ):
+        self.__pcm_cache = pcm_cache
+        self.__entry = entry
+        self.__spotty_process = spotty_process
+        self.__spotty_supervisor = spotty_supervisor
+        self.__analyzers = analyzers or []
+        self.__cancelled = False
+        self.__thread = threading.Thread(target=self.__write, daemon=True)
+
+    def get_cache_entry(self) -> PcmCacheEntry:
+        return self.__entry
+
+    def is_running(self) -> bool:
+        return self.__thread.is_alive()
+
+    def start(self) -> None:
+        self.__thread.start()
+
+    def cancel(self) -> None:
+        self.__cancelled = True
+        self.__spotty_supervisor.cancel(self.__spotty_process)
+
+    def __write(self) -> None:
+        ok = False
+        try:
+            buffer = bytearray(WRITE_CHUNK_SIZE)
+            view = memoryview(buffer)
+            with open(self.__entry.path, "wb", buffering=0) as f:
+                while not self.__cancelled:
+                    # Spotty stdout is unbuffered, so readers get data as soon as
+                    # spotty outputs it.
+                    num_read = self.__spotty_process.stdout.readinto(buffer)
+                    if not num_read:
+                        break
+                    f.write(view[:num_read])
+                    self.__entry.add_written(num_read)
+                    for analyzer in self.__analyzers:
+                        analyzer.feed(view[:num_read])
+
+            return_code = self.__spotty_process.wait()
+            ok = not self.__cancelled and return_code == 0 and self.__entry.get_written() > 0
+            if ok:
+                for analyzer in self.__analyzers:
+                    analyzer.finish()
+        except Exception as exc:
+            log_exception(exc, f"Error caching track '{self.__entry.track_id}'")
+        finally:
+            self.__pcm_cache.finish_entry(self.__entry, ok)
+            # The supervisor reaps spotty.
+            self.__spotty_supervisor.cancel(self.__spotty_process)
+            self.__spotty_process.stdout.close()
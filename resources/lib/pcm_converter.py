@@ -0,0 +1,152 @@
+from typing import Iterator, Tuple
+
+try:
+    import numpy
+except ImportError:
+    # Kodi doesn't ship NumPy on every platform, so format conversion is optional.
+    numpy = None
+
+# Only upsampling - Kodi's own resampler is better at filtering a downsample.
+SUPPORTED_SAMPLE_RATES = [44100, 48000, 88200, 96000]
+SUPPORTED_BITS_PER_SAMPLE = [16, 24]
+
+
+def is_pcm_conversion_available() -> bool:
+    return numpy is not None
+
+
+class PcmFormat:
+    def __init__(self, sample_rate: int, bits_per_sample: int, num_channels: int):
+        self.sample_rate = sample_rate
+        self.bits_per_sample = bits_per_sample
+        self.num_channels = num_channels
+        self.block_align = num_channels * (bits_per_sample // 8)
+        self.byte_rate = sample_rate * self.block_align
+
+    def get_data_length(self, duration: float) -> int:
+        """exact pcm length, in whole sample frames, of a duration in seconds with
+        millisecond precision"""
+        duration_ms = round(duration * 1000)
+        num_sample_frames = (duration_ms * self.sample_rate + 500) // 1000
+        return num_sample_frames * self.block_align
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PcmFormat) and (
+            (self.sample_rate, self.bits_per_sample, self.num_channels)
+            == (other.sample_rate, other.bits_per_sample, other.num_channels)
+        )
+
+    def __str__(self) -> str:
+        return f"{self.sample_rate}Hz/{self.bits_per_sample}bit/{self.num_channels}ch"
+
+
+class PcmConverter:
+    """Streaming 16 bit pcm to another sample rate and bit depth. Each output sample
+    frame is a cubic (Catmull-Rom) interpolation of the four input frames around its
+    position, computed for whole blocks of frames at once. An output frame depends
+    only on its position, so a range of the output can be converted from just the
+    matching range of the input, and is the same as in a full conversion."""
+
+    def __init__(self, in_format: PcmFormat, out_format: PcmFormat):
+        self.__in_format = in_format
+        self.__out_format = out_format
+
+    def get_output_length(self, in_length: int) -> int:
+        in_frames = in_length // self.__in_format.block_align
+        out_frames = in_frames * self.__out_format.sample_rate // self.__in_format.sample_rate
+        return out_frames * self.__out_format.block_align
+
+    def get_input_range(self, out_begin: int, out_len: int, in_length: int) -> Tuple[int, int]:
+        """the (begin, end) of the input needed to convert an output range"""
+        first_frame = out_begin // self.__out_format.block_align
+        last_frame = (out_begin + out_len - 1) // self.__out_format.block_align
+        in_frames = in_length // self.__in_format.block_align
+        in_first = max(0, self.__get_input_frame(first_frame) - 1)
+        in_end = min(in_frames, self.__get_input_frame(last_frame) + 3)
+        return in_first * self.__in_format.block_align, in_end * self.__in_format.block_align
+
+    def convert(
+        self, in_frames: Iterator[bytes], in_begin: int, out_begin: int, out_len: int
+    ) -> Iterator[bytes]:
+        """convert the output range from the input frames starting at 'in_begin' (as
+        given by 'get_input_range')"""
+        in_align = self.__in_format.block_align
+        out_align = self.__out_format.block_align
+        num_channels = self.__in_format.num_channels
+
+        frame = out_begin // out_align
+        skip = out_begin % out_align
+        end_frame = (out_begin + out_len + out_align - 1) // out_align
+        out_remaining = out_len
+
+        buffer = numpy.zeros((0, num_channels), dtype=numpy.float32)
+        buffer_begin = in_begin // in_align
+        pending = b""
+        for data in in_frames:
+            pending += data
+            num_frames = len(pending) // in_align
+            if not num_frames:
+                continue
+            samples = numpy.frombuffer(pending, dtype="<i2", count=num_frames * num_channels)
+            buffer = numpy.concatenate(
+                (buffer, samples.reshape(num_frames, num_channels).astype(numpy.float32))
+            )
+            pending = pending[num_frames * in_align :]
+
+            # The output frames whose four input frames are all in the buffer.
+            limit_frame = min(end_frame, self.__get_output_limit(buffer_begin + len(buffer)))
+            if limit_frame > frame:
+                out_data = self.__interpolate(buffer, buffer_begin, frame, limit_frame)
+                out_data = out_data[skip : skip + out_remaining]
+                skip = 0
+                out_remaining -= len(out_data)
+                yield out_data
+                frame = limit_frame
+
+            # Keep the input from the frame before the next output's position.
+            keep_begin = max(buffer_begin, self.__get_input_frame(frame) - 1)
+            buffer = buffer[keep_begin - buffer_begin :]
+            buffer_begin = keep_begin
+
+        if frame < end_frame and out_remaining > 0:
+            # Past the end of the input is silence.
+            num_zero_frames = self.__get_input_frame(end_frame) + 3 - buffer_begin - len(buffer)
+            buffer = numpy.concatenate(
+                (buffer, numpy.zeros((max(0, num_zero_frames), num_channels), numpy.float32))
+            )
+            out_data = self.__interpolate(buffer, buffer_begin, frame, end_frame)
+            yield out_data[skip : skip + out_remaining]
+
+    def __get_input_frame(self, out_frame: int) -> int:
+        return out_frame * self.__in_format.sample_rate // self.__out_format.sample_rate
+
+    def __get_output_limit(self, in_end_frame: int) -> int:
+        # The first output frame needing the input frame at 'in_end_frame' (or later).
+        in_rate, out_rate = self.__in_format.sample_rate, self.__out_format.sample_rate
+        return max(0, ((in_end_frame - 2) * out_rate + in_rate - 1) // in_rate)
+
+    def __interpolate(self, buffer, buffer_begin: int, first_frame: int, end_frame: int) -> bytes:
+        in_rate, out_rate = self.__in_format.sample_rate, self.__out_format.sample_rate
+        positions = numpy.arange(first_frame, end_frame, dtype=numpy.int64) * in_rate
+        indexes = positions // out_rate - buffer_begin
+        fractions = ((positions % out_rate) / out_rate).astype(numpy.float32)[:, numpy.newaxis]
+
+        # The frame before the start of the track is silence.
+        before = numpy.where(
+            (indexes > 0)[:, numpy.newaxis], buffer[numpy.maximum(indexes - 1, 0)], 0.0
+        )
+        y0, y1, y2 = buffer[indexes], buffer[indexes + 1], buffer[indexes + 2]
+        c1 = 0.5 * (y1 - before)
+        c2 = before - 2.5 * y0 + 2.0 * y1 - 0.5 * y2
+        c3 = 0.5 * (y2 - before) + 1.5 * (y0 - y1)
+        out_samples = ((c3 * fractions + c2) * fractions + c1) * fractions + y0
+
+        return self.__quantize(out_samples)
+
+    def __quantize(self, samples) -> bytes:
+        if self.__out_format.bits_per_sample == 16:
+            return numpy.clip(numpy.rint(samples), -32768, 32767).astype("<i2").tobytes()
+
+        scaled = numpy.clip(numpy.rint(samples * 256.0), -8388608, 8388607).astype("<i4")
+        # Little endian 24 bit samples are the low three bytes of each 32 bit one.
+        return scaled.view(numpy.uint8).reshape(-1, 4)[:, :3].tobytes()
@@ -1,9 +1,8 @@
-import math
 import os
 import sys
 import time
 import urllib.parse
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Tuple
 
 import xbmc
 import xbmcaddon
@@ -11,15 +10,15 @@ import xbmcgui
 import xbmcplugin
 import xbmcvfs
 
-import main_service
-import simplecache
 import spotipy
 import spotty
 import utils
+from context_menus import ContextMenuBuilder
 from spotty_auth import SpottyAuth
 from spotty_helper import SpottyHelper
+from listing_client import get_listing, request_listing
 from string_ids import *
-from utils import ADDON_ID, PROXY_PORT, log_exception, log_msg, get_chunks
+from utils import ADDON_ID, PROXY_PORT, is_flac_encoder_available, log_exception, log_msg
 
 MUSIC_ARTISTS_ICON = "icon_music_artists.png"
 MUSIC_TOP_ARTISTS_ICON = "icon_music_top_artists.png"
@@ -32,19 +31,14 @@ MUSIC_SEARCH_ICON = "icon_music_search.png"
 MUSIC_EXPLORE_ICON = "icon_music_explore.png"
 CLEAR_CACHE_ICON = "icon_clear_cache.png"
 
-Playlist = Dict[str, Union[str, Dict[str, List[Any]]]]
-
 
 class PluginContent:
     __addon: xbmcaddon.Addon = xbmcaddon.Addon(id=ADDON_ID)
-    __win: xbmcgui.Window = xbmcgui.Window(utils.ADDON_WINDOW_ID)
     __addon_icon_path = os.path.join(__addon.getAddonInfo("path"), "resources")
+    __context_menus: ContextMenuBuilder = ContextMenuBuilder(__addon)
     __action = ""
     __spotty: spotty.Spotty = None
     __spotipy: spotipy.Spotify = None
-    __userid = ""
-    __username = ""
-    __user_country = ""
     __offset = 0
     __playlist_id = ""
     __album_id = ""
@@ -58,15 +52,12 @@ class PluginContent:
     __params = {}
     __base_url = sys.argv[0]
     __addon_handle = int(sys.argv[1])
-    __cached_checksum = ""
     __last_playlist_position = 0
 
     def __init__(self):
         try:
             # logging.basicConfig(level=logging.DEBUG)
 
-            self.cache: simplecache.SimpleCache = simplecache.SimpleCache(ADDON_ID)
-
             self.append_artist_to_title: bool = (
                 self.__addon.getSetting("appendArtistToTitle") == "true"
             )
@@ -75,6 +66,9 @@ class PluginContent:
             self.default_view_playlists: str = self.__addon.getSetting("playlistDefaultView")
             self.default_view_albums: str = self.__addon.getSetting("albumDefaultView")
             self.default_view_category: str = self.__addon.getSetting("categoryDefaultView")
+            self.__stream_flac: bool = (
+                self.__addon.getSetting("stream_flac") == "true" and is_flac_encoder_available()
+            )
 
             self.__spotty: spotty.Spotty = spotty.get_spotty(SpottyHelper())
 
@@ -89,7 +83,7 @@ class PluginContent:
             else:
                 log_msg("Browsing main and setting up precache library.")
                 self.__browse_main()
-                self.__precache_library()
+                request_listing("precache")
 
         except Exception as exc:
             log_exception(exc, "PluginContent init error")
@@ -114,10 +108,9 @@ class PluginContent:
         self.init_spotipy(auth_token)
 
     def init_spotipy(self, auth_token: str) -> None:
+        # Listings come from the service's listing engine. This client is only for
+        # authentication and the actions that change the user's library.
         self.__spotipy: spotipy.Spotify = spotipy.Spotify(auth=auth_token)
-        self.__userid: str = self.__spotipy.me()["id"]
-        self.__username: str = self.__spotipy.me()["email"]
-        self.__user_country = self.__spotipy.me()["country"]
 
     def authenticate_plugin_after_login_failure(self) -> None:
         self.authenticate_plugin(
@@ -136,17 +129,17 @@ class PluginContent:
         zeroconf_auth = spotty_auth.start_zeroconf_authenticate()
         if zeroconf_auth is None:
             dialog.ok(dialog_title, self.get_zeroconf_program_failed_msg(spotty_auth))
-            main_service.abort_main_service = True
+            utils.abort_main_service = True
             utils.kill_this_plugin()
             return
 
         dialog.ok(dialog_title, instructions)
 
-        zeroconf_auth.terminate()
+        self.__spotty.get_spotty_supervisor().cancel(zeroconf_auth)
 
         if not spotty_auth.zeroconf_authenticated_ok():
             dialog.ok(dialog_title, self.get_zeroconf_authentication_failed_msg(spotty_auth))
-            main_service.abort_main_service = True
+            utils.abort_main_service = True
             utils.kill_this_plugin()
             return
 
@@ -160,7 +153,7 @@ class PluginContent:
 
         max_str_len = len(max(msg.split("\n"), key=len))
         blanks = " " * (int(max_str_len / 2) - 1)
-        msg += f"\n\n{blanks}'{self.__username}'."
+        msg += f"\n\n{blanks}'{self.__spotipy.me()['email']}'."
 
         return msg
 
@@ -211,38 +204,6 @@ class PluginContent:
         if filt:
             self.__filter = filt[0]
 
-    def __cache_checksum(self, opt_value: Any = None) -> str:
-        """simple cache checksum based on a few most important values"""
-        result = self.__cached_checksum
-        if not result:
-            # log_msg("__cached_checksum not found. Getting a new one.")
-            saved_tracks = self.__get_saved_track_ids()
-            saved_albums = self.__get_saved_album_ids()
-            followed_artists = self.__get_followed_artists()
-            generic_checksum = self.__addon.getSetting("cache_checksum")
-            result = (
-                f"{len(saved_tracks)}-{len(saved_albums)}-{len(followed_artists)}"
-                f"-{generic_checksum}"
-            )
-            self.__cached_checksum = result
-            # log_msg(f"New __cached_checksum = '{self.__cached_checksum}'.")
-
-        if opt_value:
-            result += f"-{opt_value}"
-
-        return result
-
-    def __build_url(self, query: Dict[str, str]) -> str:
-        query_encoded = {}
-        for key, value in list(query.items()):
-            if isinstance(key, str):
-                key = key.encode("utf-8")
-            if isinstance(value, str):
-                value = value.encode("utf-8")
-            query_encoded[key] = value
-
-        return self.__base_url + "?" + urllib.parse.urlencode(query_encoded)
-
     def delete_cache_db(self) -> None:
         log_msg("Deleting plugin cache...")
         simple_db_cache_addon = xbmcaddon.Addon(ADDON_ID)
@@ -250,6 +211,9 @@ class PluginContent:
         db_file = xbmcvfs.translatePath(f"{db_path}/simplecache.db")
         os.remove(db_file)
         log_msg(f"Deleted simplecache database file {db_file}.")
+        # The service holds the entity store open, so it clears it.
+        get_listing("clear_entities")
+        log_msg("Cleared the entity store.")
 
         dialog = xbmcgui.Dialog()
         header = self.__addon.getAddonInfo("name")
@@ -261,8 +225,10 @@ class PluginContent:
         log_msg(f"New cache_checksum = '{self.__addon.getSetting('cache_checksum')}'")
         xbmc.executebuiltin("Container.Refresh")
 
-    def __add_track_listitems(self, tracks, append_artist_to_label: bool = False) -> None:
-        list_items = self.__get_track_list(tracks, append_artist_to_label)
+    def __add_track_listitems(
+        self, tracks, append_artist_to_label: bool = False, playlist: Dict[str, Any] = None
+    ) -> None:
+        list_items = self.__get_track_list(tracks, append_artist_to_label, playlist)
         xbmcplugin.addDirectoryItems(self.__addon_handle, list_items, totalItems=len(list_items))
 
     @staticmethod
@@ -271,24 +237,22 @@ class PluginContent:
             return track["name"]
         return f"{track['artist']} - {track['name']}"
 
-    @staticmethod
-    def __get_track_rating(popularity: int) -> int:
-        if not popularity:
-            return 0
-
-        return int(math.ceil(popularity * 6 / 100.0)) - 1
-
     def __get_track_list(
-        self, tracks, append_artist_to_label: bool = False
+        self, tracks, append_artist_to_label: bool = False, playlist: Dict[str, Any] = None
     ) -> List[Tuple[str, xbmcgui.ListItem, bool]]:
         list_items = []
         for count, track in enumerate(tracks):
-            list_items.append(self.__get_track_item(track, append_artist_to_label) + (False,))
+            list_items.append(
+                self.__get_track_item(track, append_artist_to_label, playlist) + (False,)
+            )
 
         return list_items
 
     def __get_track_item(
-        self, track: Dict[str, Any], append_artist_to_label: bool = False
+        self,
+        track: Dict[str, Any],
+        append_artist_to_label: bool = False,
+        playlist: Dict[str, Any] = None,
     ) -> Tuple[str, xbmcgui.ListItem]:
         duration = track["duration_ms"] / 1000
         label = self.__get_track_name(track, append_artist_to_label)
@@ -296,6 +260,8 @@ class PluginContent:
 
         # Local playback by using proxy on this machine.
         url = f"http://localhost:{PROXY_PORT}/track/{track['id']}/{duration}"
+        if self.__stream_flac:
+            url += "?fmt=flac"
 
         li = xbmcgui.ListItem(label, offscreen=True)
         li.setProperty("isPlayable", "true")
@@ -315,7 +281,7 @@ class PluginContent:
         li.setArt({"thumb": track["thumb"]})
         li.setProperty("spotifytrackid", track["id"])
         li.setContentLookup(False)
-        li.addContextMenuItems(track["contextitems"], True)
+        li.addContextMenuItems(self.__context_menus.get_track_menu(track, playlist), True)
         li.setProperty("do_not_analyze", "true")
         li.setMimeType("audio/wave")
 
@@ -384,8 +350,7 @@ class PluginContent:
         items = [
             (
                 xbmc.getLocalizedString(KODI_PLAYLISTS_STR_ID),
-                f"plugin://{ADDON_ID}/"
-                f"?action={self.browse_playlists.__name__}&ownerid={self.__userid}",
+                f"plugin://{ADDON_ID}/" f"?action={self.browse_playlists.__name__}",
                 MUSIC_PLAYLISTS_ICON,
             ),
             (
@@ -435,20 +400,7 @@ class PluginContent:
 
     def browse_top_artists(self) -> None:
         xbmcplugin.setContent(self.__addon_handle, "artists")
-        result = self.__spotipy.current_user_top_artists(limit=20, offset=0)
-
-        cache_str = f"spotify.topartists.{self.__userid}"
-        checksum = self.__cache_checksum(result["total"])
-        items = self.cache.get(cache_str, checksum=checksum)
-        if not items:
-            count = len(result["items"])
-            while result["total"] > count:
-                result["items"] += self.__spotipy.current_user_top_artists(limit=20, offset=count)[
-                    "items"
-                ]
-                count += 50
-            items = self.__prepare_artist_listitems(result["items"])
-            self.cache.set(cache_str, items, checksum=checksum)
+        items = get_listing("top_artists")["items"]
         self.__add_artist_listitems(items)
 
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
@@ -458,18 +410,7 @@ class PluginContent:
 
     def browse_top_tracks(self) -> None:
         xbmcplugin.setContent(self.__addon_handle, "songs")
-        results = self.__spotipy.current_user_top_tracks(limit=20, offset=0)
-
-        cache_str = f"spotify.toptracks.{self.__userid}"
-        checksum = self.__cache_checksum(results["total"])
-        tracks = self.cache.get(cache_str, checksum=checksum)
-        if not tracks:
-            tracks = results["items"]
-            while results["next"]:
-                results = self.__spotipy.next(results)
-                tracks.extend(results["items"])
-            tracks = self.__prepare_track_listitems(tracks=tracks)
-            self.cache.set(cache_str, tracks, checksum=checksum)
+        tracks = get_listing("top_tracks")["items"]
         self.__add_track_listitems(tracks, True)
 
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
@@ -477,35 +418,6 @@ class PluginContent:
         if self.default_view_songs:
             xbmc.executebuiltin(f"Container.SetViewMode({self.default_view_songs})")
 
-    def __get_explore_categories(self) -> List[Tuple[Any, str, Union[str, Any]]]:
-        items = []
-
-        categories = self.__spotipy.categories(
-            country=self.__user_country, limit=50, locale=self.__user_country
-        )
-        count = len(categories["categories"]["items"])
-        while categories["categories"]["total"] > count:
-            categories["categories"]["items"] += self.__spotipy.categories(
-                country=self.__user_country, limit=50, offset=count, locale=self.__user_country
-            )["categories"]["items"]
-            count += 50
-
-        for item in categories["categories"]["items"]:
-            thumb = "DefaultMusicGenre.png"
-            for icon in item["icons"]:
-                thumb = icon["url"]
-                break
-            items.append(
-                (
-                    item["name"],
-                    f"plugin://{ADDON_ID}/"
-                    f"?action={self.browse_category.__name__}&applyfilter={item['id']}",
-                    thumb,
-                )
-            )
-
-        return items
-
     def browse_main_explore(self) -> None:
         # Explore nodes.
         xbmcplugin.setContent(self.__addon_handle, "files")
@@ -527,7 +439,7 @@ class PluginContent:
         ]
 
         # Add categories.
-        items += self.__get_explore_categories()
+        items += get_listing("explore_categories")["items"]
         for item in items:
             li = xbmcgui.ListItem(item[0], path=item[1])
             li.setProperty("do_not_analyze", "true")
@@ -541,32 +453,12 @@ class PluginContent:
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
         xbmcplugin.endOfDirectory(handle=self.__addon_handle)
 
-    def __get_album_tracks(self, album: Dict[str, Any]) -> List[Dict[str, Any]]:
-        cache_str = f"spotify.albumtracks{album['id']}"
-        checksum = self.__cache_checksum()
-
-        album_tracks = self.cache.get(cache_str, checksum=checksum)
-        if not album_tracks:
-            track_ids = []
-            count = 0
-            while album["tracks"]["total"] > count:
-                tracks = self.__spotipy.album_tracks(
-                    album["id"], market=self.__user_country, limit=50, offset=count
-                )["items"]
-                for track in tracks:
-                    track_ids.append(track["id"])
-                count += 50
-            album_tracks = self.__prepare_track_listitems(track_ids, album_details=album)
-            self.cache.set(cache_str, album_tracks, checksum=checksum)
-
-        return album_tracks
-
     def browse_album(self) -> None:
         xbmcplugin.setContent(self.__addon_handle, "songs")
-        album = self.__spotipy.album(self.__album_id, market=self.__user_country)
+        album = get_listing("album", albumid=self.__album_id)
         xbmcplugin.setProperty(self.__addon_handle, "FolderName", album["name"])
-        tracks = self.__get_album_tracks(album)
-        if album.get("album_type") == "compilation":
+        tracks = album["tracks"]
+        if album["album_type"] == "compilation":
             self.__add_track_listitems(tracks, True)
         else:
             self.__add_track_listitems(tracks)
@@ -587,8 +479,7 @@ class PluginContent:
             "FolderName",
             self.__addon.getLocalizedString(ARTIST_TOP_TRACKS_STR_ID),
         )
-        tracks = self.__spotipy.artist_top_tracks(self.__artist_id, country=self.__user_country)
-        tracks = self.__prepare_track_listitems(tracks=tracks["tracks"])
+        tracks = get_listing("artist_top_tracks", artistid=self.__artist_id)["items"]
         self.__add_track_listitems(tracks)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_TRACKNUM)
@@ -606,57 +497,18 @@ class PluginContent:
             "FolderName",
             self.__addon.getLocalizedString(RELATED_ARTISTS_STR_ID),
         )
-        cache_str = f"spotify.relatedartists.{self.__artist_id}"
-        checksum = self.__cache_checksum()
-        artists = self.cache.get(cache_str, checksum=checksum)
-        if not artists:
-            artists = self.__spotipy.artist_related_artists(self.__artist_id)
-            artists = self.__prepare_artist_listitems(artists["artists"])
-            self.cache.set(cache_str, artists, checksum=checksum)
+        artists = get_listing("related_artists", artistid=self.__artist_id)["items"]
         self.__add_artist_listitems(artists)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
         xbmcplugin.endOfDirectory(handle=self.__addon_handle)
         if self.default_view_artists:
             xbmc.executebuiltin(f"Container.SetViewMode({self.default_view_artists})")
 
-    def __get_playlist_details(self, playlist_id: str) -> Playlist:
-        playlist = self.__spotipy.playlist(
-            playlist_id, fields="tracks(total),name,owner(id),id", market=self.__user_country
-        )
-        # Get from cache first.
-        cache_str = f"spotify.playlistdetails.{playlist['id']}"
-        checksum = self.__cache_checksum(playlist["tracks"]["total"])
-        # log_msg(f"Playlist cache_str = '{cache_str}', checksum = '{checksum}'.")
-        playlist_details = self.cache.get(cache_str, checksum=checksum)
-        if not playlist_details:
-            # Get listing from api.
-            count = 0
-            playlist_details = playlist
-            playlist_details["tracks"]["items"] = []
-            while playlist["tracks"]["total"] > count:
-                playlist_details["tracks"]["items"] += self.__spotipy.playlist_items(
-                    playlist["id"],
-                    market=self.__user_country,
-                    fields="",
-                    limit=50,
-                    offset=count,
-                )["items"]
-                count += 50
-            playlist_details["tracks"]["items"] = self.__prepare_track_listitems(
-                tracks=playlist_details["tracks"]["items"], playlist_details=playlist
-            )
-            # log_msg(f"playlist_details = {playlist_details}")
-            checksum = self.__cache_checksum(playlist["tracks"]["total"])
-            self.cache.set(cache_str, playlist_details, checksum=checksum)
-            # log_msg(f"Got new playlist - checksum = '{checksum}'")
-
-        return playlist_details
-
     def browse_playlist(self) -> None:
         xbmcplugin.setContent(self.__addon_handle, "songs")
-        playlist_details = self.__get_playlist_details(self.__playlist_id)
+        playlist_details = get_listing("playlist", playlistid=self.__playlist_id)
         xbmcplugin.setProperty(self.__addon_handle, "FolderName", playlist_details["name"])
-        self.__add_track_listitems(playlist_details["tracks"]["items"], True)
+        self.__add_track_listitems(playlist_details["tracks"]["items"], True, playlist_details)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
         xbmcplugin.endOfDirectory(handle=self.__addon_handle)
         if self.default_view_songs:
@@ -664,14 +516,14 @@ class PluginContent:
 
     def play_playlist(self) -> None:
         """play entire playlist"""
-        playlist_details = self.__get_playlist_details(self.__playlist_id)
+        playlist_details = get_listing("playlist", playlistid=self.__playlist_id)
         log_msg(f"Start playing playlist '{playlist_details['name']}'.")
 
         kodi_playlist = xbmc.PlayList(0)
         kodi_playlist.clear()
 
         def add_to_playlist(trk) -> None:
-            url, li = self.__get_track_item(trk, True)
+            url, li = self.__get_track_item(trk, True, playlist_details)
             kodi_playlist.add(url, li)
 
         # Add first track and start playing.
@@ -683,29 +535,9 @@ class PluginContent:
         for track in playlist_details["tracks"]["items"][1:]:
             add_to_playlist(track)
 
-    def __get_category(self, categoryid: str) -> Playlist:
-        category = self.__spotipy.category(
-            categoryid, country=self.__user_country, locale=self.__user_country
-        )
-        playlists = self.__spotipy.category_playlists(
-            categoryid, country=self.__user_country, limit=50, offset=0
-        )
-        playlists["category"] = category["name"]
-        count = len(playlists["playlists"]["items"])
-        while playlists["playlists"]["total"] > count:
-            playlists["playlists"]["items"] += self.__spotipy.category_playlists(
-                categoryid, country=self.__user_country, limit=50, offset=count
-            )["playlists"]["items"]
-            count += 50
-        playlists["playlists"]["items"] = self.__prepare_playlist_listitems(
-            playlists["playlists"]["items"]
-        )
-
-        return playlists
-
     def browse_category(self) -> None:
         xbmcplugin.setContent(self.__addon_handle, "files")
-        playlists = self.__get_category(self.__filter)
+        playlists = get_listing("category", categoryid=self.__filter)
         self.__add_playlist_listitems(playlists["playlists"]["items"])
         xbmcplugin.setProperty(self.__addon_handle, "FolderName", playlists["category"])
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
@@ -740,7 +572,8 @@ class PluginContent:
             kb.doModal()
             if kb.isConfirmed():
                 name = kb.getText()
-                playlist = self.__spotipy.user_playlist_create(self.__userid, name, False)
+                userid = self.__spotipy.me()["id"]
+                playlist = self.__spotipy.user_playlist_create(userid, name, False)
                 self.__spotipy.playlist_add_items(playlist["id"], [self.__track_id])
         elif select != -1:
             playlist = own_playlists[select]
@@ -787,73 +620,17 @@ class PluginContent:
         xbmcplugin.endOfDirectory(handle=self.__addon_handle)
         self.refresh_listing()
 
-    def __get_featured_playlists(self) -> Playlist:
-        playlists = self.__spotipy.featured_playlists(
-            country=self.__user_country, limit=50, offset=0
-        )
-        count = len(playlists["playlists"]["items"])
-        total = playlists["playlists"]["total"]
-        while total > count:
-            playlists["playlists"]["items"] += self.__spotipy.featured_playlists(
-                country=self.__user_country, limit=50, offset=count
-            )["playlists"]["items"]
-            count += 50
-        playlists["playlists"]["items"] = self.__prepare_playlist_listitems(
-            playlists["playlists"]["items"]
-        )
-
-        return playlists
-
-    def __get_user_playlists(self, userid):
-        playlists = self.__spotipy.user_playlists(userid, limit=1, offset=0)
-        count = len(playlists["items"])
-        total = playlists["total"]
-        cache_str = f"spotify.userplaylists.{userid}"
-        checksum = self.__cache_checksum(total)
-
-        cache = self.cache.get(cache_str, checksum=checksum)
-        if cache:
-            playlists = cache
-        else:
-            while total > count:
-                playlists["items"] += self.__spotipy.user_playlists(userid, limit=50, offset=count)[
-                    "items"
-                ]
-                count += 50
-            playlists = self.__prepare_playlist_listitems(playlists["items"])
-            self.cache.set(cache_str, playlists, checksum=checksum)
-
-        return playlists
-
-    def __get_curuser_playlistids(self) -> List[str]:
-        playlists = self.__spotipy.current_user_playlists(limit=1, offset=0)
-        count = len(playlists["items"])
-        total = playlists["total"]
-        cache_str = f"spotify.userplaylistids.{self.__userid}"
-        playlist_ids = self.cache.get(cache_str, checksum=total)
-        if not playlist_ids:
-            playlist_ids = []
-            while total > count:
-                playlists["items"] += self.__spotipy.current_user_playlists(limit=50, offset=count)[
-                    "items"
-                ]
-                count += 50
-            for playlist in playlists["items"]:
-                playlist_ids.append(playlist["id"])
-            self.cache.set(cache_str, playlist_ids, checksum=total)
-        return playlist_ids
-
     def browse_playlists(self) -> None:
         xbmcplugin.setContent(self.__addon_handle, "files")
         if self.__filter == "featured":
-            playlists = self.__get_featured_playlists()
+            playlists = get_listing("featured_playlists")
             xbmcplugin.setProperty(self.__addon_handle, "FolderName", playlists["message"])
             playlists = playlists["playlists"]["items"]
         else:
             xbmcplugin.setProperty(
                 self.__addon_handle, "FolderName", xbmc.getLocalizedString(KODI_PLAYLISTS_STR_ID)
             )
-            playlists = self.__get_user_playlists(self.__owner_id)
+            playlists = get_listing("user_playlists", ownerid=self.__owner_id)["items"]
 
         self.__add_playlist_listitems(playlists)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
@@ -861,22 +638,6 @@ class PluginContent:
         if self.default_view_playlists:
             xbmc.executebuiltin(f"Container.SetViewMode({self.default_view_playlists})")
 
-    def __get_new_releases(self):
-        albums = self.__spotipy.new_releases(country=self.__user_country, limit=50, offset=0)
-        count = len(albums["albums"]["items"])
-        while albums["albums"]["total"] > count:
-            albums["albums"]["items"] += self.__spotipy.new_releases(
-                country=self.__user_country, limit=50, offset=count
-            )["albums"]["items"]
-            count += 50
-
-        album_ids = []
-        for album in albums["albums"]["items"]:
-            album_ids.append(album["id"])
-        albums = self.__prepare_album_listitems(album_ids)
-
-        return albums
-
     def browse_new_releases(self) -> None:
         xbmcplugin.setContent(self.__addon_handle, "albums")
         xbmcplugin.setProperty(
@@ -884,297 +645,13 @@ class PluginContent:
             "FolderName",
             self.__addon.getLocalizedString(ALL_NEW_RELEASES_STR_ID),
         )
-        albums = self.__get_new_releases()
+        albums = get_listing("new_releases")["items"]
         self.__add_album_listitems(albums)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
         xbmcplugin.endOfDirectory(handle=self.__addon_handle)
         if self.default_view_albums:
             xbmc.executebuiltin(f"Container.SetViewMode({self.default_view_albums})")
 
-    def __prepare_track_listitems(
-        self, track_ids=None, tracks=None, playlist_details=None, album_details=None
-    ) -> List[Dict[str, Any]]:
-        if tracks is None:
-            tracks = []
-        if track_ids is None:
-            track_ids = []
-
-        new_tracks: List[Dict[str, Any]] = []
-
-        # For tracks, we always get the full details unless full tracks already supplied.
-        if track_ids and not tracks:
-            for chunk in get_chunks(track_ids, 20):
-                tracks += self.__spotipy.tracks(chunk, market=self.__user_country)["tracks"]
-
-        saved_track_ids = self.__get_saved_track_ids()
-
-        followed_artists = []
-        for artist in self.__get_followed_artists():
-            followed_artists.append(artist["id"])
-
-        for track in tracks:
-            if track.get("track"):
-                track = track["track"]
-            if album_details:
-                track["album"] = album_details
-            if track.get("images"):
-                thumb = track["images"][0]["url"]
-            elif track.get("album", {}).get("images"):
-                thumb = track["album"]["images"][0]["url"]
-            else:
-                thumb = "DefaultMusicSongs.png"
-            track["thumb"] = thumb
-
-            # Skip local tracks in playlists.
-            if not track.get("id"):
-                continue
-
-            if "artists" in track:
-                artists = []
-                for artist in track["artists"]:
-                    if artist["name"]:
-                        artists.append(artist["name"])
-                if artists:
-                    track["artist"] = " / ".join(artists)
-                    track["artistid"] = track["artists"][0]["id"]
-
-            if "album" not in track:
-                track["genre"] = []
-                track["year"] = 1900
-            else:
-                track["genre"] = " / ".join(track["album"].get("genres", []))
-
-                # Allow for 'release_date' being empty.
-                release_date = "0" if "album" not in track else track["album"].get("release_date", "0")
-                track["year"] = (
-                    1900
-                    if not release_date
-                    else int(track["album"].get("release_date", "0").split("-")[0])
-                )
-
-            track["rating"] = str(self.__get_track_rating(track["popularity"]))
-
-            if playlist_details:
-                track["playlistid"] = playlist_details["id"]
-
-            track["contextitems"] = self.__get_playlist_track_context_menu_items(
-                track, saved_track_ids, playlist_details, followed_artists
-            )
-
-            new_tracks.append(track)
-
-        return new_tracks
-
-    def __get_playlist_track_context_menu_items(
-        self, track, saved_track_ids, playlist_details, followed_artists: List[str]
-    ) -> List[Tuple[str, str]]:
-        # Use original track id for actions when the track was relinked.
-        if track.get("linked_from"):
-            real_track_id = track["linked_from"]["id"]
-            real_track_uri = track["linked_from"]["uri"]
-        else:
-            real_track_id = track["id"]
-            real_track_uri = track["uri"]
-
-        context_items = [
-            (
-                self.__addon.getLocalizedString(REFRESH_LISTING_STR_ID),
-                f"RunPlugin(plugin://{ADDON_ID}/" f"?action={self.refresh_listing.__name__})",
-            )
-        ]
-
-        if track["id"] in saved_track_ids:
-            context_items.append(
-                (
-                    self.__addon.getLocalizedString(REMOVE_TRACKS_FROM_MY_MUSIC_STR_ID),
-                    f"RunPlugin(plugin://{ADDON_ID}/"
-                    f"?action={self.remove_track.__name__}&trackid={real_track_id})",
-                )
-            )
-        else:
-            context_items.append(
-                (
-                    self.__addon.getLocalizedString(SAVE_TRACKS_TO_MY_MUSIC_STR_ID),
-                    f"RunPlugin(plugin://{ADDON_ID}/"
-                    f"?action={self.save_track.__name__}&trackid={real_track_id})",
-                )
-            )
-
-        if playlist_details and playlist_details["owner"]["id"] == self.__userid:
-            context_items.append(
-                (
-                    f"{self.__addon.getLocalizedString(REMOVE_FROM_PLAYLIST_STR_ID)}"
-                    f" {playlist_details['name']}",
-                    f"RunPlugin(plugin://{ADDON_ID}/"
-                    f"?action={self.remove_track_from_playlist.__name__}&trackid="
-                    f"{real_track_uri}&playlistid={playlist_details['id']})",
-                )
-            )
-
-        context_items.append(
-            (
-                xbmc.getLocalizedString(KODI_ADD_TO_PLAYLIST_STR_ID),
-                f"RunPlugin(plugin://{ADDON_ID}/"
-                f"?action={self.add_track_to_playlist.__name__}&trackid={real_track_uri})",
-            )
-        )
-
-        if "artistid" in track:
-            context_items.append(
-                (
-                    self.__addon.getLocalizedString(ARTIST_TOP_TRACKS_STR_ID),
-                    f"Container.Update(plugin://{ADDON_ID}/"
-                    f"?action={self.artist_top_tracks.__name__}&artistid={track['artistid']})",
-                )
-            )
-            context_items.append(
-                (
-                    self.__addon.getLocalizedString(ALL_ALBUMS_FOR_ARTIST_STR_ID),
-                    f"Container.Update(plugin://{ADDON_ID}/"
-                    f"?action={self.browse_artist_just_albums.__name__}"
-                    f"&artistid={track['artistid']})",
-                )
-            )
-            context_items.append(
-                (
-                    self.__addon.getLocalizedString(ALL_SINGLES_FOR_ARTIST_STR_ID),
-                    f"Container.Update(plugin://{ADDON_ID}/"
-                    f"?action={self.browse_artist_just_singles.__name__}"
-                    f"&artistid={track['artistid']})",
-                )
-            )
-            context_items.append(
-                (
-                    self.__addon.getLocalizedString(ALL_APPEARS_ON_FOR_ARTIST_STR_ID),
-                    f"Container.Update(plugin://{ADDON_ID}/"
-                    f"?action={self.browse_artist_just_appears_on.__name__}"
-                    f"&artistid={track['artistid']})",
-                )
-            )
-            context_items.append(
-                (
-                    self.__addon.getLocalizedString(EVERYTHING_FOR_ARTIST_STR_ID),
-                    f"Container.Update(plugin://{ADDON_ID}/"
-                    f"?action={self.browse_artist_everything.__name__}"
-                    f"&artistid={track['artistid']})",
-                )
-            )
-
-            if track["artistid"] in followed_artists:
-                context_items.append(
-                    (
-                        self.__addon.getLocalizedString(UNFOLLOW_ARTIST_STR_ID),
-                        f"RunPlugin(plugin://{ADDON_ID}/"
-                        f"?action={self.unfollow_artist.__name__}"
-                        f"&artistid={track['artistid']})",
-                    )
-                )
-            else:
-                context_items.append(
-                    (
-                        self.__addon.getLocalizedString(FOLLOW_ARTIST_STR_ID),
-                        f"RunPlugin(plugin://{ADDON_ID}/"
-                        f"?action={self.follow_artist.__name__}&artistid={track['artistid']})",
-                    )
-                )
-
-            context_items.append(
-                (
-                    self.__addon.getLocalizedString(RELATED_ARTISTS_STR_ID),
-                    f"Container.Update(plugin://{ADDON_ID}/"
-                    f"?action={self.related_artists.__name__}&artistid={track['artistid']})",
-                )
-            )
-
-        return context_items
-
-    def __prepare_album_listitems(
-        self, album_ids: List[str] = None, albums: List[Dict[str, Any]] = None
-    ) -> List[Dict[str, Any]]:
-        if albums is None:
-            albums: List[Dict[str, Any]] = []
-        if album_ids is None:
-            album_ids = []
-        if not albums and album_ids:
-            # Get full info in chunks of 20.
-            for chunk in get_chunks(album_ids, 20):
-                albums += self.__spotipy.albums(chunk, market=self.__user_country)["albums"]
-
-        saved_albums = self.__get_saved_album_ids()
-
-        # process listing
-        for track in albums:
-            if track.get("images"):
-                track["thumb"] = track["images"][0]["url"]
-            else:
-                track["thumb"] = "DefaultMusicAlbums.png"
-
-            track["url"] = self.__build_url(
-                {"action": self.browse_album.__name__, "albumid": track["id"]}
-            )
-
-            artists = []
-            for artist in track["artists"]:
-                artists.append(artist["name"])
-            track["artist"] = " / ".join(artists)
-            track["genre"] = " / ".join(track["genres"])
-            track["year"] = int(track["release_date"].split("-")[0])
-            track["rating"] = str(self.__get_track_rating(track["popularity"]))
-            track["artistid"] = track["artists"][0]["id"]
-
-            track["contextitems"] = self.__get_album_track_context_menu_items(track, saved_albums)
-
-        return albums
-
-    def __get_album_track_context_menu_items(
-        self, track, saved_albums: List[str]
-    ) -> List[Tuple[str, str]]:
-        context_items = [
-            (
-                self.__addon.getLocalizedString(REFRESH_LISTING_STR_ID),
-                f"RunPlugin(plugin://{ADDON_ID}/" f"?action={self.refresh_listing.__name__})",
-            ),
-            (
-                xbmc.getLocalizedString(KODI_BROWSE_STR_ID),
-                f"Container.Update(plugin://{ADDON_ID}/"
-                f"?action={self.browse_album.__name__}&albumid={track['id']})",
-            ),
-            (
-                self.__addon.getLocalizedString(ARTIST_TOP_TRACKS_STR_ID),
-                f"Container.Update(plugin://{ADDON_ID}/"
-                f"?action={self.artist_top_tracks.__name__}&artistid={track['artistid']})",
-            ),
-            (
-                self.__addon.getLocalizedString(EVERYTHING_FOR_ARTIST_STR_ID),
-                f"Container.Update(plugin://{ADDON_ID}/"
-                f"?action={self.browse_artist_everything.__name__}&artistid={track['artistid']})",
-            ),
-            (
-                self.__addon.getLocalizedString(RELATED_ARTISTS_STR_ID),
-                f"Container.Update(plugin://{ADDON_ID}/"
-                f"?action={self.related_artists.__name__}&artistid={track['artistid']})",
-            ),
-        ]
-
-        if track["id"] in saved_albums:
-            context_items.append(
-                (
-                    self.__addon.getLocalizedString(REMOVE_TRACKS_FROM_MY_MUSIC_STR_ID),
-                    f"RunPlugin(plugin://{ADDON_ID}/"
-                    f"?action={self.remove_album.__name__}&albumid={track['id']})",
-                )
-            )
-        else:
-            context_items.append(
-                (
-                    self.__addon.getLocalizedString(SAVE_TRACKS_TO_MY_MUSIC_STR_ID),
-                    f"RunPlugin(plugin://{ADDON_ID}/"
-                    f"?action={self.save_album.__name__}&albumid={track['id']})",
-                )
-            )
-
-        return context_items
-
     def __add_album_listitems(
         self, albums: List[Dict[str, Any]], append_artist_to_label: bool = False
     ) -> None:
@@ -1195,100 +672,11 @@ class PluginContent:
             li.setArt({"thumb": track["thumb"]})
             li.setProperty("do_not_analyze", "true")
             li.setProperty("IsPlayable", "false")
-            li.addContextMenuItems(track["contextitems"], True)
+            li.addContextMenuItems(self.__context_menus.get_album_menu(track), True)
             xbmcplugin.addDirectoryItem(
                 handle=self.__addon_handle, url=track["url"], listitem=li, isFolder=True
             )
 
-    def __prepare_artist_listitems(
-        self, artists: List[Dict[str, Any]], is_followed: bool = False
-    ) -> List[Dict[str, Any]]:
-        followed_artists = []
-        if not is_followed:
-            for artist in self.__get_followed_artists():
-                followed_artists.append(artist["id"])
-
-        for artist in artists:
-            if not artist:
-                return []
-            if artist.get("artist"):
-                artist = artist["artist"]
-            if artist.get("images"):
-                artist["thumb"] = artist["images"][0]["url"]
-            else:
-                artist["thumb"] = "DefaultMusicArtists.png"
-
-            artist["url"] = self.__build_url(
-                {"action": self.browse_artist_everything.__name__, "artistid": artist["id"]}
-            )
-
-            artist["genre"] = " / ".join(artist["genres"])
-            artist["rating"] = str(self.__get_track_rating(artist["popularity"]))
-            artist["followerslabel"] = f"{artist['followers']['total']} followers"
-
-            artist["contextitems"] = self.__get_artist_context_menu_items(
-                artist, is_followed, followed_artists
-            )
-
-        return artists
-
-    def __get_artist_context_menu_items(
-        self, artist, is_followed: bool, followed_artists: List[str]
-    ) -> List[Tuple[str, str]]:
-        context_items = [
-            (
-                xbmc.getLocalizedString(EVERYTHING_FOR_ARTIST_STR_ID),
-                f"Container.Update({artist['url']})",
-            ),
-            (
-                self.__addon.getLocalizedString(ALL_ALBUMS_FOR_ARTIST_STR_ID),
-                f"Container.Update(plugin://{ADDON_ID}/"
-                f"?action={self.browse_artist_just_albums.__name__}&artistid={artist['id']})",
-            ),
-            (
-                self.__addon.getLocalizedString(ALL_SINGLES_FOR_ARTIST_STR_ID),
-                f"Container.Update(plugin://{ADDON_ID}/"
-                f"?action={self.browse_artist_just_singles.__name__}&artistid={artist['id']})",
-            ),
-            (
-                self.__addon.getLocalizedString(ALL_APPEARS_ON_FOR_ARTIST_STR_ID),
-                f"Container.Update(plugin://{ADDON_ID}/"
-                f"?action={self.browse_artist_just_appears_on.__name__}&artistid={artist['id']})",
-            ),
-            (
-                self.__addon.getLocalizedString(ARTIST_TOP_TRACKS_STR_ID),
-                f"Container.Update(plugin://{ADDON_ID}/"
-                f"?action={self.artist_top_tracks.__name__}&artistid={artist['id']})",
-            ),
-        ]
-
-        if is_followed or artist["id"] in followed_artists:
-            context_items.append(
-                (
-                    self.__addon.getLocalizedString(UNFOLLOW_ARTIST_STR_ID),
-                    f"RunPlugin(plugin://{ADDON_ID}/"
-                    f"?action={self.unfollow_artist.__name__}&artistid={artist['id']})",
-                )
-            )
-        else:
-            context_items.append(
-                (
-                    self.__addon.getLocalizedString(FOLLOW_ARTIST_STR_ID),
-                    f"RunPlugin(plugin://{ADDON_ID}/"
-                    f"?action={self.follow_artist.__name__}&artistid={artist['id']})",
-                )
-            )
-
-        context_items.append(
-            (
-                self.__addon.getLocalizedString(RELATED_ARTISTS_STR_ID),
-                f"Container.Update(plugin://{ADDON_ID}/"
-                f"?action={self.related_artists.__name__}&artistid={artist['id']})",
-            )
-        )
-
-        return context_items
-
     def __add_artist_listitems(self, artists: List[Dict[str, Any]]) -> None:
         for item in artists:
             li = xbmcgui.ListItem(item["name"], path=item["url"], offscreen=True)
@@ -1303,7 +691,7 @@ class PluginContent:
             li.setProperty("do_not_analyze", "true")
             li.setProperty("IsPlayable", "false")
             li.setLabel2(item["followerslabel"])
-            li.addContextMenuItems(item["contextitems"], True)
+            li.addContextMenuItems(self.__context_menus.get_artist_menu(item), True)
             xbmcplugin.addDirectoryItem(
                 handle=self.__addon_handle,
                 url=item["url"],
@@ -1312,79 +700,13 @@ class PluginContent:
                 totalItems=len(artists),
             )
 
-    def __prepare_playlist_listitems(self, playlists: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        playlists2 = []
-        followed_playlists = self.__get_curuser_playlistids()
-
-        for playlist in playlists:
-            if not playlist:
-                continue
-
-            if playlist.get("images"):
-                playlist["thumb"] = playlist["images"][0]["url"]
-            else:
-                playlist["thumb"] = "DefaultMusicAlbums.png"
-
-            playlist["url"] = self.__build_url(
-                {
-                    "action": self.browse_playlist.__name__,
-                    "playlistid": playlist["id"],
-                    "ownerid": playlist["owner"]["id"],
-                }
-            )
-
-            playlist["contextitems"] = self.__get_playlist_context_menu_items(
-                playlist, followed_playlists
-            )
-
-            playlists2.append(playlist)
-
-        return playlists2
-
-    def __get_playlist_context_menu_items(
-        self, playlist, followed_playlists: List[str]
-    ) -> List[Tuple[str, str]]:
-        contextitems = [
-            (
-                xbmc.getLocalizedString(KODI_PLAY_STR_ID),
-                f"RunPlugin(plugin://{ADDON_ID}/"
-                f"?action={self.play_playlist.__name__}&playlistid={playlist['id']}"
-                f"&ownerid={playlist['owner']['id']})",
-            ),
-            (
-                self.__addon.getLocalizedString(REFRESH_LISTING_STR_ID),
-                f"RunPlugin(plugin://{ADDON_ID}/" f"?action={self.refresh_listing.__name__})",
-            ),
-        ]
-
-        if playlist["owner"]["id"] != self.__userid and playlist["id"] in followed_playlists:
-            contextitems.append(
-                (
-                    self.__addon.getLocalizedString(UNFOLLOW_PLAYLIST_STR_ID),
-                    f"RunPlugin(plugin://{ADDON_ID}/"
-                    f"?action={self.unfollow_playlist.__name__}&playlistid={playlist['id']}"
-                    f"&ownerid={playlist['owner']['id']})",
-                )
-            )
-        elif playlist["owner"]["id"] != self.__userid:
-            contextitems.append(
-                (
-                    self.__addon.getLocalizedString(FOLLOW_PLAYLIST_STR_ID),
-                    f"RunPlugin(plugin://{ADDON_ID}/"
-                    f"?action={self.follow_playlist.__name__}&playlistid={playlist['id']}"
-                    f"&ownerid={playlist['owner']['id']})",
-                )
-            )
-
-        return contextitems
-
     def __add_playlist_listitems(self, playlists: List[Dict[str, Any]]) -> None:
         for item in playlists:
             li = xbmcgui.ListItem(item["name"], path=item["url"], offscreen=True)
             li.setProperty("do_not_analyze", "true")
             li.setProperty("IsPlayable", "false")
 
-            li.addContextMenuItems(item["contextitems"], True)
+            li.addContextMenuItems(self.__context_menus.get_playlist_menu(item), True)
             li.setArt(
                 {
                     "fanart": os.path.join(self.__addon_icon_path, "fanart.jpg"),
@@ -1418,28 +740,8 @@ class PluginContent:
         xbmcplugin.setProperty(
             self.__addon_handle, "FolderName", xbmc.getLocalizedString(KODI_ALBUMS_STR_ID)
         )
-        artist_albums = self.__spotipy.artist_albums(
-            self.__artist_id,
-            album_type=album_type,
-            country=self.__user_country,
-            limit=50,
-            offset=0,
-        )
-        count = len(artist_albums["items"])
-        albumids = []
-        while artist_albums["total"] > count:
-            artist_albums["items"] += self.__spotipy.artist_albums(
-                self.__artist_id,
-                album_type=album_type,
-                country=self.__user_country,
-                limit=50,
-                offset=count,
-            )["items"]
-            count += 50
-        for album in artist_albums["items"]:
-            albumids.append(album["id"])
-        albums = self.__prepare_album_listitems(albumids)
-        self.__add_album_listitems(albums)
+        albums = get_listing("artist_albums", artistid=self.__artist_id, albumtype=album_type)
+        self.__add_album_listitems(albums["items"])
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_VIDEO_YEAR)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_ALBUM_IGNORE_THE)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_SONG_RATING)
@@ -1448,45 +750,12 @@ class PluginContent:
         if self.default_view_albums:
             xbmc.executebuiltin(f"Container.SetViewMode({self.default_view_albums})")
 
-    def __get_saved_album_ids(self) -> List[str]:
-        albums = self.__spotipy.current_user_saved_albums(limit=1, offset=0)
-        cache_str = f"spotify-savedalbumids.{self.__userid}"
-        checksum = albums["total"]
-        cache = self.cache.get(cache_str, checksum=checksum)
-        if cache:
-            return cache
-
-        album_ids = []
-        if albums and albums.get("items"):
-            count = len(albums["items"])
-            album_ids = []
-            while albums["total"] > count:
-                albums["items"] += self.__spotipy.current_user_saved_albums(limit=50, offset=count)[
-                    "items"
-                ]
-                count += 50
-            for album in albums["items"]:
-                album_ids.append(album["album"]["id"])
-            self.cache.set(cache_str, album_ids, checksum=checksum)
-
-        return album_ids
-
-    def __get_saved_albums(self) -> List[Dict[str, Any]]:
-        album_ids = self.__get_saved_album_ids()
-        cache_str = f"spotify.savedalbums.{self.__userid}"
-        checksum = self.__cache_checksum(len(album_ids))
-        albums = self.cache.get(cache_str, checksum=checksum)
-        if not albums:
-            albums = self.__prepare_album_listitems(album_ids)
-            self.cache.set(cache_str, albums, checksum=checksum)
-        return albums
-
     def browse_saved_albums(self) -> None:
         xbmcplugin.setContent(self.__addon_handle, "albums")
         xbmcplugin.setProperty(
             self.__addon_handle, "FolderName", xbmc.getLocalizedString(KODI_ALBUMS_STR_ID)
         )
-        albums = self.__get_saved_albums()
+        albums = get_listing("saved_albums")["items"]
         self.__add_album_listitems(albums, True)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_ALBUM_IGNORE_THE)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_VIDEO_YEAR)
@@ -1497,118 +766,36 @@ class PluginContent:
         if self.default_view_albums:
             xbmc.executebuiltin(f"Container.SetViewMode({self.default_view_albums})")
 
-    def __get_saved_track_ids(self) -> List[str]:
-        saved_tracks = self.__spotipy.current_user_saved_tracks(
-            limit=1, offset=self.__offset, market=self.__user_country
-        )
-        total = saved_tracks["total"]
-        cache_str = f"spotify.savedtracksids.{self.__userid}"
-        cache = self.cache.get(cache_str, checksum=total)
-        if cache:
-            return cache
-
-        # Get from api.
-        track_ids = []
-        count = len(saved_tracks["items"])
-        while total > count:
-            saved_tracks["items"] += self.__spotipy.current_user_saved_tracks(
-                limit=50, offset=count, market=self.__user_country
-            )["items"]
-            count += 50
-        for track in saved_tracks["items"]:
-            track_ids.append(track["track"]["id"])
-        self.cache.set(cache_str, track_ids, checksum=total)
-
-        return track_ids
-
-    def __get_saved_tracks(self):
-        # Get from cache first.
-        track_ids = self.__get_saved_track_ids()
-        cache_str = f"spotify.savedtracks.{self.__userid}"
-
-        tracks = self.cache.get(cache_str, checksum=len(track_ids))
-        if not tracks:
-            # Get from api.
-            tracks = self.__prepare_track_listitems(track_ids)
-            self.cache.set(cache_str, tracks, checksum=len(track_ids))
-
-        return tracks
-
     def browse_saved_tracks(self) -> None:
         xbmcplugin.setContent(self.__addon_handle, "songs")
         xbmcplugin.setProperty(
             self.__addon_handle, "FolderName", xbmc.getLocalizedString(KODI_SONGS_STR_ID)
         )
-        tracks = self.__get_saved_tracks()
+        tracks = get_listing("saved_tracks")["items"]
         self.__add_track_listitems(tracks, True)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
         xbmcplugin.endOfDirectory(handle=self.__addon_handle)
         if self.default_view_songs:
             xbmc.executebuiltin(f"Container.SetViewMode({self.default_view_songs})")
 
-    def __get_saved_artists(self) -> List[Dict[str, Any]]:
-        saved_albums = self.__get_saved_albums()
-        followed_artists = self.__get_followed_artists()
-        cache_str = f"spotify.savedartists.{self.__userid}"
-        checksum = len(saved_albums) + len(followed_artists)
-        artists = self.cache.get(cache_str, checksum=checksum)
-        if not artists:
-            all_artist_ids = []
-            artists = []
-            # extract the artists from all saved albums
-            for item in saved_albums:
-                for artist in item["artists"]:
-                    if artist["id"] not in all_artist_ids:
-                        all_artist_ids.append(artist["id"])
-            for chunk in get_chunks(all_artist_ids, 50):
-                artists += self.__prepare_artist_listitems(self.__spotipy.artists(chunk)["artists"])
-            # append artists that are followed
-            for artist in followed_artists:
-                if not artist["id"] in all_artist_ids:
-                    artists.append(artist)
-            self.cache.set(cache_str, artists, checksum=checksum)
-
-        return artists
-
     def browse_saved_artists(self) -> None:
         xbmcplugin.setContent(self.__addon_handle, "artists")
         xbmcplugin.setProperty(
             self.__addon_handle, "FolderName", xbmc.getLocalizedString(KODI_ARTISTS_STR_ID)
         )
-        artists = self.__get_saved_artists()
+        artists = get_listing("saved_artists")["items"]
         self.__add_artist_listitems(artists)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_TITLE)
         xbmcplugin.endOfDirectory(handle=self.__addon_handle)
         if self.default_view_artists:
             xbmc.executebuiltin(f"Container.SetViewMode({self.default_view_artists})")
 
-    def __get_followed_artists(self) -> List[Dict[str, Any]]:
-        artists = self.__spotipy.current_user_followed_artists(limit=50)
-        cache_str = f"spotify.followedartists.{self.__userid}"
-        checksum = artists["artists"]["total"]
-
-        cache = self.cache.get(cache_str, checksum=checksum)
-        if cache:
-            artists = cache
-        else:
-            count = len(artists["artists"]["items"])
-            after = artists["artists"]["cursors"]["after"]
-            while artists["artists"]["total"] > count:
-                result = self.__spotipy.current_user_followed_artists(limit=50, after=after)
-                artists["artists"]["items"] += result["artists"]["items"]
-                after = result["artists"]["cursors"]["after"]
-                count += 50
-            artists = self.__prepare_artist_listitems(artists["artists"]["items"], is_followed=True)
-            self.cache.set(cache_str, artists, checksum=checksum)
-
-        return artists
-
     def browse_followed_artists(self) -> None:
         xbmcplugin.setContent(self.__addon_handle, "artists")
         xbmcplugin.setProperty(
             self.__addon_handle, "FolderName", xbmc.getLocalizedString(KODI_ARTISTS_STR_ID)
         )
-        artists = self.__get_followed_artists()
+        artists = get_listing("followed_artists")["items"]
         self.__add_artist_listitems(artists)
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_TITLE)
         xbmcplugin.endOfDirectory(handle=self.__addon_handle)
@@ -1621,17 +808,12 @@ class PluginContent:
             self.__addon_handle, "FolderName", xbmc.getLocalizedString(KODI_ARTISTS_STR_ID)
         )
 
-        result = self.__spotipy.search(
-            q=f"artist:{self.__artist_id}",
-            type="artist",
-            limit=self.__limit,
-            offset=self.__offset,
-            market=self.__user_country,
+        result = get_listing(
+            "search_artists", query=self.__artist_id, limit=self.__limit, offset=self.__offset
         )
 
-        artists = self.__prepare_artist_listitems(result["artists"]["items"])
-        self.__add_artist_listitems(artists)
-        self.__add_next_button(result["artists"]["total"])
+        self.__add_artist_listitems(result["items"])
+        self.__add_next_button(result["total"])
 
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
         xbmcplugin.endOfDirectory(handle=self.__addon_handle)
@@ -1645,17 +827,12 @@ class PluginContent:
             self.__addon_handle, "FolderName", xbmc.getLocalizedString(KODI_SONGS_STR_ID)
         )
 
-        result = self.__spotipy.search(
-            q=f"track:{self.__track_id}",
-            type="track",
-            limit=self.__limit,
-            offset=self.__offset,
-            market=self.__user_country,
+        result = get_listing(
+            "search_tracks", query=self.__track_id, limit=self.__limit, offset=self.__offset
         )
 
-        tracks = self.__prepare_track_listitems(tracks=result["tracks"]["items"])
-        self.__add_track_listitems(tracks, True)
-        self.__add_next_button(result["tracks"]["total"])
+        self.__add_track_listitems(result["items"], True)
+        self.__add_next_button(result["total"])
 
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
         xbmcplugin.endOfDirectory(handle=self.__addon_handle)
@@ -1669,20 +846,12 @@ class PluginContent:
             self.__addon_handle, "FolderName", xbmc.getLocalizedString(KODI_ALBUMS_STR_ID)
         )
 
-        result = self.__spotipy.search(
-            q=f"album:{self.__album_id}",
-            type="album",
-            limit=self.__limit,
-            offset=self.__offset,
-            market=self.__user_country,
+        result = get_listing(
+            "search_albums", query=self.__album_id, limit=self.__limit, offset=self.__offset
         )
 
-        album_ids = []
-        for album in result["albums"]["items"]:
-            album_ids.append(album["id"])
-        albums = self.__prepare_album_listitems(album_ids)
-        self.__add_album_listitems(albums, True)
-        self.__add_next_button(result["albums"]["total"])
+        self.__add_album_listitems(result["items"], True)
+        self.__add_next_button(result["total"])
 
         xbmcplugin.addSortMethod(self.__addon_handle, xbmcplugin.SORT_METHOD_UNSORTED)
         xbmcplugin.endOfDirectory(handle=self.__addon_handle)
@@ -1693,21 +862,15 @@ class PluginContent:
     def search_playlists(self) -> None:
         xbmcplugin.setContent(self.__addon_handle, "files")
 
-        result = self.__spotipy.search(
-            q=self.__playlist_id,
-            type="playlist",
-            limit=self.__limit,
-            offset=self.__offset,
-            market=self.__user_country,
+        result = get_listing(
+            "search_playlists", query=self.__playlist_id, limit=self.__limit, offset=self.__offset
         )
 
-        log_msg(result)
         xbmcplugin.setProperty(
             self.__addon_handle, "FolderName", xbmc.getLocalizedString(KODI_PLAYLISTS_STR_ID)
         )
-        playlists = self.__prepare_playlist_listitems(result["playlists"]["items"])
-        self.__add_playlist_listitems(playlists)
-        self.__add_next_button(result["playlists"]["total"])
+        self.__add_playlist_listitems(result["items"])
+        self.__add_next_button(result["total"])
         xbmcplugin.endOfDirectory(handle=self.__addon_handle)
 
         if self.default_view_playlists:
@@ -1724,38 +887,31 @@ class PluginContent:
         if kb.isConfirmed():
             value = kb.getText()
             items = []
-            result = self.__spotipy.search(
-                q=f"{value}",
-                type="artist,album,track,playlist",
-                limit=1,
-                market=self.__user_country,
-            )
+            totals = get_listing("search", query=value)
             items.append(
                 (
-                    f"{xbmc.getLocalizedString(KODI_ARTISTS_STR_ID)}"
-                    f" ({result['artists']['total']})",
+                    f"{xbmc.getLocalizedString(KODI_ARTISTS_STR_ID)}" f" ({totals['artists']})",
                     f"plugin://{ADDON_ID}/"
                     f"?action={self.search_artists.__name__}&artistid={value}",
                 )
             )
             items.append(
                 (
-                    f"{xbmc.getLocalizedString(KODI_PLAYLISTS_STR_ID)}"
-                    f" ({result['playlists']['total']})",
+                    f"{xbmc.getLocalizedString(KODI_PLAYLISTS_STR_ID)}" f" ({totals['playlists']})",
                     f"plugin://{ADDON_ID}/"
                     f"?action={self.search_playlists.__name__}&playlistid={value}",
                 )
             )
             items.append(
                 (
-                    f"{xbmc.getLocalizedString(KODI_ALBUMS_STR_ID)} ({result['albums']['total']})",
+                    f"{xbmc.getLocalizedString(KODI_ALBUMS_STR_ID)} ({totals['albums']})",
                     f"plugin://{ADDON_ID}/"
                     f"?action={self.search_albums.__name__}&albumid={value}",
                 )
             )
             items.append(
                 (
-                    f"{xbmc.getLocalizedString(KODI_SONGS_STR_ID)} ({result['tracks']['total']})",
+                    f"{xbmc.getLocalizedString(KODI_SONGS_STR_ID)} ({totals['tracks']})",
                     f"plugin://{ADDON_ID}/"
                     f"?action={self.search_tracks.__name__}&trackid={value}",
                 )
@@ -1793,22 +949,3 @@ class PluginContent:
             xbmcplugin.addDirectoryItem(
                 handle=self.__addon_handle, url=url, listitem=li, isFolder=True
             )
-
-    def __precache_library(self) -> None:
-        if not self.__win.getProperty("Spotify.PreCachedItems"):
-            monitor = xbmc.Monitor()
-            self.__win.setProperty("Spotify.PreCachedItems", "busy")
-            user_playlists = self.__get_user_playlists(self.__userid)
-            for playlist in user_playlists:
-                self.__get_playlist_details(playlist["id"])
-                if monitor.abortRequested():
-                    return
-            self.__get_saved_albums()
-            if monitor.abortRequested():
-                return
-            self.__get_saved_artists()
-            if monitor.abortRequested():
-                return
-            self.__get_saved_tracks()
-            del monitor
-            self.__win.setProperty("Spotify.PreCachedItems", "done")
@@ -0,0 +1,216 @@
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, List, Tuple, Union
+
+from xbmc import LOGDEBUG
+
+from decode_analyzer import DecodeAnalyzer
+from spotty_supervisor import SpottySupervisor
+from utils import log_msg, log_exception
+
+SHARED_DECODE_READ_SIZE = 65536
+# A reader that hasn't read for this long doesn't hold back the other readers.
+SHARED_DECODE_STALLED_READER_SECS = 10
+# How long a decode without readers waits for a client to reconnect.
+SHARED_DECODE_LINGER_SECS = 5
+WAIT_TIMEOUT_IN_SECS = 1.0
+
+
+class SharedDecodeReader:
+    def __init__(self, offset: int):
+        self.offset = offset
+        self.last_read_at = time.monotonic()
+
+    def is_stalled(self, now: float) -> bool:
+        return now - self.last_read_at > SHARED_DECODE_STALLED_READER_SECS
+
+
+class SharedDecode:
+    """One spotty decode of a track, from audio offset 'begin', shared by any number
+    of readers at their own offsets. The last 'window_size' bytes are retained, so
+    readers behind the decode head are served from memory, while readers ahead of
+    it wait for the decode. The decode pauses (and spotty, once its pipe is full)
+    when it is a window ahead of the slowest reader."""
+
+    def __init__(
+        self,
+        track_id: str,
+        begin: int,
+        spotty_process: subprocess.Popen,
+        spotty_supervisor: SpottySupervisor,
+        window_size: int,
+        analyzers: Union[List[DecodeAnalyzer], None] = None,
+    ):
+        self.track_id = track_id
+        self.__spotty_process = spotty_process
+        self.__spotty_supervisor = spotty_supervisor
+        self.__window_size = window_size
+        # Only for a decode from the start of the track.
+        self.__analyzers = analyzers or []
+
+        # Contiguous (offset, data) chunks of the retained window.
+        self.__chunks: Deque[Tuple[int, bytes]] = deque()
+        self.__window_begin = begin
+        self.__head = begin
+        self.__readers: List[SharedDecodeReader] = []
+        self.__idle_since = time.monotonic()
+        self.__finished = False
+        self.__closed = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__decode, daemon=True)
+
+    def start(self) -> None:
+        self.__thread.start()
+
+    def is_closed(self) -> bool:
+        return self.__closed
+
+    def is_decoding(self) -> bool:
+        """is spotty still running for the decode"""
+        return not (self.__finished or self.__closed)
+
+    def get_num_readers(self) -> int:
+        return len(self.__readers)
+
+    def try_attach(self, offset: int, max_read_ahead: int) -> Union[SharedDecodeReader, None]:
+        """a new reader at 'offset' - or None if the offset is outside the retained
+        window and not close enough ahead of the decode head"""
+        with self.__condition:
+            if self.__closed or offset < self.__window_begin:
+                return None
+            if offset > self.__head + (0 if self.__finished else max_read_ahead):
+                return None
+            reader = SharedDecodeReader(offset)
+            self.__readers.append(reader)
+            return reader
+
+    def detach(self, reader: SharedDecodeReader) -> None:
+        with self.__condition:
+            if reader in self.__readers:
+                self.__readers.remove(reader)
+            if not self.__readers:
+                self.__idle_since = time.monotonic()
+            self.__condition.notify_all()
+
+    def read(
+        self, reader: SharedDecodeReader, max_size: int, is_cancelled: Callable[[], bool]
+    ) -> bytes:
+        with self.__condition:
+            while reader.offset >= self.__head and not (self.__finished or self.__closed):
+                if is_cancelled():
+                    return b""
+                self.__condition.wait(WAIT_TIMEOUT_IN_SECS)
+
+            if reader.offset < self.__window_begin:
+                log_msg(f"Reader fell behind the shared decode of '{self.track_id}'.", LOGDEBUG)
+                return b""
+            if reader.offset >= self.__head:
+                return b""
+
+            data = self.__get_window_data(reader.offset, max_size)
+            reader.offset += len(data)
+            reader.last_read_at = time.monotonic()
+            # The decode may be waiting for this reader.
+            self.__condition.notify_all()
+            return data
+
+    def release(self, reader: SharedDecodeReader) -> bool:
+        """detach a terminated stream's reader, and stop the decode if that was its
+        last reader - returns whether the decode was stopped"""
+        with self.__condition:
+            if reader in self.__readers:
+                self.__readers.remove(reader)
+            if self.__readers or self.__closed:
+                self.__condition.notify_all()
+                return False
+            self.__close_locked()
+        self.__spotty_supervisor.cancel(self.__spotty_process)
+        return True
+
+    def close(self) -> None:
+        with self.__condition:
+            if self.__closed:
+                return
+            self.__close_locked()
+        self.__spotty_supervisor.cancel(self.__spotty_process)
+
+    def __close_locked(self) -> None:
+        self.__closed = True
+        self.__chunks.clear()
+        self.__condition.notify_all()
+
+    def __get_window_data(self, offset: int, max_size: int) -> bytes:
+        # Readers are usually near the head, so search from the end.
+        for chunk_begin, chunk in reversed(self.__chunks):
+            if chunk_begin <= offset:
+                start = offset - chunk_begin
+                if start == 0 and len(chunk) <= max_size:
+                    return chunk
+                return chunk[start : start + max_size]
+        return b""
+
+    def __is_window_full(self) -> bool:
+        now = time.monotonic()
+        readers = [reader for reader in self.__readers if not reader.is_stalled(now)]
+        if not readers:
+            # Stalled readers (e.g., paused playback) only count when no one else reads.
+            readers = self.__readers
+        low_water_mark = min(reader.offset for reader in readers) if readers else 0
+        low_water_mark = max(low_water_mark, self.__window_begin)
+        # Leave room for the next read, so the slowest reader stays in the window.
+        return self.__head - low_water_mark + SHARED_DECODE_READ_SIZE > self.__window_size
+
+    def __is_idle(self) -> bool:
+        if self.__readers:
+            return False
+        return time.monotonic() - self.__idle_since > SHARED_DECODE_LINGER_SECS
+
+    def __wait_while(self, predicate: Callable[[], bool]) -> bool:
+        with self.__condition:
+            while not self.__closed and predicate():
+                if self.__is_idle():
+                    log_msg(f"Closing idle shared decode of '{self.track_id}'.", LOGDEBUG)
+                    return False
+                self.__condition.wait(WAIT_TIMEOUT_IN_SECS)
+            return not self.__closed
+
+    def __decode(self) -> None:
+        try:
+            while self.__wait_while(self.__is_window_full):
+                data = self.__spotty_process.stdout.read(SHARED_DECODE_READ_SIZE)
+                if not data:
+                    if self.__analyzers and self.__spotty_process.wait() == 0:
+                        for analyzer in self.__analyzers:
+                            analyzer.finish()
+                    break
+                self.__add_chunk(data)
+                for analyzer in self.__analyzers:
+                    analyzer.feed(data)
+
+            with self.__condition:
+                self.__finished = True
+                self.__condition.notify_all()
+
+            # Keep the window around for readers still catching up, or reconnecting.
+            self.__wait_while(lambda: True)
+        except Exception as exc:
+            log_exception(exc, f"Shared decode error for track '{self.track_id}'")
+        finally:
+            self.close()
+            # The supervisor reaps spotty.
+            self.__spotty_process.stdout.close()
+
+    def __add_chunk(self, data: bytes) -> None:
+        with self.__condition:
+            if self.__closed:
+                return
+            self.__chunks.append((self.__head, data))
+            self.__head += len(data)
+            while len(self.__chunks) > 1:
+                if self.__head - self.__chunks[1][0] < self.__window_size:
+                    break
+                self.__chunks.popleft()
+            self.__window_begin = self.__chunks[0][0]
+            self.__condition.notify_all()
@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple, Union
+
+from xbmc import LOGDEBUG
+
+from decode_analyzer import DecodeAnalyzer
+from utils import ADDON_DATA_PATH, log_msg, log_exception
+
+try:
+    import numpy
+except ImportError:
+    # Kodi doesn't ship NumPy on every platform, so silence trimming is optional.
+    numpy = None
+
+TRACK_SILENCE_FILE = os.path.join(ADDON_DATA_PATH, "track-silence.json")
+MAX_TRACK_SILENCE_ENTRIES = 5000
+
+# A block of 16 bit samples is silent if no sample peaks above this (about -60dBFS).
+SILENCE_PEAK_THRESHOLD = 32
+# 1024 stereo sample frames, about 23ms at 44.1kHz.
+SILENCE_BLOCK_SIZE = 4096
+# Keep a little of the silence, so the attack of the first note isn't clipped.
+SILENCE_MARGIN_SIZE = 2 * SILENCE_BLOCK_SIZE
+
+
+def is_silence_trimming_available() -> bool:
+    return numpy is not None
+
+
+class SilenceDetector(DecodeAnalyzer):
+    """Finds the sounding part of a track from a decode fed in order from the start,
+    checking the peak of whole blocks of samples at a time. When the decode is
+    complete, 'finish' reports the (begin, end) audio offsets of the sound."""
+
+    def __init__(self, track_id: str, on_detected: Callable[[str, Tuple[int, int]], None]):
+        self.__track_id = track_id
+        self.__on_detected = on_detected
+
+        self.__offset = 0
+        self.__pending = b""
+        self.__sound_begin = -1
+        self.__sound_end = 0
+
+    def feed(self, data: Union[bytes, memoryview]) -> None:
+        data = self.__pending + data
+        num_blocks = len(data) // SILENCE_BLOCK_SIZE
+        if num_blocks:
+            self.__check_blocks(data, num_blocks)
+        self.__pending = data[num_blocks * SILENCE_BLOCK_SIZE :]
+
+    def finish(self) -> None:
+        length = self.__offset + len(self.__pending)
+        pending_samples = self.__get_blocks(self.__pending, 1, len(self.__pending) // 2)
+        if pending_samples.size and self.__is_loud(pending_samples).any():
+            self.__set_sound(length - len(self.__pending), length)
+        if self.__sound_begin < 0:
+            log_msg(f"Track '{self.__track_id}' is all silence. Not trimming.", LOGDEBUG)
+            return
+
+        sound_range = (
+            max(0, self.__sound_begin - SILENCE_MARGIN_SIZE),
+            min(length, self.__sound_end + SILENCE_MARGIN_SIZE),
+        )
+        log_msg(f"Track '{self.__track_id}' sound range: {sound_range}, length {length}.", LOGDEBUG)
+        self.__on_detected(self.__track_id, sound_range)
+
+    def __check_blocks(self, data: bytes, num_blocks: int) -> None:
+        blocks = self.__get_blocks(data, num_blocks, SILENCE_BLOCK_SIZE // 2)
+        loud_blocks = numpy.flatnonzero(self.__is_loud(blocks))
+        if loud_blocks.size:
+            self.__set_sound(
+                self.__offset + int(loud_blocks[0]) * SILENCE_BLOCK_SIZE,
+                self.__offset + (int(loud_blocks[-1]) + 1) * SILENCE_BLOCK_SIZE,
+            )
+        self.__offset += num_blocks * SILENCE_BLOCK_SIZE
+
+    def __set_sound(self, begin: int, end: int) -> None:
+        if self.__sound_begin < 0:
+            self.__sound_begin = begin
+        self.__sound_end = end
+
+    @staticmethod
+    def __get_blocks(data: bytes, num_blocks: int, block_samples: int):
+        samples = numpy.frombuffer(data, dtype="<i2", count=num_blocks * block_samples)
+        return samples.reshape(num_blocks, block_samples)
+
+    @staticmethod
+    def __is_loud(blocks):
+        # Not 'abs', which overflows for -32768.
+        return (blocks.max(axis=1) > SILENCE_PEAK_THRESHOLD) | (
+            blocks.min(axis=1) < -SILENCE_PEAK_THRESHOLD
+        )
+
+
+class TrackSilenceStore:
+    """the detected (begin, end) sound ranges of tracks, kept across restarts"""
+
+    def __init__(self, path: str = TRACK_SILENCE_FILE):
+        self.__path = path
+        self.__sound_ranges: Dict[str, Tuple[int, int]] = OrderedDict()
+        self.__lock = threading.Lock()
+
+        self.__load()
+
+    def get_sound_range(self, track_id: str) -> Union[Tuple[int, int], None]:
+        with self.__lock:
+            return self.__sound_ranges.get(track_id)
+
+    def set_sound_range(self, track_id: str, sound_range: Tuple[int, int]) -> None:
+        with self.__lock:
+            self.__sound_ranges[track_id] = sound_range
+            self.__sound_ranges.move_to_end(track_id)
+            while len(self.__sound_ranges) > MAX_TRACK_SILENCE_ENTRIES:
+                self.__sound_ranges.popitem(last=False)
+            # A track is only analyzed once, so writes are rare.
+            self.__save()
+
+    def __load(self) -> None:
+        if not os.path.exists(self.__path):
+            return
+        try:
+            with open(self.__path, "r", encoding="utf-8") as f:
+                for track_id, sound_range in json.load(f).items():
+                    self.__sound_ranges[track_id] = (int(sound_range[0]), int(sound_range[1]))
+            log_msg(f"Loaded {len(self.__sound_ranges)} track sound ranges.", LOGDEBUG)
+        except Exception as exc:
+            log_exception(exc, f"Could not load track sound ranges from '{self.__path}'")
+
+    def __save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.__path), exist_ok=True)
+            temp_path = self.__path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.__sound_ranges, f)
+            os.replace(temp_path, self.__path)
+        except Exception as exc:
+            log_exception(exc, f"Could not save track sound ranges to '{self.__path}'")
@@ -0,0 +1,100 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List
+
+from xbmc import LOGWARNING
+
+import spotipy
+from utils import log_msg
+
+MAX_PAGE_FETCHERS = 4
+MAX_RATE_LIMIT_RETRIES = 3
+# Used when a rate limited response has no 'Retry-After' header.
+DEFAULT_RETRY_AFTER_SECS = 1.0
+
+
+class SpotifyPager:
+    """Fetches the pages of a paginated Spotify collection concurrently. Once the
+    first response has given the total, all remaining offsets are known, so their
+    pages are fetched by a bounded pool of threads and put back in offset order.
+    A rate limited (429) page pauses every fetcher for the 'Retry-After' time, then
+    is tried again. The same pool fetches the id batches of the entity resolver
+    (see 'get_all')."""
+
+    def __init__(self, max_fetchers: int = MAX_PAGE_FETCHERS):
+        self.__executor = ThreadPoolExecutor(max_fetchers, thread_name_prefix="spotify-pager")
+        self.__lock = threading.Lock()
+        self.__paused_until = 0.0
+
+        self.__num_pages = 0
+        self.__num_rate_limited = 0
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_items(
+        self,
+        get_page: Callable[[int], List[Any]],
+        total: int,
+        page_size: int,
+        first_items: List[Any] = None,
+    ) -> List[Any]:
+        """all 'total' items, where 'get_page(offset)' returns the 'page_size' items
+        from 'offset' and 'first_items' are any items already fetched from offset 0"""
+        items = list(first_items or [])
+        return items + self.get_all(get_page, range(len(items), total, page_size))
+
+    def get_all(self, get_items: Callable[[Any], List[Any]], keys: Iterable[Any]) -> List[Any]:
+        """the concatenated 'get_items(key)' lists of all keys, fetched concurrently"""
+        futures = [self.__executor.submit(self.__get_page, get_items, key) for key in keys]
+        items = []
+        try:
+            for future in futures:
+                items += future.result()
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+        return items
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return {"pages": self.__num_pages, "rate_limited": self.__num_rate_limited}
+
+    def __get_page(self, get_page: Callable[[Any], List[Any]], key: Any) -> List[Any]:
+        retry = 0
+        while True:
+            self.__wait_while_paused()
+            try:
+                page = get_page(key)
+                with self.__lock:
+                    self.__num_pages += 1
+                return page
+            except spotipy.SpotifyException as exc:
+                if exc.http_status != 429 or retry == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                retry += 1
+                self.__pause(self.__get_retry_after_secs(exc, retry))
+
+    def __wait_while_paused(self) -> None:
+        while True:
+            with self.__lock:
+                wait_secs = self.__paused_until - time.monotonic()
+            if wait_secs <= 0:
+                return
+            time.sleep(wait_secs)
+
+    def __pause(self, secs: float) -> None:
+        log_msg(f"Spotify rate limited the page fetches. Pausing for {secs} secs.", LOGWARNING)
+        with self.__lock:
+            self.__num_rate_limited += 1
+            self.__paused_until = max(self.__paused_until, time.monotonic() + secs)
+
+    @staticmethod
+    def __get_retry_after_secs(exc: spotipy.SpotifyException, retry: int) -> float:
+        try:
+            return float(exc.headers.get("Retry-After", ""))
+        except ValueError:
+            return DEFAULT_RETRY_AFTER_SECS * 2 ** (retry - 1)
@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+from entity_store import EntityStore
+from spotify_pager import SpotifyPager
+from utils import get_chunks
+
+# The most ids the several tracks/albums/artists endpoints take in one request.
+TRACKS_BATCH_SIZE = 50
+ALBUMS_BATCH_SIZE = 20
+ARTISTS_BATCH_SIZE = 50
+
+MAX_CACHED_ENTITIES = 20000
+ENTITY_CACHE_TTL_IN_SECS = 6 * 60 * 60
+
+TRACK = "track"
+ALBUM = "album"
+ARTIST = "artist"
+
+Entity = Dict[str, Any]
+
+
+class SpotifyResolver:
+    """Resolves track, album and artist ids to their full Spotify objects. The ids
+    asked for are deduplicated and answered from an in-memory entity cache, then
+    from the entity store, where possible. The rest are fetched in the largest
+    batches the endpoint allows, concurrently through the pager's pool, and stored.
+    An id already being resolved for another listing is waited for, not fetched
+    again. Returned entities are copies, so listings can add their fields to them."""
+
+    def __init__(
+        self,
+        pager: SpotifyPager,
+        store: EntityStore,
+        max_cached_entities: int = MAX_CACHED_ENTITIES,
+    ):
+        self.__pager = pager
+        self.__store = store
+        self.__max_cached_entities = max_cached_entities
+
+        self.__lock = threading.Lock()
+        # (kind, id) -> (expires_at, entity), least recently used first
+        self.__entities: Dict[Tuple[str, str], Tuple[float, Entity]] = OrderedDict()
+        self.__fetching: Dict[Tuple[str, str], Future] = {}
+
+        self.__num_requested = 0
+        self.__num_cache_hits = 0
+        self.__num_store_hits = 0
+        self.__num_coalesced = 0
+        self.__num_fetched = 0
+
+    def get_tracks(self, spotipy, track_ids: List[str], market: str) -> List[Entity]:
+        return self.__resolve(
+            TRACK,
+            track_ids,
+            lambda chunk: spotipy.tracks(chunk, market=market)["tracks"],
+            TRACKS_BATCH_SIZE,
+        )
+
+    def get_albums(self, spotipy, album_ids: List[str], market: str) -> List[Entity]:
+        return self.__resolve(
+            ALBUM,
+            album_ids,
+            lambda chunk: spotipy.albums(chunk, market=market)["albums"],
+            ALBUMS_BATCH_SIZE,
+        )
+
+    def get_artists(self, spotipy, artist_ids: List[str]) -> List[Entity]:
+        return self.__resolve(
+            ARTIST, artist_ids, lambda chunk: spotipy.artists(chunk)["artists"], ARTISTS_BATCH_SIZE
+        )
+
+    def add_tracks(self, tracks: List[Entity]) -> None:
+        """cache full track objects that came with another response"""
+        self.__add(TRACK, tracks)
+
+    def add_albums(self, albums: List[Entity]) -> None:
+        self.__add(ALBUM, albums)
+
+    def add_artists(self, artists: List[Entity]) -> None:
+        self.__add(ARTIST, artists)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entities.clear()
+        self.__store.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        num_stored = self.__store.get_count()
+        with self.__lock:
+            return {
+                "cached": len(self.__entities),
+                "stored": num_stored,
+                "requested": self.__num_requested,
+                "cache_hits": self.__num_cache_hits,
+                "store_hits": self.__num_store_hits,
+                "coalesced": self.__num_coalesced,
+                "fetched": self.__num_fetched,
+            }
+
+    def __resolve(
+        self,
+        kind: str,
+        ids: List[str],
+        fetch_batch: Callable[[List[str]], List[Entity]],
+        batch_size: int,
+    ) -> List[Entity]:
+        entities: Dict[str, Entity] = {}
+        ids_to_load: List[str] = []
+        fetched_elsewhere: Dict[str, Future] = {}
+
+        with self.__lock:
+            for entity_id in dict.fromkeys(ids):
+                self.__num_requested += 1
+                key = (kind, entity_id)
+                entity = self.__get_cached(key)
+                if entity:
+                    self.__num_cache_hits += 1
+                    entities[entity_id] = entity
+                elif key in self.__fetching:
+                    self.__num_coalesced += 1
+                    fetched_elsewhere[entity_id] = self.__fetching[key]
+                else:
+                    self.__fetching[key] = Future()
+                    ids_to_load.append(entity_id)
+
+        if ids_to_load:
+            entities.update(self.__load(kind, ids_to_load, fetch_batch, batch_size))
+        for entity_id, future in fetched_elsewhere.items():
+            entities[entity_id] = future.result()
+
+        # Unknown ids come back as None.
+        return [dict(entities[entity_id]) for entity_id in ids if entities.get(entity_id)]
+
+    def __load(
+        self,
+        kind: str,
+        ids: List[str],
+        fetch_batch: Callable[[List[str]], List[Entity]],
+        batch_size: int,
+    ) -> Dict[str, Entity]:
+        entities = self.__store.get_entities(kind, ids)
+        with self.__lock:
+            self.__num_store_hits += len(entities)
+            expires_at = time.monotonic() + ENTITY_CACHE_TTL_IN_SECS
+            for entity_id, entity in entities.items():
+                self.__set_cached((kind, entity_id), expires_at, entity)
+                self.__fetching.pop((kind, entity_id)).set_result(entity)
+
+        ids_to_fetch = [entity_id for entity_id in ids if entity_id not in entities]
+        if ids_to_fetch:
+            entities.update(self.__fetch(kind, ids_to_fetch, fetch_batch, batch_size))
+
+        return entities
+
+    def __fetch(
+        self,
+        kind: str,
+        ids: List[str],
+        fetch_batch: Callable[[List[str]], List[Entity]],
+        batch_size: int,
+    ) -> Dict[str, Entity]:
+        try:
+            # The endpoints answer each batch in id order.
+            fetched = self.__pager.get_all(fetch_batch, get_chunks(ids, batch_size))
+        except Exception as exc:
+            with self.__lock:
+                for entity_id in ids:
+                    self.__fetching.pop((kind, entity_id)).set_exception(exc)
+            raise
+
+        # Keyed by the ids asked for, as a relinked track comes back with another id.
+        entities = {entity_id: entity for entity_id, entity in zip(ids, fetched) if entity}
+        self.__store.set_entities(kind, entities)
+        with self.__lock:
+            self.__num_fetched += len(ids)
+            expires_at = time.monotonic() + ENTITY_CACHE_TTL_IN_SECS
+            for entity_id in ids:
+                entity = entities.get(entity_id)
+                if entity:
+                    self.__set_cached((kind, entity_id), expires_at, entity)
+                self.__fetching.pop((kind, entity_id)).set_result(entity)
+
+        return entities
+
+    def __add(self, kind: str, entities: List[Entity]) -> None:
+        entities = {
+            entity["id"]: dict(entity) for entity in entities if entity and entity.get("id")
+        }
+        self.__store.set_entities(kind, entities)
+        expires_at = time.monotonic() + ENTITY_CACHE_TTL_IN_SECS
+        with self.__lock:
+            for entity_id, entity in entities.items():
+                self.__set_cached((kind, entity_id), expires_at, entity)
+
+    def __get_cached(self, key: Tuple[str, str]) -> Entity:
+        cached = self.__entities.get(key)
+        if not cached:
+            return {}
+        expires_at, entity = cached
+        if expires_at <= time.monotonic():
+            del self.__entities[key]
+            return {}
+        self.__entities.move_to_end(key)
+        return entity
+
+    def __set_cached(self, key: Tuple[str, str], expires_at: float, entity: Entity) -> None:
+        self.__entities[key] = (expires_at, entity)
+        self.__entities.move_to_end(key)
+        while len(self.__entities) > self.__max_cached_entities:
+            self.__entities.popitem(last=False)
@@ -1,12 +1,15 @@
 import os
 import subprocess
+import time
 from typing import Dict, List
 
 import xbmc
 from xbmc import LOGDEBUG, LOGERROR
 
 from spotty_helper import SpottyHelper
-from utils import log_msg, ADDON_DATA_PATH
+from spotty_log import SpottyLog
+from spotty_supervisor import SpottySupervisor
+from utils import log_msg, set_pipe_size, ADDON_DATA_PATH
 
 SPOTTY_PLAYER_NAME = "Kodi-Spotty"
 SPOTTY_DEFAULT_ARGS = [
@@ -19,6 +22,9 @@ SPOTTY_CACHE_DIR_NAME = "spotty-cache"
 SPOTTY_CACHE_DIR = os.path.join(ADDON_DATA_PATH, SPOTTY_CACHE_DIR_NAME)
 SPOTTY_CREDENTIALS_FILENAME = "credentials.json"
 SPOTTY_CREDENTIALS_BACKUP_FILENAME = "credentials.json.bak"
+SPOTTY_LOW_PRIORITY_NICENESS = 10
+# Bigger than the default 64KB, so spotty can decode further ahead of the relay.
+SPOTTY_PIPE_SIZE = 1048576
 
 
 class Spotty:
@@ -28,6 +34,8 @@ class Spotty:
         self.__spotify_username = ""
         self.__spotify_password = ""
         self.__spotty_rust_env = None
+        self.__spotty_log = SpottyLog()
+        self.__spotty_supervisor = SpottySupervisor()
 
         self.__playback_supported = True
 
@@ -44,6 +52,12 @@ class Spotty:
     def set_spotty_env(self, env: Dict[str, str]):
         self.__spotty_rust_env = env
 
+    def get_spotty_log(self) -> SpottyLog:
+        return self.__spotty_log
+
+    def get_spotty_supervisor(self) -> SpottySupervisor:
+        return self.__spotty_supervisor
+
     def get_spotty_token_file(self) -> str:
         return os.path.join(self.__spotty_cache, SPOTTY_TOKEN_FILE)
 
@@ -53,7 +67,9 @@ class Spotty:
     def get_spotty_credentials_backup_file(self) -> str:
         return os.path.join(self.__spotty_cache, SPOTTY_CREDENTIALS_BACKUP_FILENAME)
 
-    def run_spotty(self, extra_args: List[str] = None) -> subprocess.Popen:
+    def run_spotty(
+        self, extra_args: List[str] = None, low_priority: bool = False
+    ) -> subprocess.Popen:
         log_msg("Running spotty...", LOGDEBUG)
 
         try:
@@ -72,20 +88,54 @@ class Spotty:
             log_msg(f"Spotty args: {' '.join(loggable_args)}", LOGDEBUG)
 
             startupinfo = None
+            creationflags = 0
             if os.name == "nt":
                 startupinfo = subprocess.STARTUPINFO()
                 startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-
-            return subprocess.Popen(
-                args,
-                startupinfo=startupinfo,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                env=self.__spotty_rust_env,
+                if low_priority:
+                    creationflags = subprocess.BELOW_NORMAL_PRIORITY_CLASS
+
+            # The log goes to its own pipe, drained by the spotty log, so stdout is only
+            # audio. The pipe isn't the process's 'stderr', so 'communicate' leaves it be.
+            log_read_fd, log_write_fd = os.pipe()
+            started_at = time.monotonic()
+            try:
+                # Unbuffered, so the audio can be relayed straight from the pipe.
+                spotty_process = self.__spotty_supervisor.popen(
+                    args,
+                    startupinfo=startupinfo,
+                    creationflags=creationflags,
+                    stdout=subprocess.PIPE,
+                    stderr=log_write_fd,
+                    bufsize=0,
+                    env=self.__spotty_rust_env,
+                )
+            except Exception:
+                os.close(log_read_fd)
+                raise
+            finally:
+                os.close(log_write_fd)
+            self.__spotty_log.start_draining(
+                spotty_process.pid, os.fdopen(log_read_fd, "rb"), started_at
             )
+            if low_priority and os.name != "nt":
+                self.__lower_priority(spotty_process)
+            set_pipe_size(spotty_process.stdout.fileno(), SPOTTY_PIPE_SIZE)
+
+            return spotty_process
         except Exception as ex:
             raise Exception(f"Run spotty error: {ex}")
 
+    @staticmethod
+    def __lower_priority(spotty_process: subprocess.Popen) -> None:
+        # Not with a 'preexec_fn', which can deadlock in the multithreaded service.
+        # Spotty leads its own process group (see 'SpottySupervisor.popen'), and setting
+        # the group's priority covers any threads it has started already.
+        try:
+            os.setpriority(os.PRIO_PGRP, spotty_process.pid, SPOTTY_LOW_PRIORITY_NICENESS)
+        except OSError as ex:
+            log_msg(f"Could not lower the priority of spotty: {ex}", LOGDEBUG)
+
 
 def get_spotty(spotty_helper: SpottyHelper) -> Spotty:
     spotty = Spotty()
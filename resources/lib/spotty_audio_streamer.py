@@ -1,147 +1,466 @@
 import struct
-import subprocess
+import time
 from io import BytesIO
-from typing import Callable, Tuple
+from typing import Callable, Iterator, Tuple, Union
 
 from xbmc import LOGDEBUG, LOGWARNING, LOGERROR
 
-from spotty import Spotty
-from utils import bytes_to_megabytes, kill_process_by_pid, log_msg, log_exception
-
-SPOTIFY_TRACK_PREFIX = "spotify:track:"
-# SPOTTY_AUDIO_CHUNK_SIZE = 20*1024
-SPOTTY_AUDIO_CHUNK_SIZE = 524288
-
-SPOTIFY_BITRATE = "320"
-SPOTTY_INITIAL_VOLUME = "50"
-SPOTTY_GAIN_TYPE = "track"
-SPOTTY_STREAMING_DEFAULT_ARGS = [
-    "--disable-audio-cache",
-    "--disable-discovery",
-    "--bitrate",
-    SPOTIFY_BITRATE,
-    "--initial-volume",
-    SPOTTY_INITIAL_VOLUME,
-]
-SPOTTY_STREAMING_NORMALIZATION_ARGS = [
-    "--enable-volume-normalisation",
-    "--normalisation-gain-type",
-    SPOTTY_GAIN_TYPE,
-]
+from audio_chunk_sizer import AudioChunkSizer
+from audio_relay import AudioFrame, FileFrame, PipeFrame, get_frame_bytes, get_frame_length
+from crossfade import Crossfader
+from loudness import GainStage
+from pcm_cache import PcmCacheEntry
+from pcm_converter import PcmConverter, PcmFormat
+from shared_decode import SharedDecode, SharedDecodeReader
+from spotty_decode_manager import SpottyDecodeManager, TrackAudioRange
+from utils import bytes_to_megabytes, log_msg, log_exception
+
+# Spotty always outputs 16 bit, stereo, 44.1kHz PCM.
+SAMPLE_RATE = 44100
+NUM_CHANNELS = 2
+BITS_PER_SAMPLE = 16
+BLOCK_ALIGN = NUM_CHANNELS * (BITS_PER_SAMPLE // 8)
+BYTE_RATE = SAMPLE_RATE * BLOCK_ALIGN
+SPOTTY_PCM_FORMAT = PcmFormat(SAMPLE_RATE, BITS_PER_SAMPLE, NUM_CHANNELS)
+
+# Range requests further than this past the pcm cache (or shared) decode head start a
+# new spotty.
+PCM_CACHE_MAX_READ_AHEAD = 10 * BYTE_RATE
+# How much of a shared decode is kept in memory for readers behind the decode head.
+SHARED_DECODE_WINDOW_SIZE = 30 * BYTE_RATE
+
+# Zero samples, for the gap between tracks and for padding a decode that comes up
+# short of the promised length.
+SILENCE_CHUNK = bytes(65536)
 
 
 class SpottyAudioStreamer:
-    def __init__(self, spotty: Spotty):
-        self.__spotty = spotty
+    """one track stream - the shared pcm cache is in the decode manager"""
+
+    def __init__(
+        self,
+        decode_manager: SpottyDecodeManager,
+        gap_between_tracks: int = 0,
+        crossfade_secs: int = 0,
+        output_format: PcmFormat = SPOTTY_PCM_FORMAT,
+    ):
+        self.__decode_manager = decode_manager
+        self.__crossfade_length = self.get_audio_data_length(crossfade_secs)
+        # The stream is in the output format from the end of the audio frames stage, so
+        # the gap and the header are too.
+        self.__output_format = output_format
+        self.__converter: Union[PcmConverter, None] = None
+        if output_format != SPOTTY_PCM_FORMAT:
+            self.__converter = PcmConverter(SPOTTY_PCM_FORMAT, output_format)
+        self.__track_gap_length = output_format.get_data_length(gap_between_tracks)
 
         self.__track_id: str = ""
-        self.__track_duration: int = 0
+        self.__track_duration: float = 0.0
+        self.__track_audio_length: int = 0
+        self.__audio_range = TrackAudioRange(0, 0, False)
+        self.__gap_length: int = 0
+        self.__audio_length: int = 0
+        self.__track_gain = 1.0
         self.__wav_header: bytes = bytes()
         self.__track_length: int = 0
 
         self.__notify_track_finished: Callable[[str], None] = lambda x: None
-        self.__last_spotty_pid = -1
+        self.__get_next_track: Callable[[], Union[Tuple[str, float], None]] = lambda: None
+        self.__crossfade_head: Union[bytes, None] = None
+        self.__shared_decode: Union[SharedDecode, None] = None
+        self.__shared_decode_reader: Union[SharedDecodeReader, None] = None
+        self.__is_reading_pcm_cache = False
         self.__terminated = False
 
-        self.use_normalization = True
+    def get_track_id(self) -> str:
+        return self.__track_id
 
     def get_track_length(self) -> int:
         return self.__track_length
 
-    def get_track_duration(self) -> int:
+    def get_track_duration(self) -> float:
         return self.__track_duration
 
     def set_track(self, track_id: str, track_duration: float) -> None:
         self.__track_id = track_id
-        self.__track_duration = int(track_duration)
+        self.__track_duration = track_duration
+        self.__track_audio_length = self.get_audio_data_length(track_duration)
+        # The stream skips the track's trimmed silence. If the previous track's stream
+        # already played the head of this track, in its crossfade, this stream starts
+        # after the head, with no gap.
+        self.__audio_range = self.__decode_manager.get_track_audio_range(
+            track_id, self.__track_audio_length
+        )
+        self.__gap_length = 0 if self.__audio_range.is_faded_in else self.__track_gap_length
+        self.__audio_length = self.__audio_range.end - self.__audio_range.begin
+        if self.__converter:
+            self.__audio_length = self.__converter.get_output_length(self.__audio_length)
+        self.__track_gain = self.__decode_manager.get_track_gain(track_id)
         self.__wav_header, self.__track_length = self.__create_wav_header()
 
     def set_notify_track_finished(self, func: Callable[[str], None]) -> None:
         self.__notify_track_finished = func
 
+    def set_get_next_track(self, func: Callable[[], Union[Tuple[str, float], None]]) -> None:
+        """'func' returns the (track id, duration) to crossfade into, if any"""
+        self.__get_next_track = func
+
+    def is_terminated(self) -> bool:
+        return self.__terminated
+
     def terminate_stream(self) -> bool:
         self.__terminated = True
-        if self.__last_spotty_pid == -1:
-            return False
-        self.__kill_last_spotty()
+        cancelled_writer = self.__decode_manager.release_pcm_cache_writer(
+            self.__track_id, 1 if self.__is_reading_pcm_cache else 0
+        )
+        if not self.__shared_decode:
+            return cancelled_writer
+        self.__decode_manager.release_shared_decode(
+            self.__shared_decode, self.__shared_decode_reader
+        )
         return True
 
-    def send_part_audio_stream(self, range_len: int, range_begin: int) -> str:
+    def send_part_audio_stream(self, range_len: int, range_begin: int) -> Iterator[AudioFrame]:
         """Chunked transfer of audio data from spotty binary"""
 
-        self.__terminated = False
-        spotty_process = None
+        audio_frames = None
         bytes_sent = 0
         try:
-            self.__kill_last_spotty()
-
             self.__log_start_transfer(range_begin)
 
-            # Send the wav header.
-            if range_begin == 0:
-                bytes_sent = len(self.__wav_header)
+            # Send the wav header, or whatever part of it is in the range.
+            wav_header_len = len(self.__wav_header)
+            if range_begin < wav_header_len:
+                bytes_sent = wav_header_len - range_begin
                 self.__log_send_wav_header()
-                yield self.__wav_header
+                yield self.__wav_header[range_begin:]
+
+            # The data chunk is the gap between tracks (as silence), then the track's audio
+            # range (less any trimmed silence), both in the output format. 'audio_begin'
+            # is a track audio offset of the spotty pcm the output range comes from.
+            data_begin = max(0, range_begin - wav_header_len)
+            data_len = range_len - bytes_sent
+            gap_len = min(max(0, self.__gap_length - data_begin), data_len)
+            output_begin = max(0, data_begin - self.__gap_length)
+            output_len = data_len - gap_len
+            input_begin, input_end = output_begin, output_begin + output_len
+            if self.__converter and output_len > 0:
+                input_begin, input_end = self.__converter.get_input_range(
+                    output_begin, output_len, self.__audio_range.end - self.__audio_range.begin
+                )
+            audio_begin = self.__audio_range.begin + input_begin
+            audio_len = input_end - input_begin
+
+            # Start the decode before sending the gap, so they overlap.
+            if audio_len > 0:
+                cache_entry = self.__decode_manager.get_pcm_cache_entry(
+                    self.__track_id,
+                    audio_begin,
+                    self.__track_audio_length,
+                    PCM_CACHE_MAX_READ_AHEAD,
+                )
+                if cache_entry:
+                    audio_frames = self.__get_cached_audio_frames(
+                        cache_entry, audio_begin, audio_len
+                    )
+                else:
+                    audio_frames = self.__open_spotty_audio_frames(audio_begin, audio_len)
+
+            if gap_len > 0:
+                # Instead of delaying the response, as a pause Kodi can play (or show a
+                # visualizer over) while spotty starts up.
+                log_msg(f"Sending a {gap_len} bytes gap before the track.", LOGDEBUG)
+                for frame in self.__get_silence_frames(gap_len):
+                    yield frame
+                    bytes_sent += len(frame)
 
-            track_id_uri = SPOTIFY_TRACK_PREFIX + self.__track_id
-            self.__log_start_reading_audio(track_id_uri)
+            # Loop as long as there's something to output.
+            if audio_len > 0:
+                frames = self.__get_padded_audio_frames(audio_frames, audio_len)
+                if self.__track_gain != 1.0:
+                    frames = self.__apply_track_gain(frames, audio_begin)
+                if self.__is_crossfading(audio_begin + audio_len):
+                    frames = self.__crossfade_tail(frames, audio_begin)
+                if self.__converter:
+                    frames = self.__converter.convert(
+                        (get_frame_bytes(frame) for frame in frames),
+                        input_begin,
+                        output_begin,
+                        output_len,
+                    )
+                for frame in frames:
+                    yield frame
+                    bytes_sent += get_frame_length(frame)
+                    self.__log_continue_sending(bytes_sent)
+
+            if self.__terminated:
+                return
 
-            # Execute the spotty process, then collect stdout.
-            args = SPOTTY_STREAMING_DEFAULT_ARGS.copy()
-            if self.use_normalization:
-                args += SPOTTY_STREAMING_NORMALIZATION_ARGS
-            args += ["--single-track", track_id_uri]
-            spotty_process = self.__spotty.run_spotty(args)
-            self.__log_spotty_return_code(spotty_process)
-            self.__last_spotty_pid = spotty_process.pid
+            # All done.
+            self.__notify_track_finished(self.__track_id)
+            self.__log_finished_sending(range_begin, range_len, bytes_sent)
 
-            # Ignore the first x bytes to match the range request.
-            if range_begin != 0:
-                spotty_process.stdout.read(range_begin)
+        except Exception as ex:
+            self.__log_exception_sending(ex, range_begin, bytes_sent)
+        finally:
+            if audio_frames:
+                audio_frames.close()
+            if self.__shared_decode_reader:
+                self.__shared_decode.detach(self.__shared_decode_reader)
+
+    def get_stream_offset(self, position: float) -> int:
+        """the stream offset of a position in seconds, from the start of the stream's
+        data (so gap included)"""
+        data_length = self.__track_length - len(self.__wav_header)
+        position_offset = self.__output_format.get_data_length(max(0.0, position))
+        return len(self.__wav_header) + min(position_offset, data_length)
+
+    def send_seek_audio_stream(self, range_begin: int) -> Iterator[AudioFrame]:
+        """A whole wav stream that starts at a seek position, for a stream encoder: the
+        wav header, then the stream from 'range_begin' (in the data) to the end. The
+        header's data size is the whole track's, which the encoders ignore - they read
+        to the end of their input."""
+        wav_header_len = len(self.__wav_header)
+        if range_begin >= wav_header_len:
+            yield self.__wav_header
+        yield from self.send_part_audio_stream(self.__track_length - range_begin, range_begin)
+
+    def __get_padded_audio_frames(
+        self, audio_frames: Iterator[AudioFrame], audio_len: int
+    ) -> Iterator[AudioFrame]:
+        audio_sent = 0
+        for frame in audio_frames:
+            yield frame
+            audio_sent += get_frame_length(frame)
+
+        if self.__terminated:
+            return
 
-            # Loop as long as there's something to output.
-            while bytes_sent < range_len:
+        # Spotty's decode doesn't always match the track duration to the sample. Pad
+        # a short decode with silence, so Kodi gets exactly the promised length and
+        # doesn't wait on missing bytes. (A long decode is cut at 'audio_len'.)
+        if audio_sent < audio_len:
+            self.__log_padding_with_silence(audio_len - audio_sent)
+            yield from self.__get_silence_frames(audio_len - audio_sent)
+
+    def __apply_track_gain(self, frames: Iterator[AudioFrame], audio_begin: int) -> Iterator[bytes]:
+        """normalize the track's audio - checking the setting for each frame, so a
+        change applies straight away"""
+        gain_stage = GainStage(audio_begin)
+        for frame in frames:
+            gain = self.__track_gain if self.__decode_manager.is_normalizing_in_service() else 1.0
+            data = gain_stage.apply(get_frame_bytes(frame), gain)
+            if data:
+                yield data
+        data = gain_stage.flush()
+        if data:
+            yield data
+
+    def __is_crossfading(self, audio_end: int) -> bool:
+        if not self.__crossfade_length:
+            return False
+        fade_begin = self.__audio_range.end - self.__crossfade_length
+        return fade_begin > self.__audio_range.begin and audio_end > fade_begin
+
+    def __crossfade_tail(
+        self, frames: Iterator[AudioFrame], audio_begin: int
+    ) -> Iterator[AudioFrame]:
+        """mix the head of the next track into the audio of the fade at the end of
+        the track - the frames before the fade pass straight through"""
+        fade_begin = self.__audio_range.end - self.__crossfade_length
+        offset = audio_begin
+        pending = b""
+        for frame in frames:
+            if offset + self.__get_max_frame_length(frame) <= fade_begin:
+                yield frame
+                offset += get_frame_length(frame)
+                continue
+
+            data = get_frame_bytes(frame)
+            if offset < fade_begin:
+                yield data[: fade_begin - offset]
+                data = data[fade_begin - offset :]
+                offset = fade_begin
+            offset += len(data)
+
+            # Mix whole sample frames only - a partial one waits for the next frame.
+            pending += data
+            pending_begin = offset - len(pending)
+            # Unless a range starts mid sample frame, there's no lead to pass through.
+            lead_len = min((-pending_begin) % BLOCK_ALIGN, len(pending))
+            mix_len = (len(pending) - lead_len) - (len(pending) - lead_len) % BLOCK_ALIGN
+            if lead_len:
+                yield pending[:lead_len]
+            if mix_len:
+                tail = pending[lead_len : lead_len + mix_len]
+                yield self.__mix_crossfade(tail, pending_begin + lead_len - fade_begin)
+            pending = pending[lead_len + mix_len :]
+
+        if pending:
+            yield pending
+
+    @staticmethod
+    def __get_max_frame_length(frame: AudioFrame) -> int:
+        if isinstance(frame, (PipeFrame, FileFrame)):
+            return frame.length
+        return len(frame)
+
+    def __mix_crossfade(self, tail: bytes, position: int) -> bytes:
+        head = self.__get_crossfade_head()
+        if not head:
+            return tail
+        crossfader = Crossfader(self.__crossfade_length, NUM_CHANNELS)
+        return crossfader.mix(tail, head[position : position + len(tail)], position)
+
+    def __get_crossfade_head(self) -> bytes:
+        """the head of the next track in the playlist, fetched when the stream first
+        reaches the fade"""
+        if self.__crossfade_head is not None:
+            return self.__crossfade_head
+        self.__crossfade_head = b""
+
+        next_track = self.__get_next_track()
+        if not next_track or next_track[0] == self.__track_id:
+            return self.__crossfade_head
+        next_track_id, next_track_duration = next_track
+        next_track_length = self.get_audio_data_length(next_track_duration)
+        next_sound_begin, next_sound_end = self.__decode_manager.get_track_sound_range(
+            next_track_id, next_track_length
+        )
+        if next_sound_end - next_sound_begin < 2 * self.__crossfade_length:
+            return self.__crossfade_head
+
+        log_msg(f"Crossfading track '{self.__track_id}' into '{next_track_id}'.", LOGDEBUG)
+        head = self.__decode_manager.get_track_head(
+            next_track_id,
+            next_sound_begin,
+            self.__crossfade_length,
+            next_track_length,
+            SHARED_DECODE_WINDOW_SIZE,
+            lambda: self.__terminated,
+        )
+        if self.__terminated or len(head) < self.__crossfade_length:
+            log_msg(f"Could not get the head of track '{next_track_id}'.", LOGWARNING)
+            return self.__crossfade_head
+
+        if self.__decode_manager.is_normalizing_in_service():
+            head = GainStage().apply(head, self.__decode_manager.get_track_gain(next_track_id))
+
+        # The next track's stream starts after the head played here.
+        self.__decode_manager.set_faded_in_end(
+            next_track_id, next_sound_begin + self.__crossfade_length
+        )
+        self.__crossfade_head = head
+        return self.__crossfade_head
+
+    def __get_silence_frames(self, num_bytes: int) -> Iterator[bytes]:
+        while num_bytes > 0 and not self.__terminated:
+            frame = SILENCE_CHUNK[:num_bytes]
+            yield frame
+            num_bytes -= len(frame)
+
+    def __open_spotty_audio_frames(self, audio_begin: int, audio_len: int) -> Iterator[bytes]:
+        """start (or join) the spotty decode now, and return the frames to read it"""
+        # Spotty starts at a whole second, so the decode may begin before the range.
+        start_position, skip_bytes = self.get_start_position(audio_begin)
+        (
+            self.__shared_decode,
+            self.__shared_decode_reader,
+        ) = self.__decode_manager.open_shared_decode(
+            self.__track_id,
+            audio_begin,
+            start_position,
+            audio_begin - skip_bytes,
+            PCM_CACHE_MAX_READ_AHEAD,
+            SHARED_DECODE_WINDOW_SIZE,
+        )
+        return self.__get_spotty_audio_frames(
+            self.__shared_decode, self.__shared_decode_reader, audio_len
+        )
+
+    def __get_spotty_audio_frames(
+        self, shared_decode: SharedDecode, reader: SharedDecodeReader, audio_len: int
+    ) -> Iterator[bytes]:
+        chunk_sizer = AudioChunkSizer()
+        audio_sent = 0
+        while audio_sent < audio_len:
+            if self.__terminated:
+                return
+
+            frame_start = time.monotonic()
+            data = shared_decode.read(
+                reader,
+                min(chunk_sizer.get_size(), audio_len - audio_sent),
+                lambda: self.__terminated,
+            )
+            if self.__terminated:
+                return
+            if not data:
+                log_msg("Nothing read from the spotty decode.", LOGERROR)
+                break
+
+            yield data
+            chunk_sizer.update(len(data), time.monotonic() - frame_start)
+            audio_sent += len(data)
+
+    def __get_cached_audio_frames(
+        self, cache_entry: PcmCacheEntry, audio_begin: int, audio_len: int
+    ) -> Iterator[FileFrame]:
+        log_msg(
+            f"Reading track '{cache_entry.track_id}' from the pcm cache"
+            f" (complete = {cache_entry.is_complete()}).",
+            LOGDEBUG,
+        )
+
+        reader = cache_entry.open_reader()
+        self.__is_reading_pcm_cache = True
+        chunk_sizer = AudioChunkSizer()
+        try:
+            offset = audio_begin
+            audio_end = audio_begin + audio_len
+            while offset < audio_end:
                 if self.__terminated:
                     return
 
-                frame = spotty_process.stdout.read(SPOTTY_AUDIO_CHUNK_SIZE)
+                available = cache_entry.wait_for_data(offset, lambda: self.__terminated)
                 if self.__terminated:
                     return
-                if not frame:
-                    log_msg("Nothing read from stdout.", LOGERROR)
+                if available <= offset:
+                    log_msg("No more cached audio data.", LOGERROR)
                     break
 
-                bytes_sent += len(frame)
-                self.__log_continue_sending(bytes_sent)
+                frame = FileFrame(
+                    reader,
+                    offset,
+                    min(chunk_sizer.get_size(), audio_end - offset, available - offset),
+                    available,
+                )
+                frame_start = time.monotonic()
                 yield frame
+                if not frame.transferred:
+                    break
+                chunk_sizer.update(frame.transferred, time.monotonic() - frame_start)
+                offset += frame.transferred
 
-            # All done.
-            self.__notify_track_finished(self.__track_id)
-            self.__log_finished_sending(range_begin, bytes_sent)
-
-        except Exception as ex:
-            self.__log_exception_sending(ex, range_begin, bytes_sent)
         finally:
-            # Make sure spotty always gets terminated.
-            if spotty_process:
-                self.__last_spotty_pid = -1
-                spotty_process.terminate()
-                spotty_process.communicate()
-                # Make really sure!
-                kill_process_by_pid(spotty_process.pid)
-
-    def __kill_last_spotty(self) -> None:
-        if self.__last_spotty_pid == -1:
-            return
-        kill_process_by_pid(self.__last_spotty_pid)
-        self.__last_spotty_pid = -1
+            self.__is_reading_pcm_cache = False
+            reader.close()
+
+    @staticmethod
+    def get_start_position(audio_begin: int) -> Tuple[int, int]:
+        """Map an audio data offset to a spotty start position (whole seconds) and the
+        number of bytes to skip after that position to reach the sample aligned offset."""
+        aligned_begin = audio_begin - (audio_begin % BLOCK_ALIGN)
+        start_position = aligned_begin // BYTE_RATE
+        skip_bytes = audio_begin - (start_position * BYTE_RATE)
+        return start_position, skip_bytes
 
     def __log_start_transfer(self, range_begin: int) -> None:
         log_msg(
             f"Start transfer for track '{self.__track_id}' - range begin: {range_begin}",
             LOGDEBUG,
         )
-        log_msg(f"Use Spotify normalization: {self.use_normalization}.", LOGDEBUG)
+        log_msg(f"Use Spotify normalization: {self.__decode_manager.use_normalization}.", LOGDEBUG)
 
     def __log_send_wav_header(self) -> None:
         log_msg(
@@ -149,13 +468,6 @@ class SpottyAudioStreamer:
             LOGDEBUG,
         )
 
-    def __log_start_reading_audio(self, track_id_uri: str) -> None:
-        log_msg(
-            f"Start reading audio data for track: '{track_id_uri}',"
-            f" length = {self.__track_length} ({self.__get_mb_str(self.__track_length)}).",
-            LOGDEBUG,
-        )
-
     def __log_continue_sending(self, bytes_sent: int) -> None:
         log_msg(
             f"Continue sending track '{self.__track_id}'"
@@ -163,13 +475,26 @@ class SpottyAudioStreamer:
             LOGDEBUG,
         )
 
-    def __log_finished_sending(self, range_begin: int, bytes_sent: int) -> None:
+    def __log_padding_with_silence(self, num_bytes: int) -> None:
+        log_msg(
+            f"Decode of track '{self.__track_id}' is {num_bytes} bytes short."
+            f" Padding with silence.",
+            LOGWARNING,
+        )
+
+    def __log_finished_sending(self, range_begin: int, range_len: int, bytes_sent: int) -> None:
         log_msg(
             f"Finished sending track '{self.__track_id}'"
             f" - range begin {range_begin}"
             f" - range end {bytes_sent} - {self.__get_mb_str(bytes_sent)}.",
             LOGDEBUG,
         )
+        if bytes_sent != range_len:
+            log_msg(
+                f"Sent {bytes_sent} bytes of track '{self.__track_id}',"
+                f" but the range length is {range_len}.",
+                LOGERROR,
+            )
 
     def __log_exception_sending(self, ex: Exception, range_begin: int, bytes_sent: int) -> None:
         log_msg(
@@ -180,14 +505,6 @@ class SpottyAudioStreamer:
         )
         log_msg(f"Exception: {ex}")
 
-    @staticmethod
-    def __log_spotty_return_code(spotty_process: subprocess.Popen) -> None:
-        if spotty_process.returncode:
-            log_msg(
-                f"Spotty process return code: {spotty_process.returncode}",
-                LOGWARNING,
-            )
-
     @staticmethod
     def __get_mb_str(data_bytes: int) -> str:
         data_mb = bytes_to_megabytes(data_bytes)
@@ -199,15 +516,20 @@ class SpottyAudioStreamer:
         percent = int(100.0 * float(data_bytes) / float(track_length))
         return f"sent so far: {data_mb:>5.1f}MB ({percent:>3}%)"
 
+    @staticmethod
+    def get_audio_data_length(track_duration: float) -> int:
+        """exact spotty pcm length of a track whose duration is in seconds with
+        millisecond precision (as in the track urls)"""
+        return SPOTTY_PCM_FORMAT.get_data_length(track_duration)
+
     def __create_wav_header(self) -> Tuple[bytes, int]:
         """generate a wav header for the stream"""
         try:
             log_msg(f"Start getting wav header. Duration = {self.__track_duration}", LOGDEBUG)
             file = BytesIO()
-            num_samples = 44100 * self.__track_duration
-            channels = 2
-            sample_rate = 44100
-            bits_per_sample = 16
+            channels = self.__output_format.num_channels
+            sample_rate = self.__output_format.sample_rate
+            bits_per_sample = self.__output_format.bits_per_sample
 
             # Generate format chunk.
             format_chunk_spec = "<4sLHHLLHH"
@@ -218,14 +540,14 @@ class SpottyAudioStreamer:
                 1,  # Audio format, 1 for PCM
                 channels,  # Number of channels
                 sample_rate,  # Samplerate, 44100, 48000, etc.
-                sample_rate * channels * (bits_per_sample // 8),  # Byterate
-                channels * (bits_per_sample // 8),  # Blockalign
+                self.__output_format.byte_rate,  # Byterate
+                self.__output_format.block_align,  # Blockalign
                 bits_per_sample,  # 16 bits for two byte samples, etc.
             )
 
             # Generate data chunk.
             data_chunk_spec = "<4sL"
-            data_size = num_samples * channels * (bits_per_sample / 8)
+            data_size = self.__gap_length + self.__audio_length
             data_chunk = struct.pack(
                 data_chunk_spec,
                 "data".encode(encoding="UTF-8"),  # Chunk id
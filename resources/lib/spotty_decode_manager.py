@@ -0,0 +1,424 @@
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Tuple, Union
+
+from xbmc import LOGDEBUG, LOGWARNING
+
+from decode_analyzer import DecodeAnalyzer
+from loudness import LoudnessMeter, TrackLoudnessStore, get_normalization_gain
+from pcm_cache import PcmCache, PcmCacheEntry, PcmCacheWriter, get_pcm_cache_key
+from shared_decode import SharedDecode, SharedDecodeReader
+from silence_trimmer import SilenceDetector, TrackSilenceStore
+from spotty import Spotty
+from utils import log_msg
+
+SPOTIFY_TRACK_PREFIX = "spotify:track:"
+
+SPOTIFY_BITRATE = "320"
+SPOTTY_INITIAL_VOLUME = "50"
+SPOTTY_GAIN_TYPE = "track"
+SPOTTY_STREAMING_DEFAULT_ARGS = [
+    "--disable-audio-cache",
+    "--disable-discovery",
+    "--bitrate",
+    SPOTIFY_BITRATE,
+    "--initial-volume",
+    SPOTTY_INITIAL_VOLUME,
+]
+SPOTTY_STREAMING_NORMALIZATION_ARGS = [
+    "--enable-volume-normalisation",
+    "--normalisation-gain-type",
+    SPOTTY_GAIN_TYPE,
+]
+SPOTTY_START_POSITION_ARG = "--start-position"
+
+# Only the last few crossfades matter - a track is faded into just before it plays.
+MAX_FADED_IN_TRACKS = 20
+# How long a track's streams keep the audio range they started with, after the last
+# request for the track. Kodi reconnects (e.g., after a pause) must get the same length.
+TRACK_AUDIO_RANGE_HOLD_SECS = 30 * 60
+
+
+class TrackAudioRange:
+    """the part of a track's audio its streams send - 'begin' is past the head if the
+    track was faded into, which also means it has no gap"""
+
+    def __init__(self, begin: int, end: int, is_faded_in: bool):
+        self.begin = begin
+        self.end = end
+        self.is_faded_in = is_faded_in
+
+
+class SpottyDecodeManager:
+    """What all the track streams share: the pcm cache and the writers decoding tracks
+    into it, and the shared (in memory) track decodes."""
+
+    def __init__(
+        self,
+        spotty: Spotty,
+        pcm_cache: PcmCache,
+        track_silence_store: Union[TrackSilenceStore, None] = None,
+        track_loudness_store: Union[TrackLoudnessStore, None] = None,
+    ):
+        self.__spotty = spotty
+        self.__spotty_supervisor = spotty.get_spotty_supervisor()
+        self.__pcm_cache = pcm_cache
+        # pcm cache key -> writer
+        self.__pcm_cache_writers: Dict[str, PcmCacheWriter] = {}
+        self.__prefetch_key = ""
+        self.__pcm_cache_lock = threading.Lock()
+        self.__shared_decodes: List[SharedDecode] = []
+        self.__shared_decodes_lock = threading.Lock()
+        self.__track_silence_store = track_silence_store
+        # With a loudness store, the streams normalize, and spotty never does.
+        self.__track_loudness_store = track_loudness_store
+        self.__faded_in_ends: Dict[str, int] = OrderedDict()
+        self.__held_audio_ranges: Dict[str, Tuple[TrackAudioRange, float]] = {}
+        self.__track_audio_lock = threading.Lock()
+
+        self.use_normalization = True
+
+    def get_spotty_process_stats(self) -> Dict[str, int]:
+        return self.__spotty_supervisor.get_stats()
+
+    def close(self) -> None:
+        with self.__pcm_cache_lock:
+            for key in list(self.__pcm_cache_writers):
+                self.__cancel_pcm_cache_writer(key)
+        with self.__shared_decodes_lock:
+            for shared_decode in self.__shared_decodes:
+                shared_decode.close()
+            self.__shared_decodes.clear()
+        if self.__track_loudness_store:
+            self.__track_loudness_store.close()
+
+    def get_pcm_cache_entry(
+        self, track_id: str, audio_begin: int, audio_length: int, max_read_ahead: int
+    ) -> Union[PcmCacheEntry, None]:
+        """the cache entry to stream 'track_id' from - starting a cache writer for the
+        track if it's not cached yet - or None if it's quicker to run spotty"""
+        if not self.__pcm_cache.is_enabled():
+            return None
+
+        with self.__pcm_cache_lock:
+            cache_entry = self.__pcm_cache.get_entry(track_id, self.__is_spotty_normalizing())
+            if cache_entry:
+                if cache_entry.is_complete():
+                    return cache_entry
+                if audio_begin <= cache_entry.get_written() + max_read_ahead:
+                    return cache_entry
+                # Seeking well past the decode head is quicker with a new spotty.
+                return None
+
+            if audio_begin > max_read_ahead:
+                return None
+
+            return self.__start_pcm_cache_writer(track_id, audio_length, False)
+
+    def release_pcm_cache_writer(self, track_id: str, own_readers: int) -> bool:
+        """cancel the cache writer for the track of a terminated stream - unless it's
+        the prefetch track, or other streams are still reading it"""
+        key = get_pcm_cache_key(track_id, self.__is_spotty_normalizing())
+        with self.__pcm_cache_lock:
+            pcm_cache_writer = self.__pcm_cache_writers.get(key)
+            if not pcm_cache_writer or key == self.__prefetch_key:
+                return False
+            if pcm_cache_writer.get_cache_entry().get_num_readers() > own_readers:
+                return False
+            return self.__cancel_pcm_cache_writer(key)
+
+    def prefetch_track(self, track_id: str, audio_length: int) -> bool:
+        """start decoding a track, at low priority, into the pcm cache"""
+        if not self.__pcm_cache.is_enabled():
+            return False
+
+        is_normalized = self.__is_spotty_normalizing()
+        key = get_pcm_cache_key(track_id, is_normalized)
+        with self.__pcm_cache_lock:
+            if self.__pcm_cache.get_entry(track_id, is_normalized):
+                return False
+
+            # Only keep the prefetch for the latest next track.
+            if self.__prefetch_key and self.__prefetch_key != key:
+                self.__cancel_pcm_cache_writer(self.__prefetch_key)
+            self.__prefetch_key = key
+
+            log_msg(f"Prefetching track '{track_id}'.", LOGDEBUG)
+            return self.__start_pcm_cache_writer(track_id, audio_length, True) is not None
+
+    def open_shared_decode(
+        self,
+        track_id: str,
+        audio_begin: int,
+        start_position: int,
+        decode_begin: int,
+        max_read_ahead: int,
+        window_size: int,
+    ) -> Tuple[SharedDecode, SharedDecodeReader]:
+        """a reader at 'audio_begin' of a running decode of the track - or of a new
+        decode, started at 'start_position' (audio offset 'decode_begin'), if no
+        running decode can serve the offset"""
+        with self.__shared_decodes_lock:
+            self.__shared_decodes = [d for d in self.__shared_decodes if not d.is_closed()]
+            for shared_decode in self.__shared_decodes:
+                if shared_decode.track_id != track_id:
+                    continue
+                reader = shared_decode.try_attach(audio_begin, max_read_ahead)
+                if reader:
+                    log_msg(
+                        f"Joining the shared decode of '{track_id}'"
+                        f" ({shared_decode.get_num_readers()} readers).",
+                        LOGDEBUG,
+                    )
+                    return shared_decode, reader
+
+            shared_decode = SharedDecode(
+                track_id,
+                decode_begin,
+                self.run_spotty(track_id, start_position),
+                self.__spotty_supervisor,
+                window_size,
+                self.__get_decode_analyzers(track_id) if decode_begin == 0 else None,
+            )
+            reader = shared_decode.try_attach(audio_begin, max_read_ahead)
+            shared_decode.start()
+            self.__shared_decodes.append(shared_decode)
+
+            return shared_decode, reader
+
+    @staticmethod
+    def release_shared_decode(shared_decode: SharedDecode, reader: SharedDecodeReader) -> bool:
+        """release a terminated stream's reader of a decode, which stops the decode if
+        no other stream reads it"""
+        return shared_decode.release(reader)
+
+    def get_track_audio_range(self, track_id: str, audio_length: int) -> TrackAudioRange:
+        """the track's audio its streams send - its sound range, less any head already
+        played in the previous track's crossfade. The range is kept for the track's
+        later requests."""
+        with self.__track_audio_lock:
+            now = time.monotonic()
+            self.__held_audio_ranges = {
+                held_track_id: held
+                for held_track_id, held in self.__held_audio_ranges.items()
+                if now - held[1] < TRACK_AUDIO_RANGE_HOLD_SECS
+            }
+            if track_id in self.__held_audio_ranges:
+                audio_range = self.__held_audio_ranges[track_id][0]
+            else:
+                audio_range = self.__get_new_track_audio_range(track_id, audio_length)
+            self.__held_audio_ranges[track_id] = (audio_range, now)
+
+            return audio_range
+
+    def __get_new_track_audio_range(self, track_id: str, audio_length: int) -> TrackAudioRange:
+        begin, end = self.get_track_sound_range(track_id, audio_length)
+        faded_in_end = min(self.__faded_in_ends.get(track_id, 0), end)
+        if faded_in_end > begin:
+            return TrackAudioRange(faded_in_end, end, True)
+        if (begin, end) != (0, audio_length):
+            log_msg(f"Trimmed track '{track_id}' to {begin}-{end} of {audio_length}.", LOGDEBUG)
+        return TrackAudioRange(begin, end, False)
+
+    def get_track_sound_range(self, track_id: str, audio_length: int) -> Tuple[int, int]:
+        """the (begin, end) of the track's audio without any trimmed silence"""
+        sound_range = None
+        if self.__track_silence_store:
+            sound_range = self.__track_silence_store.get_sound_range(track_id)
+        if not sound_range:
+            return 0, audio_length
+        begin, end = min(sound_range[0], audio_length), min(sound_range[1], audio_length)
+        if begin >= end:
+            return 0, audio_length
+        return begin, end
+
+    def set_faded_in_end(self, track_id: str, faded_in_end: int) -> None:
+        """the previous track's stream has already played the track up to
+        'faded_in_end', mixed into its tail"""
+        with self.__track_audio_lock:
+            self.__faded_in_ends[track_id] = faded_in_end
+            self.__faded_in_ends.move_to_end(track_id)
+            while len(self.__faded_in_ends) > MAX_FADED_IN_TRACKS:
+                self.__faded_in_ends.popitem(last=False)
+
+    def get_track_head(
+        self,
+        track_id: str,
+        head_begin: int,
+        head_length: int,
+        audio_length: int,
+        window_size: int,
+        is_cancelled: Callable[[], bool],
+    ) -> bytes:
+        """'head_length' bytes of the track's audio at 'head_begin' (for a crossfade),
+        from the pcm cache or a shared decode - which the track's own stream can then
+        use"""
+        cache_entry = self.get_pcm_cache_entry(track_id, 0, audio_length, 0)
+        if cache_entry:
+            reader = cache_entry.open_reader()
+            try:
+                head_end = head_begin + head_length
+                available = cache_entry.wait_for_data(head_end - 1, is_cancelled)
+                return reader.read(head_begin, min(head_end, available) - head_begin, available)
+            finally:
+                reader.close()
+
+        shared_decode, reader = self.open_shared_decode(
+            track_id, head_begin, 0, 0, head_begin, window_size
+        )
+        try:
+            head = bytearray()
+            while len(head) < head_length:
+                data = shared_decode.read(reader, head_length - len(head), is_cancelled)
+                if not data:
+                    break
+                head += data
+            return bytes(head)
+        finally:
+            shared_decode.detach(reader)
+
+    def is_sharing_track(self, track_id: str) -> bool:
+        """is the track in the pcm cache, or being decoded for another stream"""
+        if self.is_caching_track(track_id):
+            return True
+        with self.__shared_decodes_lock:
+            return any(d.track_id == track_id and not d.is_closed() for d in self.__shared_decodes)
+
+    def is_caching_track(self, track_id: str) -> bool:
+        with self.__pcm_cache_lock:
+            if not self.__pcm_cache.is_enabled():
+                return False
+            cache_entry = self.__pcm_cache.get_entry(track_id, self.__is_spotty_normalizing())
+            return cache_entry is not None and not cache_entry.is_failed()
+
+    def get_num_live_decodes(self) -> int:
+        """the spotty decodes running for streams - the prefetch doesn't count"""
+        return len(self.__get_live_stream_decodes())
+
+    def is_decoding_track(self, track_id: str) -> bool:
+        return track_id in self.__get_live_stream_decodes()
+
+    def release_unread_decodes(self) -> int:
+        """stop the stream decodes that no stream reads anymore (lingering for a
+        reconnect, or finishing a cache entry), returning how many were stopped"""
+        num_released = 0
+        with self.__pcm_cache_lock:
+            for key, pcm_cache_writer in list(self.__pcm_cache_writers.items()):
+                if key == self.__prefetch_key:
+                    continue
+                if not pcm_cache_writer.get_cache_entry().get_num_readers():
+                    num_released += self.__cancel_pcm_cache_writer(key)
+        with self.__shared_decodes_lock:
+            for shared_decode in self.__shared_decodes:
+                if shared_decode.is_decoding() and not shared_decode.get_num_readers():
+                    log_msg(f"Closing unread shared decode of '{shared_decode.track_id}'.")
+                    shared_decode.close()
+                    num_released += 1
+        return num_released
+
+    def __get_live_stream_decodes(self) -> List[str]:
+        # The track id of each running cache writer and shared decode.
+        with self.__pcm_cache_lock:
+            decodes = [
+                pcm_cache_writer.get_cache_entry().track_id
+                for key, pcm_cache_writer in self.__pcm_cache_writers.items()
+                if key != self.__prefetch_key and pcm_cache_writer.is_running()
+            ]
+        with self.__shared_decodes_lock:
+            decodes += [d.track_id for d in self.__shared_decodes if d.is_decoding()]
+        return decodes
+
+    def __start_pcm_cache_writer(
+        self, track_id: str, audio_length: int, low_priority: bool
+    ) -> Union[PcmCacheEntry, None]:
+        is_normalized = self.__is_spotty_normalizing()
+        cache_entry = self.__pcm_cache.create_entry(track_id, is_normalized, audio_length)
+        if not cache_entry:
+            return None
+
+        pcm_cache_writer = PcmCacheWriter(
+            self.__pcm_cache,
+            cache_entry,
+            self.__spawn_spotty(track_id, 0, is_normalized, low_priority),
+            self.__spotty_supervisor,
+            self.__get_decode_analyzers(track_id),
+        )
+        self.__pcm_cache_writers[cache_entry.key] = pcm_cache_writer
+        pcm_cache_writer.start()
+
+        return cache_entry
+
+    def __get_decode_analyzers(self, track_id: str) -> List[DecodeAnalyzer]:
+        # Each track is only analyzed once.
+        analyzers: List[DecodeAnalyzer] = []
+        if self.__track_silence_store:
+            if not self.__track_silence_store.get_sound_range(track_id):
+                analyzers.append(
+                    SilenceDetector(track_id, self.__track_silence_store.set_sound_range)
+                )
+        if self.__track_loudness_store:
+            if not self.__track_loudness_store.get_loudness(track_id):
+                analyzers.append(LoudnessMeter(track_id, self.__track_loudness_store.set_loudness))
+        return analyzers
+
+    def __cancel_pcm_cache_writer(self, key: str) -> bool:
+        pcm_cache_writer = self.__pcm_cache_writers.pop(key, None)
+        if not pcm_cache_writer or not pcm_cache_writer.is_running():
+            return False
+        log_msg(f"Cancel caching track '{pcm_cache_writer.get_cache_entry().track_id}'.", LOGDEBUG)
+        pcm_cache_writer.cancel()
+        return True
+
+    def run_spotty(
+        self, track_id: str, start_position: int, low_priority: bool = False
+    ) -> subprocess.Popen:
+        return self.__spawn_spotty(
+            track_id, start_position, self.__is_spotty_normalizing(), low_priority
+        )
+
+    def __is_spotty_normalizing(self) -> bool:
+        return self.use_normalization and not self.__track_loudness_store
+
+    def is_normalizing_in_service(self) -> bool:
+        return self.use_normalization and self.__track_loudness_store is not None
+
+    def get_track_gain(self, track_id: str) -> float:
+        """the gain that normalizes the track in the streams - 1.0 (no gain) if its
+        loudness isn't known yet, or spotty normalizes"""
+        if not self.__track_loudness_store:
+            return 1.0
+        loudness = self.__track_loudness_store.get_loudness(track_id)
+        if not loudness:
+            return 1.0
+        return get_normalization_gain(*loudness)
+
+    def __spawn_spotty(
+        self,
+        track_id: str,
+        start_position: int,
+        use_normalization: bool,
+        low_priority: bool = False,
+    ) -> subprocess.Popen:
+        track_id_uri = SPOTIFY_TRACK_PREFIX + track_id
+        log_msg(f"Start reading audio data for track: '{track_id_uri}'.", LOGDEBUG)
+
+        args = SPOTTY_STREAMING_DEFAULT_ARGS.copy()
+        if use_normalization:
+            args += SPOTTY_STREAMING_NORMALIZATION_ARGS
+        args += ["--single-track", track_id_uri]
+        if start_position:
+            args += [SPOTTY_START_POSITION_ARG, str(start_position)]
+        spotty_process = self.__spotty.run_spotty(args, low_priority)
+        self.__log_spotty_return_code(spotty_process)
+
+        return spotty_process
+
+    @staticmethod
+    def __log_spotty_return_code(spotty_process: subprocess.Popen) -> None:
+        if spotty_process.returncode:
+            log_msg(
+                f"Spotty process return code: {spotty_process.returncode}",
+                LOGWARNING,
+            )
@@ -1,14 +1,17 @@
+import json
 import os
 import platform
 import shutil
 import stat
 import subprocess
-from typing import Union
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Union
 
 import xbmc
 from xbmc import LOGERROR
 
-from utils import log_msg, log_exception
+from utils import ADDON_DATA_PATH, log_msg, log_exception
 
 # IMPORTANT: To allow 'spotty' to run on Android, we need to run it from the
 #            kodi package's internal writeable directory. Same with temp files
@@ -16,6 +19,8 @@ from utils import log_msg, log_exception
 KODI_ANDROID_INTERNAL_WRITABLE_DIR = "/data/data/org.xbmc.kodi"
 SPOTTY_SUBDIR = "deps/spotty"
 
+SPOTTY_BINARY_CACHE_FILE = os.path.join(ADDON_DATA_PATH, "spotty-binary.json")
+
 
 class SpottyHelper:
     def __init__(self):
@@ -25,29 +30,28 @@ class SpottyHelper:
         if xbmc.getCondVisibility("System.Platform.Android"):
             self.spotty_rust_env["TMPDIR"] = KODI_ANDROID_INTERNAL_WRITABLE_DIR
 
-    def kill_all_spotties(self) -> None:
-        if platform.system() == "Windows":
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            subprocess.Popen(["taskkill", "/IM", "spotty.exe"], startupinfo=startupinfo, shell=True)
-        else:
-            sp_binary_file = os.path.basename(self.spotty_binary_path)
-            os.system("killall --quiet " + sp_binary_file)
-
     @staticmethod
     def __get_spotty_path() -> Union[str, None]:
-        """find the correct spotty binary belonging to the platform"""
+        """find the correct spotty binary belonging to the platform - detected once,
+        then cached until the platform or the add-on's binary changes"""
+        platform_name = SpottyHelper.__get_platform_name()
+        spotty_path = SpottyHelper.__get_cached_spotty_path(platform_name)
+        if spotty_path:
+            log_msg(f"Using cached spotty binary '{spotty_path}'.")
+            return spotty_path
+
+        # The add-on's binary, and the path it runs from (a copy on Android).
+        binary = None
         spotty_path = None
-        if xbmc.getCondVisibility("System.Platform.Windows"):
-            spotty_path = os.path.join(
-                os.path.dirname(__file__), SPOTTY_SUBDIR, "windows", "spotty.exe"
-            )
-        elif xbmc.getCondVisibility("System.Platform.OSX"):
-            spotty_path = os.path.join(os.path.dirname(__file__), SPOTTY_SUBDIR, "macos", "spotty")
-        elif xbmc.getCondVisibility("System.Platform.Android"):
-            spotty_path = SpottyHelper.__get_android_spotty_path()
-        elif xbmc.getCondVisibility("System.Platform.Linux"):
-            spotty_path = SpottyHelper.__get_linux_spotty_path()
+        if platform_name.startswith("Windows"):
+            binary = os.path.join(os.path.dirname(__file__), SPOTTY_SUBDIR, "windows", "spotty.exe")
+        elif platform_name.startswith("OSX"):
+            binary = os.path.join(os.path.dirname(__file__), SPOTTY_SUBDIR, "macos", "spotty")
+        elif platform_name.startswith("Android"):
+            binary, spotty_path = SpottyHelper.__get_android_spotty_path()
+        elif platform_name.startswith("Linux"):
+            binary = SpottyHelper.__get_linux_spotty_path()
+        spotty_path = spotty_path or binary
 
         if not spotty_path:
             log_msg(
@@ -60,13 +64,19 @@ class SpottyHelper:
         st = os.stat(spotty_path)
         os.chmod(spotty_path, st.st_mode | stat.S_IEXEC)
         log_msg(f"Spotty architecture detected. Using spotty binary '{spotty_path}'.")
+        SpottyHelper.__cache_spotty_path(platform_name, binary, spotty_path)
 
         return spotty_path
 
     @staticmethod
-    def __get_android_spotty_path() -> Union[str, None]:
-        spotty_path = None
+    def __get_platform_name() -> str:
+        for platform_name in ("Windows", "OSX", "Android", "Linux"):
+            if xbmc.getCondVisibility(f"System.Platform.{platform_name}"):
+                return f"{platform_name}-{platform.machine()}"
+        return ""
 
+    @staticmethod
+    def __get_android_spotty_path() -> Tuple[Union[str, None], Union[str, None]]:
         # Try by testing to get the correct binary path.
         candidate_paths = [
             ("arm-android", "spotty"),
@@ -74,23 +84,39 @@ class SpottyHelper:
             ("x86-android", "spotty"),
             ("x86-android", "spotty-x86_64"),
         ]
-        for path in candidate_paths:
-            binary = os.path.join(os.path.dirname(__file__), SPOTTY_SUBDIR, path[0], path[1])
-            test_binary = os.path.join(KODI_ANDROID_INTERNAL_WRITABLE_DIR, "spotty")
-            shutil.copyfile(binary, test_binary)
-            os.chmod(test_binary, stat.S_IRWXU + stat.S_IRWXG + stat.S_IRWXO)
-            if SpottyHelper.__test_spotty(test_binary):
-                spotty_path = test_binary
-                log_msg(f"Found candidate spotty path: '{binary}'.")
-                break
-            os.remove(test_binary)
-
-        return spotty_path
+        binaries = [
+            os.path.join(os.path.dirname(__file__), SPOTTY_SUBDIR, path[0], path[1])
+            for path in candidate_paths
+        ]
+        # Each candidate gets its own copy, so they can be tested at the same time. The
+        # copies have names of their own, as the plugin and the service can both be
+        # detecting at once.
+        spotty_path = os.path.join(KODI_ANDROID_INTERNAL_WRITABLE_DIR, "spotty")
+        test_binaries = []
+        try:
+            for binary in binaries:
+                test_binary = SpottyHelper.__make_temp_file(spotty_path, "-test")
+                test_binaries.append(test_binary)
+                shutil.copyfile(binary, test_binary)
+                os.chmod(test_binary, stat.S_IRWXU + stat.S_IRWXG + stat.S_IRWXO)
+
+            found = SpottyHelper.__test_spotties(test_binaries)
+            if found is not None:
+                os.replace(test_binaries[found], spotty_path)
+        except OSError as exc:
+            log_exception(exc, "Could not copy the spotty binaries to test")
+            found = None
+        finally:
+            for test_binary in test_binaries:
+                SpottyHelper.__remove_file(test_binary)
+        if found is None:
+            return None, None
+
+        log_msg(f"Found candidate spotty path: '{binaries[found]}'.")
+        return binaries[found], spotty_path
 
     @staticmethod
     def __get_linux_spotty_path() -> Union[str, None]:
-        spotty_path = None
-
         architecture = platform.machine()
         log_msg(f"Reported architecture: '{architecture}'.")
         if architecture.startswith("AMD64") or architecture.startswith("x86_64"):
@@ -98,21 +124,94 @@ class SpottyHelper:
             spotty_path = os.path.join(
                 os.path.dirname(__file__), SPOTTY_SUBDIR, "x86-linux", "spotty-x86_64"
             )
-        else:
-            # When we're unsure about the platform/cpu, try by testing to get
-            # the correct binary path.
-            candidate_paths = [
-                ("arm-linux", "spotty-muslhf"),
-                ("arm-linux", "spotty"),
-                ("x86-linux", "spotty"),
-            ]
-            for path in candidate_paths:
-                binary = os.path.join(os.path.dirname(__file__), SPOTTY_SUBDIR, path[0], path[1])
-                if SpottyHelper.__test_spotty(binary):
-                    spotty_path = binary
-                    break
+            return spotty_path
 
-        return spotty_path
+        # When we're unsure about the platform/cpu, try by testing to get
+        # the correct binary path.
+        candidate_paths = [
+            ("arm-linux", "spotty-muslhf"),
+            ("arm-linux", "spotty"),
+            ("x86-linux", "spotty"),
+        ]
+        binaries = [
+            os.path.join(os.path.dirname(__file__), SPOTTY_SUBDIR, path[0], path[1])
+            for path in candidate_paths
+        ]
+        found = SpottyHelper.__test_spotties(binaries)
+
+        return None if found is None else binaries[found]
+
+    @staticmethod
+    def __test_spotties(binary_paths: List[str]) -> Union[int, None]:
+        """self-test candidate binaries in parallel - returns the index of the first
+        one, in order, that passed"""
+        with ThreadPoolExecutor(len(binary_paths)) as executor:
+            results = list(executor.map(SpottyHelper.__test_spotty, binary_paths))
+        return next((index for index, ok in enumerate(results) if ok), None)
+
+    @staticmethod
+    def __get_cached_spotty_path(platform_name: str) -> Union[str, None]:
+        try:
+            with open(SPOTTY_BINARY_CACHE_FILE, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached["platform"] != platform_name:
+                return None
+            # An add-on upgrade replaces the binary.
+            if SpottyHelper.__get_file_stat(cached["binary"]) != cached["binary_stat"]:
+                return None
+            spotty_path = cached["path"]
+            if spotty_path != cached["binary"]:
+                # The Android copy could have been removed, or left half written.
+                if SpottyHelper.__get_file_stat(spotty_path)[0] != cached["binary_stat"][0]:
+                    return None
+            if not os.access(spotty_path, os.X_OK):
+                return None
+            return spotty_path
+        except (OSError, ValueError, KeyError, TypeError, IndexError):
+            return None
+
+    @staticmethod
+    def __cache_spotty_path(platform_name: str, binary: str, spotty_path: str) -> None:
+        cached = {
+            "platform": platform_name,
+            "binary": binary,
+            "binary_stat": SpottyHelper.__get_file_stat(binary),
+            "path": spotty_path,
+        }
+        temp_path = None
+        try:
+            os.makedirs(ADDON_DATA_PATH, exist_ok=True)
+            temp_path = SpottyHelper.__make_temp_file(SPOTTY_BINARY_CACHE_FILE, ".tmp")
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(cached, f)
+            os.replace(temp_path, SPOTTY_BINARY_CACHE_FILE)
+        except Exception as exc:
+            log_exception(exc, f"Could not cache the spotty binary in '{SPOTTY_BINARY_CACHE_FILE}'")
+        finally:
+            if temp_path:
+                SpottyHelper.__remove_file(temp_path)
+
+    @staticmethod
+    def __make_temp_file(path: str, suffix: str) -> str:
+        """a new, empty file next to 'path', with a name only this process uses"""
+        fd, temp_path = tempfile.mkstemp(
+            prefix=os.path.basename(path) + suffix, dir=os.path.dirname(path)
+        )
+        os.close(fd)
+        return temp_path
+
+    @staticmethod
+    def __remove_file(path: str) -> None:
+        # Already moved into place, or removed.
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def __get_file_stat(path: str) -> List[int]:
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
 
     @classmethod
     def __test_spotty(cls, binary_path: str) -> bool:
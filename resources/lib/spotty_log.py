@@ -0,0 +1,79 @@
+import re
+import threading
+import time
+from collections import deque
+from typing import BinaryIO, Deque, Dict, List, Tuple
+
+from xbmc import LOGWARNING
+
+from utils import log_msg, log_exception
+
+SPOTTY_LOG_MAX_LINES = 1000
+
+# Spotty (librespot) log lines worth timing from the process start, e.g.,
+#   [2024-08-20T10:15:32Z INFO  librespot_core::session] Connecting to AP "ap.spotify.com:4070"
+#   [2024-08-20T10:15:33Z INFO  librespot_playback::player] <Track> (412 ms) loaded
+SPOTTY_LOG_EVENTS = {
+    "connecting": re.compile(r"Connecting to AP"),
+    "authenticated": re.compile(r"Authenticated as"),
+    "track_loading": re.compile(r"Loading <.*> with Spotify URI"),
+    "audio_key": re.compile(r"audio[ _]key", re.IGNORECASE),
+    "track_loaded": re.compile(r"\(\d+ ms\) loaded"),
+}
+SPOTTY_LOG_WARNING_REGEX = re.compile(r"\b(WARN|ERROR)\b")
+
+
+class SpottyLog:
+    """The log output of all spotty processes, which is on its own pipe so it never
+    gets mixed into the pcm. Each process's pipe is drained by a thread into a
+    bounded ring buffer of recent lines. Known events are timed from the process
+    start, for latency stats, and warnings and errors go to the Kodi log."""
+
+    def __init__(self, max_lines: int = SPOTTY_LOG_MAX_LINES):
+        self.__lines: Deque[Tuple[float, int, str]] = deque(maxlen=max_lines)
+        # Event name -> [count, total secs, last secs].
+        self.__event_stats: Dict[str, List[float]] = {}
+        self.__lock = threading.Lock()
+
+    def start_draining(self, pid: int, log_pipe: BinaryIO, started_at: float) -> None:
+        threading.Thread(target=self.__drain, args=(pid, log_pipe, started_at), daemon=True).start()
+
+    def get_recent_lines(self, num_lines: int) -> List[str]:
+        with self.__lock:
+            lines = list(self.__lines)[-num_lines:]
+        return [f"{pid}: {line}" for _, pid, line in lines]
+
+    def get_event_stats(self) -> Dict[str, Dict[str, float]]:
+        with self.__lock:
+            return {
+                event: {
+                    "count": int(stats[0]),
+                    "avg_secs": round(stats[1] / stats[0], 3),
+                    "last_secs": round(stats[2], 3),
+                }
+                for event, stats in self.__event_stats.items()
+            }
+
+    def __drain(self, pid: int, log_pipe: BinaryIO, started_at: float) -> None:
+        try:
+            with log_pipe:
+                for raw_line in log_pipe:
+                    line = raw_line.decode("utf-8", errors="replace").rstrip()
+                    if line:
+                        self.__add_line(pid, line, time.monotonic() - started_at)
+        except Exception as exc:
+            log_exception(exc, f"Error reading the log of spotty process {pid}")
+
+    def __add_line(self, pid: int, line: str, elapsed_secs: float) -> None:
+        with self.__lock:
+            self.__lines.append((time.time(), pid, line))
+            for event, regex in SPOTTY_LOG_EVENTS.items():
+                if regex.search(line):
+                    stats = self.__event_stats.setdefault(event, [0, 0.0, 0.0])
+                    stats[0] += 1
+                    stats[1] += elapsed_secs
+                    stats[2] = elapsed_secs
+                    break
+
+        if SPOTTY_LOG_WARNING_REGEX.search(line):
+            log_msg(f"Spotty {pid}: {line}", LOGWARNING)
@@ -0,0 +1,145 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from xbmc import LOGDEBUG, LOGWARNING
+
+from utils import log_msg
+
+# How long a cancelled spotty gets to exit on SIGTERM before it's killed.
+SPOTTY_TERMINATE_DEADLINE_SECS = 1.0
+SPOTTY_REAP_INTERVAL_SECS = 0.1
+
+
+class SpottySupervisor:
+    """Spawns every spotty process, each in its own process group, and tracks it
+    until it has exited. 'cancel' asks a process group to stop with SIGTERM and
+    returns at once - a reaper thread escalates to SIGKILL after a deadline, so
+    the next spotty can be spawned while the last one shuts down. A cancelled
+    process that outlives its SIGKILL is logged as leaked."""
+
+    def __init__(self, terminate_deadline_secs: float = SPOTTY_TERMINATE_DEADLINE_SECS):
+        self.__terminate_deadline_secs = terminate_deadline_secs
+
+        self.__children: Dict[int, subprocess.Popen] = {}
+        # pid -> (process, deadline, is_killed)
+        self.__cancelled: Dict[int, Tuple[subprocess.Popen, float, bool]] = {}
+        self.__condition = threading.Condition()
+        self.__reaper = None
+
+        self.__num_spawned = 0
+        self.__num_cancelled = 0
+        self.__num_killed = 0
+        self.__num_leaked = 0
+
+    def popen(self, args: List[str], **popen_kwargs) -> subprocess.Popen:
+        if os.name == "nt":
+            popen_kwargs["creationflags"] = (
+                popen_kwargs.get("creationflags", 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+            )
+        else:
+            popen_kwargs["start_new_session"] = True
+        process = subprocess.Popen(args, **popen_kwargs)
+
+        with self.__condition:
+            self.__prune_children()
+            self.__children[process.pid] = process
+            self.__num_spawned += 1
+        return process
+
+    def cancel(self, process: subprocess.Popen) -> None:
+        """stop a spotty process (group) without waiting for it"""
+        with self.__condition:
+            if process.pid in self.__cancelled or process.poll() is not None:
+                return
+            self.__signal(process, force=False)
+            deadline = time.monotonic() + self.__terminate_deadline_secs
+            self.__cancelled[process.pid] = (process, deadline, False)
+            self.__num_cancelled += 1
+            if not self.__reaper:
+                self.__reaper = threading.Thread(target=self.__reap, daemon=True)
+                self.__reaper.start()
+            self.__condition.notify_all()
+
+    def get_num_live_children(self) -> int:
+        with self.__condition:
+            self.__prune_children()
+            return len(self.__children)
+
+    def close(self) -> int:
+        """cancel all live spotty processes and wait for them - returns the number
+        still alive"""
+        with self.__condition:
+            self.__prune_children()
+            children = list(self.__children.values())
+        for process in children:
+            self.cancel(process)
+
+        deadline = time.monotonic() + 2 * self.__terminate_deadline_secs
+        with self.__condition:
+            while self.__cancelled and time.monotonic() < deadline:
+                self.__condition.wait(SPOTTY_REAP_INTERVAL_SECS)
+            self.__prune_children()
+            num_live = len(self.__children)
+        if num_live:
+            log_msg(f"{num_live} spotty processes still alive at close.", LOGWARNING)
+        return num_live
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.__condition:
+            self.__prune_children()
+            return {
+                "live": len(self.__children),
+                "spawned": self.__num_spawned,
+                "cancelled": self.__num_cancelled,
+                "killed": self.__num_killed,
+                "leaked": self.__num_leaked,
+            }
+
+    def __reap(self) -> None:
+        with self.__condition:
+            while True:
+                now = time.monotonic()
+                for pid, (process, deadline, is_killed) in list(self.__cancelled.items()):
+                    if process.poll() is not None:
+                        del self.__cancelled[pid]
+                        self.__condition.notify_all()
+                    elif now < deadline:
+                        continue
+                    elif not is_killed:
+                        log_msg(f"Spotty {pid} ignored SIGTERM. Killing it.", LOGDEBUG)
+                        self.__signal(process, force=True)
+                        deadline = now + self.__terminate_deadline_secs
+                        self.__cancelled[pid] = (process, deadline, True)
+                        self.__num_killed += 1
+                    else:
+                        log_msg(f"Spotty {pid} is still alive after SIGKILL.", LOGWARNING)
+                        del self.__cancelled[pid]
+                        self.__num_leaked += 1
+                        self.__condition.notify_all()
+
+                self.__condition.wait(SPOTTY_REAP_INTERVAL_SECS if self.__cancelled else None)
+
+    def __prune_children(self) -> None:
+        # Polling also reaps exited processes nobody waited for.
+        for pid, process in list(self.__children.items()):
+            if process.poll() is not None:
+                del self.__children[pid]
+
+    @staticmethod
+    def __signal(process: subprocess.Popen, force: bool) -> None:
+        if process.poll() is not None:
+            return
+        try:
+            if os.name != "nt":
+                # Spotty leads its own group, so this reaches anything it started too.
+                os.killpg(process.pid, signal.SIGKILL if force else signal.SIGTERM)
+            elif force:
+                process.kill()
+            else:
+                process.terminate()
+        except OSError:
+            pass
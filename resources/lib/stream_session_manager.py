@@ -0,0 +1,112 @@
+import itertools
+import threading
+from typing import Dict, List, Union
+
+from xbmc import LOGDEBUG, LOGWARNING
+
+from spotty_audio_streamer import SpottyAudioStreamer
+from spotty_decode_manager import SpottyDecodeManager
+from utils import log_msg
+
+
+class StreamSession:
+    """one stream (one connection), of a track from a stream offset"""
+
+    def __init__(self, session_id: int, stream_begin: int, streamer: SpottyAudioStreamer):
+        self.session_id = session_id
+        self.stream_begin = stream_begin
+        self.streamer = streamer
+
+    def get_track_id(self) -> str:
+        return self.streamer.get_track_id()
+
+    def __str__(self) -> str:
+        return f"#{self.session_id} {self.get_track_id()}@{self.stream_begin}"
+
+
+class StreamSessionManager:
+    """The running track streams, one session per stream. Each stream is cancelled on
+    its own, so several streams can run at once. The limit is on the live spotty
+    decodes the streams need, up to 'max_decodes': streams that share a decode, or
+    read a track from the pcm cache, don't add one. A stream that needs a decode past
+    the limit stops the decodes no stream reads, then ends the oldest streams with a
+    live decode - unless streams can't be terminated, in which case it isn't started."""
+
+    def __init__(
+        self,
+        decode_manager: SpottyDecodeManager,
+        max_decodes: int,
+        can_terminate_streams: bool = True,
+    ):
+        self.__decode_manager = decode_manager
+        self.__max_decodes = max(1, max_decodes)
+        self.__can_terminate_streams = can_terminate_streams
+        self.__sessions: List[StreamSession] = []
+        self.__session_ids = itertools.count(1)
+        self.__lock = threading.Lock()
+
+    def start_session(
+        self, streamer: SpottyAudioStreamer, stream_begin: int
+    ) -> Union[StreamSession, None]:
+        with self.__lock:
+            if not self.__make_room_for_decode(streamer.get_track_id()):
+                return None
+
+            session = StreamSession(next(self.__session_ids), stream_begin, streamer)
+            self.__sessions.append(session)
+            log_msg(f"Started stream session {session}.", LOGDEBUG)
+            return session
+
+    def end_session(self, session: Union[StreamSession, None]) -> None:
+        with self.__lock:
+            if session in self.__sessions:
+                self.__sessions.remove(session)
+                log_msg(f"Ended stream session {session}.", LOGDEBUG)
+
+    def terminate_all(self) -> bool:
+        with self.__lock:
+            sessions = self.__sessions.copy()
+        terminated = False
+        for session in sessions:
+            terminated = session.streamer.terminate_stream() or terminated
+        return terminated
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return {
+                "max_decodes": self.__max_decodes,
+                "decodes": self.__decode_manager.get_num_live_decodes(),
+                "sessions": len(self.__sessions),
+            }
+
+    def __make_room_for_decode(self, track_id: str) -> bool:
+        if self.__decode_manager.is_sharing_track(track_id):
+            return True
+
+        while self.__decode_manager.get_num_live_decodes() >= self.__max_decodes:
+            # Decodes no stream reads anymore go first.
+            if self.__decode_manager.release_unread_decodes():
+                continue
+
+            oldest_session = next(
+                (
+                    session
+                    for session in self.__sessions
+                    if self.__decode_manager.is_decoding_track(session.get_track_id())
+                ),
+                None,
+            )
+            if not oldest_session or not self.__can_terminate_streams:
+                log_msg(
+                    f"Cannot start a stream of '{track_id}': already running"
+                    f" {self.__decode_manager.get_num_live_decodes()} of max"
+                    f" {self.__max_decodes} spotty decodes.",
+                    LOGWARNING,
+                )
+                return False
+
+            log_msg(f"Too many spotty decodes. Terminating stream {oldest_session}.")
+            oldest_session.streamer.terminate_stream()
+            self.__sessions.remove(oldest_session)
+
+        return True
@@ -0,0 +1,77 @@
+import re
+import threading
+from typing import Callable, Tuple, Union
+
+import xbmc
+from xbmc import LOGDEBUG
+
+from utils import PROXY_PORT, log_msg, log_exception
+
+PREFETCH_POLL_INTERVAL_IN_SECS = 2
+# e.g., "http://localhost:52308/track/2eHtBGvfD7PD7SiTl52Vxr/178.795"
+TRACK_URL_REGEX = re.compile(rf"^http://localhost:{PROXY_PORT}/track/([^/?]+)/([0-9.]+)")
+
+
+class TrackPrefetcher:
+    """Watches Kodi's music playlist and, during the last seconds of the current
+    track, gets the next proxy track decoding in the background."""
+
+    def __init__(self, prefetch_track: Callable[[str, float], bool], secs_before_end: int):
+        self.__prefetch_track = prefetch_track
+        self.__secs_before_end = secs_before_end
+
+        self.__last_prefetched_track_id = ""
+        self.__stopped = False
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def start(self) -> None:
+        log_msg(f"Starting track prefetcher, secs before end = {self.__secs_before_end}.")
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__stopped = True
+        if self.__thread.is_alive():
+            self.__thread.join()
+
+    def __run(self) -> None:
+        monitor = xbmc.Monitor()
+        while not self.__stopped and not monitor.waitForAbort(PREFETCH_POLL_INTERVAL_IN_SECS):
+            try:
+                self.__check_next_track()
+            except Exception as exc:
+                log_exception(exc, "Track prefetch error")
+
+    def __check_next_track(self) -> None:
+        player = xbmc.Player()
+        if not player.isPlaying():
+            return
+        if player.getTotalTime() - player.getTime() > self.__secs_before_end:
+            return
+
+        next_track = self.get_next_track()
+        if not next_track:
+            return
+
+        track_id, track_duration = next_track
+        if track_id == self.__last_prefetched_track_id:
+            return
+        self.__last_prefetched_track_id = track_id
+
+        if self.__prefetch_track(track_id, track_duration):
+            log_msg(f"Started prefetch of next track '{track_id}'.", LOGDEBUG)
+
+    @staticmethod
+    def get_next_track() -> Union[Tuple[str, float], None]:
+        playlist = xbmc.PlayList(xbmc.PLAYLIST_MUSIC)
+        position = playlist.getposition()
+        if position < 0 or position + 1 >= playlist.size():
+            return None
+
+        return parse_track_url(playlist[position + 1].getPath())
+
+
+def parse_track_url(url: str) -> Union[Tuple[str, float], None]:
+    match = TRACK_URL_REGEX.match(url)
+    if not match:
+        return None
+    return match.group(1), float(match.group(2))
@@ -1,7 +1,5 @@
 import inspect
 import os
-import platform
-import signal
 import sys
 import time
 import unicodedata
@@ -14,6 +12,12 @@ import xbmcgui
 import xbmcvfs
 from xbmc import LOGDEBUG, LOGINFO, LOGERROR
 
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows.
+    fcntl = None
+
 DEBUG = True
 PROXY_PORT = 52308
 
@@ -21,8 +25,13 @@ ADDON_ID = "plugin.audio.spotify"
 ADDON_DATA_PATH = xbmcvfs.translatePath(f"special://profile/addon_data/{ADDON_ID}")
 ADDON_WINDOW_ID = 10000
 
+# Set when the plugin's authentication fails.
+abort_main_service = False
+
 KODI_PROPERTY_SPOTIFY_AUTH_TOKEN = "spotify-auth-token"
 KODI_PROPERTY_AUTH_TOKEN_EXPIRES_AT = "spotify-auth-token-expires-at"
+# Set by the service when it found a flac encoder, which shows the 'stream_flac' setting.
+KODI_PROPERTY_FLAC_ENCODER = "spotify-flac-encoder"
 
 
 def log_msg(msg: str, loglevel: int = LOGDEBUG, caller_name: str = "") -> None:
@@ -60,12 +69,13 @@ def kill_this_plugin() -> None:
     sys.exit(1)
 
 
-def kill_process_by_pid(pid: int) -> None:
+def set_pipe_size(pipe_fd: int, size: int) -> None:
+    if not fcntl or not hasattr(fcntl, "F_SETPIPE_SZ"):
+        return
     try:
-        if platform.system() != "Windows":
-            os.kill(pid, signal.SIGKILL)
-    except OSError:
-        pass
+        fcntl.fcntl(pipe_fd, fcntl.F_SETPIPE_SZ, size)
+    except OSError as ex:
+        log_msg(f"Could not set pipe size to {size}: {ex}")
 
 
 def bytes_to_megabytes(byts: int) -> float:
@@ -125,6 +135,15 @@ def get_cached_auth_token_expires_at() -> str:
     return get_cached_value_from_kodi(KODI_PROPERTY_AUTH_TOKEN_EXPIRES_AT)
 
 
+def cache_flac_encoder_available(available: bool) -> None:
+    cache_value_in_kodi(KODI_PROPERTY_FLAC_ENCODER, "true" if available else "")
+
+
+def is_flac_encoder_available() -> bool:
+    # Not 'get_cached_value_from_kodi', which waits for a value that may never be set.
+    return bool(xbmcgui.Window(ADDON_WINDOW_ID).getProperty(KODI_PROPERTY_FLAC_ENCODER))
+
+
 def cache_value_in_kodi(kodi_property_id: str, value: Any):
     win = xbmcgui.Window(ADDON_WINDOW_ID)
     win.setProperty(kodi_property_id, value)
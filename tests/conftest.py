@@ -0,0 +1,10 @@
+"""The tests import the addon modules as Kodi does, from 'resources/lib', with the
+vendored dependencies on the path. The 'xbmc' modules come from Kodistubs
+('pip install Kodistubs')."""
+
+import os
+import sys
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources", "lib")
+sys.path.insert(0, os.path.join(LIB_DIR, "deps"))
+sys.path.insert(0, LIB_DIR)
@@ -0,0 +1,55 @@
+from http_connections import MAX_KEEP_ALIVE_REQUESTS, ConnectionStats
+from http_connections import is_response_reusable, wants_keep_alive
+
+
+def test_requests_are_counted_per_connection():
+    stats = ConnectionStats()
+    reused = stats.connection_opened()
+    single = stats.connection_opened()
+    assert stats.get_stats()["open"] == 2
+
+    for _ in range(3):
+        reused.add()
+    single.add()
+    stats.connection_closed(reused)
+    stats.connection_closed(single)
+
+    assert stats.get_stats() == {
+        "open": 0,
+        "closed": 2,
+        "reused": 1,
+        "requests": 4,
+        "max_requests": 3,
+        "avg_requests": 2.0,
+    }
+
+
+def test_connection_without_a_request_isnt_reused():
+    stats = ConnectionStats()
+    stats.connection_closed(stats.connection_opened())
+    assert stats.get_stats()["reused"] == 0
+    assert stats.get_stats()["requests"] == 0
+
+
+def test_connection_takes_at_most_max_requests():
+    requests = ConnectionStats().connection_opened()
+    for _ in range(MAX_KEEP_ALIVE_REQUESTS - 1):
+        requests.add()
+    assert requests.can_add()
+    requests.add()
+    assert not requests.can_add()
+
+
+def test_wants_keep_alive():
+    assert wants_keep_alive("HTTP/1.1", "")
+    assert wants_keep_alive("HTTP/1.1", "Keep-Alive")
+    assert not wants_keep_alive("HTTP/1.1", "close")
+    assert not wants_keep_alive("HTTP/1.0", "")
+    assert wants_keep_alive("HTTP/1.0", "keep-alive")
+
+
+def test_is_response_reusable():
+    assert is_response_reusable("GET", "200 OK", "1234")
+    assert not is_response_reusable("GET", "200 OK", "")
+    assert is_response_reusable("HEAD", "200 OK", "")
+    assert is_response_reusable("GET", "304 Not Modified", "")
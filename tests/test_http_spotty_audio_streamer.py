@@ -0,0 +1,29 @@
+from http_spotty_audio_streamer import HTTPSpottyAudioStreamer
+
+get_stream_range = HTTPSpottyAudioStreamer.get_stream_range
+
+FILE_SIZE = 1000
+
+
+def test_first_last_range():
+    assert get_stream_range("bytes=0-99", FILE_SIZE) == (0, 100)
+    assert get_stream_range("bytes=100-", FILE_SIZE) == (100, FILE_SIZE)
+    # 'last' past the end is cut to the end.
+    assert get_stream_range("bytes=900-2000", FILE_SIZE) == (900, FILE_SIZE)
+    # Only the first of several ranges is served.
+    assert get_stream_range("bytes=10-19, 50-59", FILE_SIZE) == (10, 20)
+
+
+def test_suffix_range():
+    assert get_stream_range("bytes=-100", FILE_SIZE) == (900, FILE_SIZE)
+    # A suffix longer than the file is the whole file.
+    assert get_stream_range("bytes=-5000", FILE_SIZE) == (0, FILE_SIZE)
+
+
+def test_unsatisfiable_range():
+    # The route answers these with a 416.
+    assert get_stream_range(f"bytes={FILE_SIZE}-", FILE_SIZE) is None
+    assert get_stream_range("bytes=500-400", FILE_SIZE) is None
+    assert get_stream_range("bytes=-0", FILE_SIZE) is None
+    assert get_stream_range("bytes=-", FILE_SIZE) is None
+    assert get_stream_range("bytes=abc-", FILE_SIZE) is None
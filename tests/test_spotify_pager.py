@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+import spotipy
+from spotify_pager import MAX_RATE_LIMIT_RETRIES, SpotifyPager
+
+PAGE_SIZE = 10
+TOTAL = 95
+
+
+def get_page(offset):
+    # Later pages come back first.
+    time.sleep((TOTAL - offset) / 5000)
+    return list(range(offset, min(offset + PAGE_SIZE, TOTAL)))
+
+
+def rate_limited(retry_after="0.01"):
+    return spotipy.SpotifyException(429, -1, "rate limited", headers={"Retry-After": retry_after})
+
+
+@pytest.fixture
+def pager():
+    pager = SpotifyPager(max_fetchers=4)
+    yield pager
+    pager.close()
+
+
+def test_items_are_in_offset_order(pager):
+    first_items = get_page(0)
+    assert pager.get_items(get_page, TOTAL, PAGE_SIZE, first_items) == list(range(TOTAL))
+    # The first page isn't fetched again.
+    assert pager.get_stats()["pages"] == 9
+
+
+def test_no_more_pages(pager):
+    assert pager.get_items(get_page, 5, PAGE_SIZE, [0, 1, 2, 3, 4]) == [0, 1, 2, 3, 4]
+    assert pager.get_stats()["pages"] == 0
+
+
+def test_rate_limited_page_is_tried_again(pager):
+    lock = threading.Lock()
+    failed_offsets = set()
+
+    def get_page_once_rate_limited(offset):
+        with lock:
+            if offset not in failed_offsets:
+                failed_offsets.add(offset)
+                raise rate_limited()
+        return get_page(offset)
+
+    assert pager.get_items(get_page_once_rate_limited, TOTAL, PAGE_SIZE) == list(range(TOTAL))
+    stats = pager.get_stats()
+    assert stats["pages"] == 10
+    assert stats["rate_limited"] == 10
+
+
+def test_rate_limited_page_gives_up(pager):
+    num_tries = 0
+
+    def get_page_always_rate_limited(offset):
+        nonlocal num_tries
+        num_tries += 1
+        raise rate_limited()
+
+    with pytest.raises(spotipy.SpotifyException):
+        pager.get_items(get_page_always_rate_limited, PAGE_SIZE, PAGE_SIZE)
+    assert num_tries == MAX_RATE_LIMIT_RETRIES + 1
+
+
+def test_other_errors_are_not_retried(pager):
+    num_tries = 0
+
+    def get_missing_page(offset):
+        nonlocal num_tries
+        num_tries += 1
+        raise spotipy.SpotifyException(404, -1, "not found")
+
+    with pytest.raises(spotipy.SpotifyException):
+        pager.get_items(get_missing_page, PAGE_SIZE, PAGE_SIZE)
+    assert num_tries == 1
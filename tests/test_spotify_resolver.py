@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+from entity_store import EntityStore
+from spotify_pager import SpotifyPager
+from spotify_resolver import TRACKS_BATCH_SIZE, SpotifyResolver
+
+
+class FakeSpotipy:
+    """answers 'tracks' requests, blocking them until 'release' is set"""
+
+    def __init__(self):
+        self.requested_batches = []
+        self.release = threading.Event()
+        self.release.set()
+        self.__lock = threading.Lock()
+
+    def tracks(self, track_ids, market=None):
+        with self.__lock:
+            self.requested_batches.append(list(track_ids))
+        self.release.wait()
+        return {
+            "tracks": [
+                {"id": track_id, "name": f"Track {track_id}"} if track_id != "unknown" else None
+                for track_id in track_ids
+            ]
+        }
+
+    def get_requested_ids(self):
+        return [track_id for batch in self.requested_batches for track_id in batch]
+
+
+@pytest.fixture
+def pager():
+    pager = SpotifyPager()
+    yield pager
+    pager.close()
+
+
+@pytest.fixture
+def resolver(pager, tmp_path):
+    return SpotifyResolver(pager, EntityStore(str(tmp_path / "entities.db")))
+
+
+def test_ids_are_deduplicated_and_batched(resolver):
+    spotipy = FakeSpotipy()
+    track_ids = [f"t{i}" for i in range(TRACKS_BATCH_SIZE + 10)]
+
+    tracks = resolver.get_tracks(spotipy, track_ids + track_ids[:5], "NL")
+
+    assert [track["id"] for track in tracks] == track_ids + track_ids[:5]
+    assert sorted(spotipy.get_requested_ids()) == sorted(track_ids)
+    assert [len(batch) for batch in spotipy.requested_batches] == [TRACKS_BATCH_SIZE, 10]
+
+
+def test_resolved_ids_are_cached(resolver):
+    spotipy = FakeSpotipy()
+    resolver.get_tracks(spotipy, ["t1", "t2"], "NL")
+
+    tracks = resolver.get_tracks(spotipy, ["t2", "t3"], "NL")
+
+    assert [track["id"] for track in tracks] == ["t2", "t3"]
+    assert spotipy.requested_batches == [["t1", "t2"], ["t3"]]
+    assert resolver.get_stats()["cache_hits"] == 1
+
+
+def test_unknown_ids_are_left_out(resolver):
+    tracks = resolver.get_tracks(FakeSpotipy(), ["t1", "unknown", "t2"], "NL")
+    assert [track["id"] for track in tracks] == ["t1", "t2"]
+
+
+def test_returned_entities_are_copies(resolver):
+    spotipy = FakeSpotipy()
+    resolver.get_tracks(spotipy, ["t1"], "NL")[0]["name"] = "changed"
+    assert resolver.get_tracks(spotipy, ["t1"], "NL")[0]["name"] == "Track t1"
+
+
+def test_ids_being_fetched_are_waited_for(resolver):
+    spotipy = FakeSpotipy()
+    spotipy.release.clear()
+    results = {}
+
+    def get_tracks(name, track_ids):
+        results[name] = resolver.get_tracks(spotipy, track_ids, "NL")
+
+    first = threading.Thread(target=get_tracks, args=("first", ["t1", "t2"]))
+    first.start()
+    while not spotipy.requested_batches:
+        first.join(0.01)
+    second = threading.Thread(target=get_tracks, args=("second", ["t2", "t3"]))
+    second.start()
+    while len(spotipy.requested_batches) < 2:
+        second.join(0.01)
+    spotipy.release.set()
+    first.join()
+    second.join()
+
+    assert [track["id"] for track in results["first"]] == ["t1", "t2"]
+    assert [track["id"] for track in results["second"]] == ["t2", "t3"]
+    # 't2' was only fetched once, for the first listing.
+    assert spotipy.requested_batches == [["t1", "t2"], ["t3"]]
+    assert resolver.get_stats()["coalesced"] == 1
+
+
+def test_stored_entities_outlive_the_resolver(pager, tmp_path):
+    spotipy = FakeSpotipy()
+    store_path = str(tmp_path / "stored.db")
+    SpotifyResolver(pager, EntityStore(store_path)).get_tracks(spotipy, ["t1"], "NL")
+
+    resolver = SpotifyResolver(pager, EntityStore(store_path))
+    tracks = resolver.get_tracks(spotipy, ["t1", "t2"], "NL")
+
+    assert [track["id"] for track in tracks] == ["t1", "t2"]
+    assert spotipy.requested_batches == [["t1"], ["t2"]]
+    assert resolver.get_stats()["store_hits"] == 1
@@ -0,0 +1,15 @@
+from spotty_audio_streamer import BYTE_RATE, SpottyAudioStreamer
+
+
+def test_start_position_is_whole_seconds_and_skips_the_rest():
+    assert SpottyAudioStreamer.get_start_position(0) == (0, 0)
+    assert SpottyAudioStreamer.get_start_position(BYTE_RATE - 4) == (0, BYTE_RATE - 4)
+    assert SpottyAudioStreamer.get_start_position(3 * BYTE_RATE) == (3, 0)
+    assert SpottyAudioStreamer.get_start_position(3 * BYTE_RATE + 1000) == (3, 1000)
+
+
+def test_start_position_of_an_unaligned_offset():
+    # Spotty starts at the second before the offset's sample frame.
+    assert SpottyAudioStreamer.get_start_position(2 * BYTE_RATE + 3) == (2, 3)
+    assert SpottyAudioStreamer.get_start_position(BYTE_RATE + 2) == (1, 2)
+    assert SpottyAudioStreamer.get_start_position(BYTE_RATE - 1) == (0, BYTE_RATE - 1)